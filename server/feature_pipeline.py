@@ -0,0 +1,116 @@
+"""
+학습된 특성 파이프라인 저장소 (v3/v4/v5)
+
+스케일러/벡터라이저를 매 실행마다 다시 fit하지 않도록, fit된 transformer와
+변환된 후보 행렬을 입력 데이터의 내용 해시 + transformer 종류/파라미터를 키로 함께 저장한다.
+- 저장 위치: PIPELINE_DIR/<name>/ (이름마다 최신 키 1개만 유지)
+- 행렬: 조밀하면 float32 .npy (mmap으로 열림), 희소하면 CSR .npz
+- transformer: pickle (같은 환경에서 만든 로컬 캐시 전용)
+입력 내용과 transformer 설정이 같으면 fit/transform 없이 로드하고, 새 사용자 프로필만 transform()으로 변환한다.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+
+import numpy as np
+import scipy.sparse as sp
+
+from ml.columnar import begin_dir, commit_dir, current_dir
+
+PIPELINE_VERSION = 2  # 2: 키에 transformer 종류/파라미터 포함
+PIPELINE_DIR = os.environ.get(
+    'FEATURE_PIPELINE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml', 'cache', 'pipelines')
+)
+
+
+def content_key(data):
+    """배열(dtype/shape 포함) 또는 문자열 목록의 내용 해시 (hex)"""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(data, np.ndarray):
+        h.update(f"{data.dtype.str}{data.shape}".encode())
+        h.update(np.ascontiguousarray(data).data)
+    else:
+        for text in data:
+            h.update(text.encode('utf-8'))
+            h.update(b'\0')
+    return h.hexdigest()
+
+
+def transformer_signature(transformer):
+    """transformer 종류 + 하이퍼파라미터 (바꾸면 같은 입력이라도 다시 fit)"""
+    return f"{type(transformer).__name__}{repr(sorted(transformer.get_params().items()))}"
+
+
+class FittedPipeline:
+    """fit된 transformer + 학습 입력을 변환한 행렬"""
+
+    def __init__(self, transformer, matrix, meta):
+        self.transformer = transformer
+        self.matrix = matrix
+        self.meta = meta
+
+    def transform(self, X):
+        """새 입력(사용자 프로필 등)만 변환 (조밀한 결과는 저장 행렬과 같은 float32)"""
+        out = self.transformer.transform(X)
+        return out if sp.issparse(out) else np.asarray(out, dtype=np.float32)
+
+    def save(self, path):
+        tmp_path = begin_dir(path)
+        if sp.issparse(self.matrix):
+            sp.save_npz(os.path.join(tmp_path, 'matrix.npz'), self.matrix.tocsr())
+        else:
+            np.save(os.path.join(tmp_path, 'matrix.npy'), self.matrix)
+        with open(os.path.join(tmp_path, 'transformer.pkl'), 'wb') as f:
+            pickle.dump(self.transformer, f)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        commit_dir(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, key):
+        """저장된 키/버전이 일치할 때만 로드 (불일치/없음 → None)"""
+        path = current_dir(path)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != PIPELINE_VERSION or meta.get('key') != key:
+            return None
+        if meta.get('sparse'):
+            matrix = sp.load_npz(os.path.join(path, 'matrix.npz'))
+        else:
+            matrix = np.load(os.path.join(path, 'matrix.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'transformer.pkl'), 'rb') as f:
+            transformer = pickle.load(f)
+        return cls(transformer, matrix, meta)
+
+
+def load_or_fit(name, inputs, make_transformer, pipeline_dir=None):
+    """inputs 내용과 transformer 설정이 저장본과 같으면 로드, 아니면 make_transformer()를 fit해 변환 행렬과 함께 저장
+
+    키 = 입력 내용 해시 + 새로 만든 transformer의 종류/파라미터
+    (make_transformer의 파라미터만 바꿔도 이전 설정으로 fit된 캐시를 쓰지 않음)
+    반환: (FittedPipeline, 캐시 사용 여부)
+    """
+    transformer = make_transformer()
+    key = content_key([content_key(inputs), transformer_signature(transformer)])
+    path = os.path.join(pipeline_dir or PIPELINE_DIR, name)
+    pipeline = FittedPipeline.load(path, key)
+    if pipeline is not None:
+        return pipeline, True
+
+    matrix = transformer.fit_transform(inputs)
+    sparse = sp.issparse(matrix)
+    if not sparse:
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    pipeline = FittedPipeline(transformer, matrix, {
+        'version': PIPELINE_VERSION, 'key': key, 'name': name,
+        'transformer': type(transformer).__name__, 'shape': list(matrix.shape), 'sparse': sparse,
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pipeline.save(path)
+    return pipeline, False
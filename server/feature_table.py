@@ -0,0 +1,130 @@
+"""
+트랙 CSV → float32 특성 행렬 + 메타데이터 컬럼 저장소 (memory-mapped 캐시)
+
+CSV를 한 번만 파싱해 `<csv>.cache/` 디렉터리에 저장하고,
+이후 실행에서는 파일 mtime/크기가 같으면 파싱 없이 np.load(mmap_mode='r')로 연다.
+
+컬럼명 차이(예: 'Tempo (BPM)' vs 'tempo')는 헤더에서 한 번만 해석하고,
+행마다 후보 컬럼 중 비어있지 않은 첫 값을 사용한다 (기존 `or` 체인과 동일한 의미).
+"""
+
+import os
+import csv
+import json
+
+import numpy as np
+
+from ml.columnar import StringColumn, begin_dir, commit_dir, current_dir
+
+CACHE_VERSION = 1
+
+FEATURE_COLUMNS = [
+    ('tempo', ('Tempo (BPM)', 'tempo')),
+    ('energy', ('Energy', 'energy')),
+    ('valence', ('Valence', 'valence')),
+    ('danceability', ('Danceability', 'danceability')),
+    ('acousticness', ('Acousticness', 'acousticness')),
+    ('instrumentalness', ('Instrumentalness', 'instrumentalness')),
+    ('popularity', ('Popularity', 'popularity')),
+]
+FEATURE_NAMES = [name for name, _ in FEATURE_COLUMNS]
+
+META_COLUMNS = {
+    'track_id': ('track_id', 'id', 'Spotify ID', 'Track ID'),
+    'title': ('track_name', 'name', 'Title'),
+    'artist': ('artists', 'artist', 'Artist'),
+    'genre': ('track_genre', 'genre', 'Genre'),
+}
+
+
+class FeatureTable:
+    """features: (N, 7) float32, meta: {컬럼명: StringColumn}"""
+
+    def __init__(self, features, meta):
+        self.features = features
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.features)
+
+    def record(self, idx):
+        return {name: column[idx] for name, column in self.meta.items()}
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _resolve(header, candidates):
+    return [header.index(c) for c in candidates if c in header]
+
+
+def _first(row, indices):
+    for i in indices:
+        if i < len(row) and row[i]:
+            return row[i]
+    return ''
+
+
+def parse_csv(filepath, id_columns=None):
+    """CSV를 FeatureTable로 파싱 (캐시 없이)"""
+    meta_columns = dict(META_COLUMNS)
+    if id_columns:
+        meta_columns['track_id'] = tuple(id_columns)
+
+    with open(filepath, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        feature_idx = [_resolve(header, c) for _, c in FEATURE_COLUMNS]
+        meta_idx = {name: _resolve(header, c) for name, c in meta_columns.items()}
+
+        rows = []
+        meta = {name: [] for name in meta_columns}
+        for row in reader:
+            rows.append([_parse_float(_first(row, idx)) for idx in feature_idx])
+            for name, idx in meta_idx.items():
+                meta[name].append(_first(row, idx))
+
+    features = np.array(rows, dtype=np.float32).reshape(-1, len(FEATURE_COLUMNS))
+    return FeatureTable(features, {name: StringColumn.from_list(v) for name, v in meta.items()})
+
+
+def _source_key(filepath, id_columns):
+    stat = os.stat(filepath)
+    return {
+        'version': CACHE_VERSION,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'id_columns': list(id_columns) if id_columns else None,
+    }
+
+
+def load_feature_table(filepath, id_columns=None, cache_dir=None):
+    """캐시가 유효하면 mmap으로 열고, 아니면 파싱 후 캐시를 기록"""
+    cache_dir = cache_dir or filepath + '.cache'
+    key = _source_key(filepath, id_columns)
+    current = current_dir(cache_dir)
+    key_path = os.path.join(current, 'source.json')
+
+    if os.path.exists(key_path):
+        with open(key_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == key:
+                features = np.load(os.path.join(current, 'features.npy'), mmap_mode='r')
+                meta = {name: StringColumn.load(current, name, mmap_mode='r')
+                        for name in META_COLUMNS}
+                return FeatureTable(features, meta)
+
+    table = parse_csv(filepath, id_columns)
+
+    tmp_path = begin_dir(cache_dir)
+    np.save(os.path.join(tmp_path, 'features.npy'), table.features)
+    for name, column in table.meta.items():
+        column.save(tmp_path, name)
+    with open(os.path.join(tmp_path, 'source.json'), 'w', encoding='utf-8') as f:
+        json.dump(key, f)
+    commit_dir(tmp_path, cache_dir)
+
+    return table
@@ -0,0 +1,250 @@
+"""
+L2 정규화 임베딩용 근사 최근접 이웃 인덱스 (IVF, NumPy 전용)
+
+- build: spherical k-means로 nlist개 centroid를 학습하고, 벡터를 가장 가까운 centroid 리스트에 배정
+- 저장 레이아웃: 리스트 순으로 정렬된 vectors/ids + 리스트별 offsets (CSR) → 리스트 하나 = 연속 구간
+- add: 새 벡터는 pending에 쌓고 검색 시 함께 탐색, 일정 크기를 넘으면 compact로 병합
+- search: 쿼리와 가까운 nprobe개 리스트만 내적 → top-k (nprobe = nlist면 완전 탐색과 동일)
+
+recall/지연시간 조절: nlist(빌드 시, 리스트 수), nprobe(검색 시, 탐색할 리스트 수)
+점수는 내적 = 코사인 유사도 (벡터가 L2 정규화되어 있다는 전제)
+ids는 int64 track_id로 저장 (카탈로그 row는 스냅샷마다 달라지므로 검색 측에서 rows_of로 변환)
+
+실행: cd server/ml && python ann.py --user 3   (nprobe별 recall/지연시간 리포트)
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from columnar import begin_dir, commit_dir, current_dir
+from ranking import top_indices
+
+INDEX_VERSION = 2  # 2: ids = track_id (1: 카탈로그 row)
+DEFAULT_NPROBE = 16
+KMEANS_ITERS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # k-means 학습 샘플 수 = nlist * 이 값 (최대)
+ASSIGN_CHUNK = 65536
+COMPACT_RATIO = 0.1  # pending이 인덱스 크기의 이 비율을 넘으면 병합
+
+
+def default_nlist(num_vectors):
+    return max(1, min(num_vectors, int(4 * np.sqrt(num_vectors))))
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def mean_direction(vectors):
+    """벡터 평균을 L2 정규화한 쿼리 벡터 (코사인 검색용)"""
+    mean = np.asarray(vectors, dtype=np.float32).mean(axis=0)
+    return mean / max(float(np.linalg.norm(mean)), 1e-12)
+
+
+def _assign(vectors, centroids):
+    """각 벡터의 최근접(최대 내적) centroid 번호"""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        out[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return out
+
+
+def spherical_kmeans(vectors, nlist, iters=KMEANS_ITERS, seed=0):
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(sample, centroids)
+        # 리스트별 합: 배정 순으로 정렬 후 구간 합 (np.add.at보다 빠름)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        # 빈 리스트는 임의의 샘플로 재초기화
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids, vectors, ids, offsets):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self._pending = []  # (vectors, ids, lists)
+        self._pending_cache = None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self.ids) + sum(len(p[1]) for p in self._pending)
+
+    @classmethod
+    def build(cls, vectors, ids, nlist=None, iters=KMEANS_ITERS, seed=0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(vectors):
+            raise ValueError("cannot build an index from 0 vectors")
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+
+        centroids = spherical_kmeans(vectors, nlist, iters, seed)
+        index = cls(centroids, np.zeros((0, vectors.shape[1]), dtype=np.float32),
+                    np.zeros(0, dtype=np.int64), np.zeros(nlist + 1, dtype=np.int64))
+        index.add(vectors, ids)
+        index.compact()
+        return index
+
+    def add(self, vectors, ids):
+        """벡터 추가 (centroid는 고정, 리스트 배정만 수행)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64)
+        self._pending.append((vectors, ids, _assign(vectors, self.centroids)))
+        self._pending_cache = None
+        if len(self) - len(self.ids) > COMPACT_RATIO * len(self.ids):
+            self.compact()
+
+    def compact(self):
+        """pending을 본 배열에 병합해 리스트 순 CSR 레이아웃으로 재정렬"""
+        if not self._pending:
+            return
+        lists = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        vectors = np.concatenate([self.vectors] + [p[0] for p in self._pending])
+        ids = np.concatenate([self.ids] + [p[1] for p in self._pending])
+        lists = np.concatenate([lists] + [p[2] for p in self._pending])
+
+        order = np.argsort(lists, kind='stable')
+        self.vectors = vectors[order]
+        self.ids = ids[order]
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.nlist), out=self.offsets[1:])
+        self._pending = []
+        self._pending_cache = None
+
+    def _pending_arrays(self):
+        if self._pending_cache is None:
+            self._pending_cache = tuple(np.concatenate([p[i] for p in self._pending]) for i in range(3))
+        return self._pending_cache
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE):
+        """query (D,) → (scores, ids) 내림차순, 최대 k개"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        nprobe = max(1, min(nprobe, self.nlist))
+
+        centroid_scores = self.centroids @ query
+        probe = top_indices(centroid_scores, nprobe)
+
+        starts, ends = self.offsets[probe], self.offsets[probe + 1]
+        vectors = [self.vectors[s:e] for s, e in zip(starts, ends) if e > s]
+        ids = [self.ids[s:e] for s, e in zip(starts, ends) if e > s]
+
+        if self._pending:
+            p_vectors, p_ids, p_lists = self._pending_arrays()
+            hit = np.isin(p_lists, probe)
+            vectors.append(p_vectors[hit])
+            ids.append(p_ids[hit])
+
+        if not ids:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        vectors = np.concatenate(vectors)
+        ids = np.concatenate(ids)
+
+        scores = vectors @ query
+        top = top_indices(scores, k)
+        return scores[top], ids[top]
+
+    def score_all(self, query):
+        """완전 탐색: 모든 벡터의 점수 (scores, ids), 순서는 저장 순"""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        scores = np.asarray(self.vectors) @ query
+        ids = np.asarray(self.ids)
+        if self._pending:
+            p_vectors, p_ids, _ = self._pending_arrays()
+            scores = np.concatenate([scores, p_vectors @ query])
+            ids = np.concatenate([ids, p_ids])
+        return scores, ids
+
+    def save(self, path):
+        self.compact()
+        tmp_path = begin_dir(path)
+        for name in ('centroids', 'vectors', 'ids', 'offsets'):
+            np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'dim': self.dim, 'nlist': self.nlist,
+                       'size': len(self.ids)}, f)
+        commit_dir(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        path = current_dir(path)
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            if json.load(f).get('version') != INDEX_VERSION:
+                raise ValueError(f"{path}: unsupported index version")
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in ('centroids', 'vectors', 'ids', 'offsets')]
+        return cls(*arrays)
+
+
+def evaluate(index, vectors, ids, queries, k=30, nprobes=(1, 2, 4, 8, 16, 32)):
+    """nprobe별 recall@k (완전 탐색 대비)와 쿼리당 평균 지연시간(ms)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    ids = np.asarray(ids)
+    exact = []
+    for q in queries:
+        exact.append(set(ids[top_indices(vectors @ q, k)].tolist()))
+
+    report = []
+    for nprobe in sorted({min(n, index.nlist) for n in nprobes}):
+        started = time.perf_counter()
+        found = [index.search(q, k, nprobe)[1] for q in queries]
+        elapsed = time.perf_counter() - started
+        recall = np.mean([len(e & set(f.tolist())) / len(e) for e, f in zip(exact, found)])
+        report.append({
+            'nprobe': nprobe,
+            'recall': round(float(recall), 4),
+            'latency_ms': round(elapsed / len(queries) * 1000, 3),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Track2Vec ANN 인덱스 recall/지연시간 리포트')
+    parser.add_argument('--user', type=int, required=True)
+    parser.add_argument('--k', type=int, default=30)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    model_dir = os.environ.get('ML_MODEL_DIR', 'models')
+    index = IVFIndex.load(os.path.join(model_dir, f'track2vec_index_{args.user}'))
+    index_vectors, index_ids = np.asarray(index.vectors), np.asarray(index.ids)
+
+    # 쿼리: 인덱스 벡터 일부에 잡음을 섞은 정규화 벡터
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(index_vectors), min(args.queries, len(index_vectors)), replace=False)
+    queries = _normalize(index_vectors[picks] + rng.normal(0, 0.1, (len(picks), index.dim))).astype(np.float32)
+
+    print(f"[ANN] user {args.user}: {len(index):,} vectors, nlist {index.nlist}, k {args.k}")
+    for row in evaluate(index, index_vectors, index_ids, queries, args.k):
+        print(f"   nprobe {row['nprobe']:4d}: recall {row['recall']:.3f}, {row['latency_ms']:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+텐서 상주 Dataset용 배치 샘플러
+
+Dataset이 전체 데이터를 연속된 텐서로 들고 있으면, 샘플 단위 __getitem__ + collate 대신
+배치 인덱스 텐서 하나로 gather하는 편이 훨씬 빠르다.
+
+- BatchIndexSampler: 에폭마다 순열을 만들어 batch_size 크기의 인덱스 텐서를 yield
+- batch_loader: 자동 배치를 끈 DataLoader (dataset[index_tensor]가 곧 한 배치)
+- batched_scores: 추론 시 후보 전체를 고정 크기 청크로 나눠 한 번에 점수 계산
+- batched_outputs: 같은 방식으로 배치별 출력 벡터(임베딩 등)를 이어붙여 반환
+"""
+
+import torch
+from torch.utils.data import DataLoader, Sampler
+
+
+class BatchIndexSampler(Sampler):
+    def __init__(self, dataset, batch_size, shuffle=True, drop_last=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def __iter__(self):
+        n = len(self.dataset)
+        order = torch.randperm(n) if self.shuffle else torch.arange(n)
+        end = n - n % self.batch_size if self.drop_last else n
+        for start in range(0, end, self.batch_size):
+            yield order[start:start + self.batch_size]
+
+    def __len__(self):
+        n = len(self.dataset)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+
+def batch_loader(dataset, batch_size, shuffle=True, drop_last=False):
+    """dataset.__getitem__은 인덱스 텐서를 받아 배치 텐서를 반환해야 함"""
+    sampler = BatchIndexSampler(dataset, batch_size, shuffle, drop_last)
+    return DataLoader(dataset, sampler=sampler, batch_size=None)
+
+
+def batched_scores(score_fn, *inputs, batch_size=4096, device=None):
+    """입력 텐서들을 batch_size 단위로 score_fn에 통과시켜 1차원 점수 텐서(CPU)로 반환"""
+    num_items = len(inputs[0])
+    scores = torch.empty(num_items)
+    with torch.no_grad():
+        for start in range(0, num_items, batch_size):
+            chunk = [t[start:start + batch_size].to(device) for t in inputs]
+            scores[start:start + len(chunk[0])] = score_fn(*chunk).reshape(-1).float().cpu()
+    return scores
+
+
+def batched_outputs(model_fn, *inputs, batch_size=4096, device=None):
+    """입력 텐서들을 batch_size 단위로 model_fn에 통과시켜 출력 (N, ...)을 이어붙인 CPU 텐서로 반환"""
+    outputs = []
+    with torch.no_grad():
+        for start in range(0, len(inputs[0]), batch_size):
+            chunk = [t[start:start + batch_size].to(device) for t in inputs]
+            outputs.append(model_fn(*chunk).float().cpu())
+    return torch.cat(outputs) if outputs else torch.empty(0)
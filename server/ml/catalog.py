@@ -0,0 +1,494 @@
+"""
+카탈로그 스냅샷 (tracks / playlist 멤버십 / space_type 컬럼형 로컬 캐시)
+
+학습 스크립트마다 tracks ⋈ playlist_tracks ⋈ playlists 전체 조인을 다시 실행하는 대신
+카탈로그를 타입이 지정된 NumPy 배열(.npy)로 디스크에 저장하고 증분 갱신한다.
+
+증분 갱신 기준:
+- tracks: track_id 워터마크 (tracks 테이블에는 updated_at 컬럼이 없음)
+  → 새 트랙만 감지하므로 기존 트랙의 메타데이터 변경(popularity, 제목, 아티스트 등)은
+    TRACKS_MAX_AGE마다 트랙 컬럼을 전체 재적재해 반영한다 (즉시 반영하려면 --full)
+- playlists: updated_at 워터마크 + playlist_id 목록 비교(삭제 감지)
+  (워터마크 경계의 플레이리스트는 매번 다시 읽히므로 저장된 값과 달라진 행만 변경으로 셈)
+- playlist_tracks: map_id 워터마크 + 행 수 비교(삭제 감지 시 멤버십만 재적재)
+
+변경이 없으면 스냅샷을 다시 쓰지 않는다. meta의 tracks_changed_at / content_changed_at은
+내용이 실제로 바뀐 시각이라 캐시 키/재로드 판단에 쓴다 (refreshed_at은 DB 확인 시각).
+
+문자열 컬럼(title, album, artwork, artist)은 UTF-8 바이트 + 오프셋 배열로 저장.
+모든 배열은 mmap_mode='r'로 열리므로 여러 프로세스가 같은 페이지를 공유한다.
+
+실행: cd server/ml && python catalog.py [--full]
+"""
+
+import os
+import sys
+import json
+import time
+
+import numpy as np
+from mysql.connector import Error as DBError
+
+from db import Column, fetch_columns
+from columnar import StringColumn, begin_dir, commit_dir, current_dir
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = os.environ.get(
+    'CATALOG_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'catalog')
+)
+
+# 트랙 컬럼 전체 재적재 주기 (초) — 기존 트랙의 메타데이터 변경이 스냅샷에 반영되는 최대 지연
+TRACKS_MAX_AGE = float(os.environ.get('CATALOG_TRACKS_MAX_AGE', 24 * 3600))
+
+SPACE_TYPES = ('PMS', 'EMS', 'GMS')
+SPACE_CODES = {s: i for i, s in enumerate(SPACE_TYPES)}
+
+TRACK_COLUMNS = [
+    Column('track_id', np.int64),
+    Column('artist', object),
+    Column('popularity', np.float32),
+    Column('duration', np.float32),
+    Column('title', object),
+    Column('album', object),
+    Column('artwork', object),
+]
+PLAYLIST_COLUMNS = [
+    Column('playlist_id', np.int64),
+    Column('user_id', np.int64),
+    Column('space_type', object),
+    Column('updated_at', np.float64, default=0.0),
+]
+MEMBER_COLUMNS = [
+    Column('map_id', np.int64),
+    Column('playlist_id', np.int64),
+    Column('track_id', np.int64),
+]
+STRING_FIELDS = ('title', 'album', 'artwork')
+
+# ============================================
+# DB → 배열
+# ============================================
+def _encode_artists(names, artists, artist_to_code):
+    """아티스트명을 append-only 어휘의 코드로 변환 (새 아티스트는 어휘 끝에 추가)"""
+    codes = np.full(len(names), -1, dtype=np.int32)
+    added = []
+    for i, name in enumerate(names):
+        if name is None:
+            continue
+        code = artist_to_code.get(name)
+        if code is None:
+            code = len(artist_to_code)
+            artist_to_code[name] = code
+            added.append(name)
+        codes[i] = code
+    return codes, artists.append(added)
+
+
+def _fetch_tracks(after_id=0):
+    return fetch_columns("""
+        SELECT track_id, artist, popularity, duration, title, album, artwork
+        FROM tracks
+        WHERE track_id > %s
+        ORDER BY track_id
+    """, TRACK_COLUMNS, (after_id,))
+
+
+def _fetch_playlists(updated_since=None):
+    sql = """
+        SELECT playlist_id, user_id, space_type, UNIX_TIMESTAMP(updated_at)
+        FROM playlists
+    """
+    if updated_since is None:
+        cols = fetch_columns(sql, PLAYLIST_COLUMNS)
+    else:
+        # 초 단위 타임스탬프이므로 경계값은 다시 가져온다 (upsert라 중복 무해)
+        cols = fetch_columns(sql + " WHERE updated_at >= FROM_UNIXTIME(%s)",
+                             PLAYLIST_COLUMNS, (updated_since,))
+    cols['space_type'] = np.array(
+        [SPACE_CODES.get(s, -1) for s in cols['space_type']], dtype=np.int8)
+    return cols
+
+
+def _fetch_members(after_id=0):
+    return fetch_columns("""
+        SELECT map_id, playlist_id, track_id
+        FROM playlist_tracks
+        WHERE map_id > %s
+        ORDER BY map_id
+    """, MEMBER_COLUMNS, (after_id,))
+
+
+def _table_stats(table, key):
+    stats = fetch_columns(
+        f"SELECT COUNT(*), COALESCE(MAX({key}), 0) FROM {table}",
+        [Column('count', np.int64), Column('max_id', np.int64)]
+    )
+    return int(stats['count'][0]), int(stats['max_id'][0])
+
+
+def _tracks_to_arrays(rows, arrays):
+    artists = arrays.get('artists') or StringColumn.from_list([])
+    artist_to_code = {a: i for i, a in enumerate(artists.tolist())}
+    codes, artists = _encode_artists(rows['artist'], artists, artist_to_code)
+    out = {
+        'track_id': rows['track_id'],
+        'artist_code': codes,
+        'popularity': rows['popularity'],
+        'duration': rows['duration'],
+        'artists': artists,
+    }
+    for name in STRING_FIELDS:
+        out[name] = rows[name].tolist()
+    return out
+
+
+def _changed_track_rows(old, new):
+    """트랙 컬럼 재적재 전/후에 값이 달라진 row 수 (track_id 구성이 다르면 전체)"""
+    if 'track_id' not in old or not np.array_equal(old['track_id'], new['track_id']):
+        return len(new['track_id'])
+    changed = old['artist_code'] != new['artist_code']
+    for name in ('popularity', 'duration'):
+        a, b = old[name], new[name]
+        changed |= ~((a == b) | (np.isnan(a) & np.isnan(b)))
+    for name in STRING_FIELDS:
+        a, b = old[name], new[name]
+        if np.array_equal(a.offsets, b.offsets) and np.array_equal(a.data, b.data):
+            continue
+        changed |= np.array([x != y for x, y in zip(a.tolist(), b.tolist())], dtype=bool)
+    return int(changed.sum())
+
+
+def _dump_tracks(arrays):
+    """트랙 컬럼 전체 재적재 → 이전 배열 대비 달라진 row 수 (처음이면 전체)"""
+    old = dict(arrays)
+    fresh = _tracks_to_arrays(_fetch_tracks(), arrays)
+    arrays.update({k: v for k, v in fresh.items() if k not in STRING_FIELDS})
+    for name in STRING_FIELDS:
+        arrays[name] = StringColumn.from_list(fresh[name])
+    return _changed_track_rows(old, arrays)
+
+
+def _dump_playlists(arrays):
+    cols = _fetch_playlists()
+    order = np.argsort(cols['playlist_id'])
+    arrays['playlist_id'] = cols['playlist_id'][order]
+    arrays['playlist_user'] = cols['user_id'][order]
+    arrays['playlist_space'] = cols['space_type'][order]
+    arrays['playlist_updated_at'] = cols['updated_at'][order]
+
+
+def _dump_members(arrays):
+    cols = _fetch_members()
+    arrays['member_map_id'] = cols['map_id']
+    arrays['member_playlist'] = cols['playlist_id']
+    arrays['member_track'] = cols['track_id']
+
+
+def _refresh_tracks(arrays):
+    count, max_id = _table_stats('tracks', 'track_id')
+    local_max = int(arrays['track_id'][-1]) if len(arrays['track_id']) else 0
+
+    if max_id == local_max and count == len(arrays['track_id']):
+        return 0
+
+    new = _tracks_to_arrays(_fetch_tracks(local_max), arrays)
+    if len(arrays['track_id']) + len(new['track_id']) != count:
+        # 삭제된 트랙이 있음 → 트랙 컬럼만 재적재 (아티스트 어휘는 유지)
+        return _dump_tracks(arrays)
+
+    for key in ('track_id', 'artist_code', 'popularity', 'duration'):
+        arrays[key] = np.concatenate([arrays[key], new[key]])
+    arrays['artists'] = new['artists']
+    for name in STRING_FIELDS:
+        arrays[name] = arrays[name].append(new[name])
+    return len(new['track_id'])
+
+
+def _refresh_playlists(arrays, updated_since):
+    current_ids = fetch_columns("SELECT playlist_id FROM playlists",
+                                [Column('playlist_id', np.int64)])['playlist_id']
+    changed = _fetch_playlists(updated_since)
+
+    # 워터마크(>=) 경계에서 다시 읽힌 행 등 저장된 값과 같은 행은 변경으로 세지 않음
+    old_ids = arrays['playlist_id']
+    pos = np.clip(np.searchsorted(old_ids, changed['playlist_id']), 0, max(len(old_ids) - 1, 0))
+    same = np.zeros(len(pos), dtype=bool)
+    if len(old_ids):
+        same = ((old_ids[pos] == changed['playlist_id'])
+                & (arrays['playlist_user'][pos] == changed['user_id'])
+                & (arrays['playlist_space'][pos] == changed['space_type'])
+                & (arrays['playlist_updated_at'][pos] == changed['updated_at']))
+
+    alive = np.isin(old_ids, current_ids)
+    keep = alive & ~np.isin(old_ids, changed['playlist_id'])
+    removed = int((~alive).sum())
+
+    ids = np.concatenate([arrays['playlist_id'][keep], changed['playlist_id']])
+    order = np.argsort(ids)
+    arrays['playlist_id'] = ids[order]
+    arrays['playlist_user'] = np.concatenate(
+        [arrays['playlist_user'][keep], changed['user_id']])[order]
+    arrays['playlist_space'] = np.concatenate(
+        [arrays['playlist_space'][keep], changed['space_type']])[order]
+    arrays['playlist_updated_at'] = np.concatenate(
+        [arrays['playlist_updated_at'][keep], changed['updated_at']])[order]
+    return int((~same).sum()) + removed
+
+
+def _refresh_members(arrays):
+    count, max_id = _table_stats('playlist_tracks', 'map_id')
+    local_ids = arrays['member_map_id']
+    local_max = int(local_ids[-1]) if len(local_ids) else 0
+
+    if max_id == local_max and count == len(local_ids):
+        return 0
+
+    new = _fetch_members(local_max)
+    if len(local_ids) + len(new['map_id']) != count:
+        # 멤버십 행이 삭제됨 → 정수 3컬럼만 다시 읽음 (조인 없음)
+        _dump_members(arrays)
+        return len(arrays['member_map_id'])
+
+    arrays['member_map_id'] = np.concatenate([local_ids, new['map_id']])
+    arrays['member_playlist'] = np.concatenate([arrays['member_playlist'], new['playlist_id']])
+    arrays['member_track'] = np.concatenate([arrays['member_track'], new['track_id']])
+    return len(new['map_id'])
+
+# ============================================
+# 저장 / 로드
+# ============================================
+ARRAY_FIELDS = (
+    'track_id', 'artist_code', 'popularity', 'duration',
+    'playlist_id', 'playlist_user', 'playlist_space', 'playlist_updated_at',
+    'member_map_id', 'member_playlist', 'member_track',
+)
+STRING_COLUMNS = STRING_FIELDS + ('artists',)
+
+
+def _read_meta(path):
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _load_arrays(path, mmap_mode=None):
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+              for name in ARRAY_FIELDS}
+    for name in STRING_COLUMNS:
+        arrays[name] = StringColumn.load(path, name, mmap_mode)
+    return arrays
+
+
+def _write_snapshot(path, arrays, meta):
+    """임시 디렉터리에 쓴 뒤 교체 (읽는 쪽이 반쯤 쓰인 파일을 보지 않도록)"""
+    tmp_path = begin_dir(path)
+
+    for name in ARRAY_FIELDS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(arrays[name]))
+    for name in STRING_COLUMNS:
+        arrays[name].save(tmp_path, name)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    commit_dir(tmp_path, path)
+
+
+def refresh_snapshot(path=SNAPSHOT_DIR, full=False):
+    """스냅샷을 DB와 동기화하고 meta를 반환 (변경이 없으면 파일을 다시 쓰지 않음)"""
+    current = current_dir(path)
+    meta = _read_meta(current)
+    started_at = time.time()
+
+    if full or meta is None or meta.get('version') != SNAPSHOT_VERSION:
+        arrays = {}
+        _dump_tracks(arrays)
+        _dump_playlists(arrays)
+        _dump_members(arrays)
+        changes = {'mode': 'full'}
+        tracks_refreshed_at = tracks_changed_at = content_changed_at = started_at
+    else:
+        arrays = _load_arrays(current)
+        # 워터마크로는 기존 트랙의 메타데이터 변경을 알 수 없음 → 주기적으로 트랙 컬럼 전체 재적재
+        tracks_refreshed_at = meta.get('tracks_refreshed_at', meta['refreshed_at'])
+        reload_tracks = started_at - tracks_refreshed_at > TRACKS_MAX_AGE
+        if reload_tracks:
+            tracks_refreshed_at = started_at
+        changes = {
+            'mode': 'incremental',
+            'tracks': _dump_tracks(arrays) if reload_tracks else _refresh_tracks(arrays),
+            'playlists': _refresh_playlists(arrays, meta['playlists_updated_at']),
+            'members': _refresh_members(arrays),
+        }
+        changed = any(changes[k] for k in ('tracks', 'playlists', 'members'))
+        if not changed and not reload_tracks:
+            return meta
+        # 주기적 재적재에서 달라진 트랙이 없으면 재적재 시각만 기록 (내용 변경 시각은 그대로)
+        tracks_changed_at = started_at if changes['tracks'] else meta.get('tracks_changed_at', meta['refreshed_at'])
+        content_changed_at = started_at if changed else meta.get('content_changed_at', meta['refreshed_at'])
+
+    updated_at = arrays['playlist_updated_at']
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'refreshed_at': started_at,
+        'tracks_refreshed_at': tracks_refreshed_at,
+        'tracks_changed_at': tracks_changed_at,
+        'content_changed_at': content_changed_at,
+        'playlists_updated_at': float(updated_at.max()) if len(updated_at) else 0.0,
+        'num_tracks': int(len(arrays['track_id'])),
+        'num_playlists': int(len(arrays['playlist_id'])),
+        'num_members': int(len(arrays['member_map_id'])),
+        'last_changes': changes,
+    }
+    _write_snapshot(path, arrays, meta)
+    return meta
+
+# ============================================
+# 읽기 API
+# ============================================
+class Catalog:
+    """스냅샷 위의 읽기 전용 뷰 (track row = track_id 정렬 순서의 인덱스)"""
+
+    def __init__(self, arrays, meta, snapshot=None):
+        self.meta = meta
+        self.snapshot = snapshot  # 읽은 스냅샷 버전 디렉터리 (갱신 감지용, 직접 만든 경우 None)
+        self.track_ids = arrays['track_id']
+        self.artist_codes = arrays['artist_code']
+        self.popularity = arrays['popularity']
+        self.duration = arrays['duration']
+        self.titles = arrays['title']
+        self.albums = arrays['album']
+        self.artworks = arrays['artwork']
+        self.artists = arrays['artists']
+        self.playlist_ids = arrays['playlist_id']
+        self.playlist_users = arrays['playlist_user']
+        self.playlist_spaces = arrays['playlist_space']
+        self.member_playlists = arrays['member_playlist']
+        self.member_tracks = arrays['member_track']
+
+    @property
+    def num_tracks(self):
+        return len(self.track_ids)
+
+    def rows_of(self, track_ids):
+        """track_id 배열 → row 인덱스 배열 (없는 ID는 -1)"""
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        idx = np.searchsorted(self.track_ids, track_ids)
+        idx = np.minimum(idx, max(self.num_tracks - 1, 0))
+        found = self.num_tracks > 0 and self.track_ids[idx] == track_ids
+        return np.where(found, idx, -1)
+
+    def playlist_track_rows(self, space_type, user_id=None):
+        """해당 공간(및 사용자)의 플레이리스트에 포함된 트랙 row (중복 제거, track_id 순)"""
+        mask = self.playlist_spaces == SPACE_CODES[space_type]
+        if user_id is not None:
+            mask &= self.playlist_users == user_id
+        member_mask = np.isin(self.member_playlists, self.playlist_ids[mask])
+        rows = self.rows_of(np.unique(self.member_tracks[member_mask]))
+        return rows[rows >= 0]
+
+    def user_track_rows(self, space_type):
+        """해당 공간 플레이리스트의 (user_id, 트랙 row) 쌍 배열 2개 (중복 제거, user_id → row 순)"""
+        mask = self.playlist_spaces == SPACE_CODES[space_type]
+        order = np.argsort(self.playlist_ids[mask])
+        playlist_ids = self.playlist_ids[mask][order]
+        playlist_users = self.playlist_users[mask][order]
+
+        member_mask = np.isin(self.member_playlists, playlist_ids)
+        users = playlist_users[np.searchsorted(playlist_ids, self.member_playlists[member_mask])]
+        rows = self.rows_of(self.member_tracks[member_mask])
+        found = rows >= 0
+
+        pairs = np.unique(np.stack([users[found], rows[found]], axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def artist_names(self, rows):
+        return [self.artists[c] if c >= 0 else None for c in self.artist_codes[rows]]
+
+    def records(self, rows, fields):
+        """row → 기존 로더와 같은 형태의 dict 리스트 (결과 출력/소량 데이터용)"""
+        rows = np.asarray(rows)
+        columns = {}
+        for field in fields:
+            if field == 'track_id':
+                columns[field] = self.track_ids[rows].tolist()
+            elif field == 'artist':
+                columns[field] = self.artist_names(rows)
+            elif field in ('popularity', 'duration'):
+                values = getattr(self, field)[rows]
+                columns[field] = [None if np.isnan(v) else int(v) for v in values]
+            elif field == 'title':
+                columns[field] = [self.titles[r] for r in rows]
+            elif field in ('album', 'artwork'):
+                source = self.albums if field == 'album' else self.artworks
+                columns[field] = [source[r] or None for r in rows]
+            else:
+                raise KeyError(f"Unknown catalog field: {field}")
+        return [dict(zip(fields, values)) for values in zip(*(columns[f] for f in fields))]
+
+
+def open_snapshot(path=SNAPSHOT_DIR):
+    """현재 스냅샷 버전을 mmap으로 열어 새 Catalog 반환 (프로세스 캐시 / DB 갱신 없음)
+
+    meta와 배열은 같은 버전 디렉터리에서 읽는다 (다른 프로세스가 그 사이 교체해도 섞이지 않음)
+    """
+    current = current_dir(path)
+    return Catalog(_load_arrays(current, mmap_mode='r'), _read_meta(current), snapshot=current)
+
+
+def content_version(meta):
+    """스냅샷 내용 버전: 내용이 실제로 바뀐 시각 (이전 형식 meta는 refreshed_at)"""
+    meta = meta or {}
+    return meta.get('content_changed_at', meta.get('refreshed_at'))
+
+
+def snapshot_changed(catalog, path=SNAPSHOT_DIR):
+    """catalog를 연 뒤 다른 프로세스가 스냅샷 내용을 바꿨는지
+
+    평소에는 포인터 파일만 읽고, 버전 디렉터리가 바뀐 경우에만 meta의 내용 버전을 비교한다.
+    내용이 같은 새 버전(주기적 트랙 재적재 등)이면 다시 열지 않고 기준 버전만 옮긴다.
+    """
+    if catalog.snapshot is None:
+        return False
+    current = current_dir(path)
+    if current == catalog.snapshot:
+        return False
+    if content_version(_read_meta(current)) != content_version(catalog.meta):
+        return True
+    catalog.snapshot = current
+    return False
+
+
+_catalog = None
+
+
+def load_catalog(path=SNAPSHOT_DIR, refresh=True):
+    """스냅샷을 (증분 갱신 후) mmap으로 열어 Catalog 반환. 프로세스당 한 번만 로드"""
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+
+    if refresh:
+        try:
+            refresh_snapshot(path)
+        except DBError as e:
+            if _read_meta(current_dir(path)) is None:
+                raise
+            print(f"[Catalog] DB 갱신 실패, 기존 스냅샷 사용: {e}")
+
+    _catalog = open_snapshot(path)
+    return _catalog
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding='utf-8')
+    started = time.time()
+    meta = refresh_snapshot(full='--full' in sys.argv)
+    print(f"[Catalog] {SNAPSHOT_DIR}")
+    print(f"   - 트랙: {meta['num_tracks']:,}")
+    print(f"   - 플레이리스트: {meta['num_playlists']:,}")
+    print(f"   - 멤버십: {meta['num_members']:,}")
+    print(f"   - 변경: {meta.get('last_changes')}")
+    print(f"   - 소요 시간: {time.time() - started:.2f}s")
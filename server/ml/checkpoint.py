@@ -0,0 +1,105 @@
+"""
+체크포인트 저장/로드 공용 함수
+
+- save_checkpoint: 임시 파일에 쓴 뒤 os.replace로 교체 (읽는 쪽이 쓰다 만 파일을 보지 않음)
+- load_checkpoint: 텐서 storage를 mmap으로 열어 실제로 읽는 만큼만 메모리에 올림
+- export_scripted / load_scripted: eval 모드로 고정(freeze)한 TorchScript 추론 아티팩트(.ts)
+  + 추론에 필요한 메타데이터(JSON). 로드 시 학습 코드(모델 클래스)가 필요 없음
+- 트랙/사용자 vocabulary: 정렬된 int64 ID 배열을 MODEL_DIR/vocab/ 에 내용 해시 이름으로 한 번만 저장하고,
+  사용자별 체크포인트에는 파일 이름만 기록 (매핑 인덱스 = 정렬 위치 + 1, 0 = 미등록)
+"""
+
+import os
+import json
+import hashlib
+import warnings
+
+import numpy as np
+import torch
+
+VOCAB_DIR = 'vocab'
+
+# 모델별 사용자 체크포인트 파일 이름 (MODEL_DIR 기준)
+CHECKPOINT_FILES = {
+    'ncf': 'ncf_user_{}.pt',
+    'hybrid': 'hybrid_user_{}.pt',
+    'embedding': 'track2vec_user_{}.pt',
+    'ncf_multi': 'ncf_multi.pt',  # 전체 사용자 공용 (user_embedding 테이블)
+}
+
+_vocab_cache = {}
+
+
+def is_per_user(model):
+    """사용자별 체크포인트인지 (False = 전체 사용자 공용 체크포인트 1개)"""
+    return '{}' in CHECKPOINT_FILES[model]
+
+
+def save_checkpoint(obj, path):
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, device='cpu'):
+    return torch.load(path, map_location=device, mmap=True, weights_only=True)
+
+
+def scripted_path(checkpoint_path):
+    """체크포인트(.pt) 경로 → 추론 아티팩트(.ts) 경로"""
+    return os.path.splitext(checkpoint_path)[0] + '.ts'
+
+
+def export_scripted(model, path, meta):
+    """eval 모드 TorchScript로 변환 후 freeze (dropout 제거, batch-norm 상수 접기)해 저장"""
+    model.eval()
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)  # torch.jit deprecation 안내
+        scripted = torch.jit.freeze(torch.jit.script(model))
+        torch.jit.save(scripted, tmp_path, _extra_files={'meta.json': json.dumps(meta, ensure_ascii=False)})
+    os.replace(tmp_path, path)
+
+
+def load_scripted(path, device='cpu'):
+    """(TorchScript 모듈, 메타데이터 dict)"""
+    extra_files = {'meta.json': ''}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    return module, json.loads(extra_files['meta.json'])
+
+# ============================================
+# Track / User vocabulary
+# ============================================
+def build_vocab(track_ids):
+    return np.unique(np.asarray(track_ids, dtype=np.int64))
+
+
+def save_vocab(vocab, model_dir, kind='tracks'):
+    """vocabulary 저장 (같은 내용이면 기존 파일 재사용) → MODEL_DIR 기준 상대 경로"""
+    vocab = np.ascontiguousarray(vocab, dtype=np.int64)
+    name = os.path.join(VOCAB_DIR, f'{kind}_{hashlib.sha1(vocab.tobytes()).hexdigest()[:16]}.npy')
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp.{os.getpid()}.npy'
+        np.save(tmp_path, vocab)
+        os.replace(tmp_path, path)
+    return name
+
+
+def load_vocab(name, model_dir):
+    path = os.path.join(model_dir, name)
+    if path not in _vocab_cache:
+        _vocab_cache[path] = np.load(path, mmap_mode='r')
+    return _vocab_cache[path]
+
+
+def vocab_lookup(vocab, track_ids):
+    """track_id → 매핑 인덱스 (정렬 위치 + 1, vocabulary에 없으면 0)"""
+    track_ids = np.asarray(track_ids, dtype=np.int64)
+    if not len(vocab):
+        return np.zeros(len(track_ids), dtype=np.int64)
+    pos = np.clip(np.searchsorted(vocab, track_ids), 0, len(vocab) - 1)
+    return np.where(vocab[pos] == track_ids, pos + 1, 0).astype(np.int64)
@@ -0,0 +1,132 @@
+"""
+컬럼형 캐시 공용 유틸 (NumPy .npy 기반)
+
+- StringColumn: 문자열 컬럼을 UTF-8 바이트 + 오프셋 배열로 저장 (mmap 가능)
+- begin_dir / commit_dir / current_dir: 버전 디렉터리 + 포인터 파일로 하는 원자적 캐시 갱신
+
+외부 의존성은 NumPy뿐이므로 server/ 루트 스크립트에서도 `from ml.columnar import ...`로 사용 가능.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+
+class StringColumn:
+    """UTF-8 바이트(uint8) + 오프셋(int64)으로 저장된 문자열 컬럼 (None은 빈 문자열)"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values):
+        encoded = [(v or '').encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).copy()
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+    def append(self, values):
+        other = StringColumn.from_list(values)
+        return StringColumn(
+            np.concatenate([self.data, other.data]),
+            np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        )
+
+    def save(self, path, name):
+        np.save(os.path.join(path, f'{name}.bytes.npy'), self.data)
+        np.save(os.path.join(path, f'{name}.offsets.npy'), self.offsets)
+
+    @classmethod
+    def load(cls, path, name, mmap_mode=None):
+        return cls(
+            np.load(os.path.join(path, f'{name}.bytes.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, f'{name}.offsets.npy'), mmap_mode=mmap_mode)
+        )
+
+
+CURRENT_FILE = 'CURRENT'  # 현재 버전 디렉터리 이름을 담은 포인터 파일
+KEEP_VERSIONS = 2  # 현재 버전 외에 항상 남겨 둘 최근 버전 수
+VERSION_GRACE_SECONDS = 60  # 이보다 최근에 쓰인 버전은 삭제하지 않음 (교체 직전에 포인터를 읽은 쪽 / 동시 커밋 보호)
+STALE_TMP_SECONDS = 3600  # 이보다 오래된 임시 디렉터리는 중단된 writer의 잔여물로 보고 삭제
+
+# 캐시 디렉터리 구조: path/CURRENT → 'v<ns>-<id>', path/v<ns>-<id>/ (버전), path/tmp-<id>/ (쓰는 중)
+# path 자체는 교체되지 않으므로 읽는 쪽이 path가 사라진 순간을 보는 일이 없다.
+
+
+def current_dir(path):
+    """읽을 디렉터리: 포인터가 가리키는 현재 버전 (포인터가 없으면 path 자체 — 이전 형식 캐시)
+
+    한 번 구한 경로에서 모든 파일을 읽어야 서로 다른 버전의 파일이 섞이지 않는다.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(path, name)
+
+
+def begin_dir(path):
+    """캐시를 쓸 임시 디렉터리 생성 (path 안의 고유 이름 — 동시에 쓰는 writer끼리 덮어쓰지 않음)"""
+    os.makedirs(path, exist_ok=True)
+    return tempfile.mkdtemp(prefix='tmp-', dir=path)
+
+
+def commit_dir(tmp_path, path):
+    """임시 디렉터리를 새 버전으로 고정하고 포인터 파일을 os.replace로 원자적으로 교체
+
+    읽는 쪽은 항상 완전한 이전 버전 또는 새 버전을 본다. 동시에 커밋하면 나중 교체가 이긴다.
+    """
+    unique = os.path.basename(tmp_path)[len('tmp-'):]
+    name = f'v{time.time_ns():020d}-{unique}'
+    os.rename(tmp_path, os.path.join(path, name))
+
+    pointer_tmp = os.path.join(path, f'{CURRENT_FILE}.{unique}')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(path, CURRENT_FILE))
+    _prune_dir(path)
+
+
+def _prune_dir(path):
+    """현재 버전 + 최근 KEEP_VERSIONS개 + 유예 시간 안의 버전만 남기고
+    이전 버전 / 이전 형식 파일 / 오래된 임시 디렉터리 삭제"""
+    current = os.path.basename(current_dir(path))
+    entries = sorted(os.listdir(path))
+    versions = [e for e in entries if e.startswith('v') and os.path.isdir(os.path.join(path, e))]
+    keep = set(versions[-(KEEP_VERSIONS + 1):]) | {current}
+    now = time.time()
+
+    for entry in entries:
+        full = os.path.join(path, entry)
+        if entry in keep or entry == CURRENT_FILE:
+            continue
+        if entry in versions or entry.startswith(('tmp-', f'{CURRENT_FILE}.')):
+            # 읽는 중이거나 다른 writer가 쓰는 중일 수 있음 → 유예 시간이 지난 것만 정리
+            grace = VERSION_GRACE_SECONDS if entry in versions else STALE_TMP_SECONDS
+            try:
+                if now - os.path.getmtime(full) < grace:
+                    continue
+            except FileNotFoundError:
+                continue
+        if os.path.isdir(full):
+            shutil.rmtree(full, ignore_errors=True)
+        else:
+            try:
+                os.remove(full)
+            except FileNotFoundError:
+                pass
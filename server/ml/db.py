@@ -0,0 +1,194 @@
+"""
+MySQL 데이터 접근 레이어 (server/ml 학습 스크립트 공용)
+
+- Connection Pool: 로더마다 새 연결을 여는 대신 프로세스당 하나의 풀을 공유
+- Streaming: unbuffered 커서로 결과를 고정 크기 청크(tuple) 단위로 읽음
+- Typed Projection: 결과를 dict 리스트 대신 타입이 지정된 NumPy 컬럼 배열로 적재
+- Bulk Upsert: 행 단위 INSERT 대신 multi-row INSERT ... ON DUPLICATE KEY UPDATE
+  (sync_rows: 같은 트랜잭션에서 더 이상 없는 키의 행을 DELETE)
+
+사용 예:
+    from db import Column, fetch_columns, fetch_records
+
+    cols = fetch_columns("SELECT track_id, popularity FROM tracks", [
+        Column('track_id', np.int64),
+        Column('popularity', np.float32, default=50),
+    ])
+"""
+
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+from mysql.connector import pooling
+
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': int(os.environ.get('DB_PORT', 3307)),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASSWORD', '0000'),
+    'database': os.environ.get('DB_NAME', 'music_space_db'),
+}
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+CHUNK_SIZE = 5000
+WRITE_CHUNK_SIZE = 1000  # multi-row INSERT 한 문장당 행 수
+
+# name: 컬럼 이름, dtype: NumPy dtype (object면 변환 없이 보관), default: NULL 대체값
+Column = namedtuple('Column', ['name', 'dtype', 'default'], defaults=[None])
+
+_pool = None
+_pool_pid = None
+
+
+def get_pool():
+    """프로세스당 하나의 커넥션 풀 (fork된 워커는 새 풀을 생성)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        _pool = pooling.MySQLConnectionPool(
+            pool_name=f'ml_pool_{pid}',
+            pool_size=POOL_SIZE,
+            **DB_CONFIG
+        )
+        _pool_pid = pid
+    return _pool
+
+
+@contextmanager
+def connection():
+    """풀에서 연결을 빌려오고 사용 후 반환"""
+    conn = get_pool().get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()  # pooled connection은 close() 시 풀로 반환됨
+
+
+def _stream(sql, params=None, chunk_size=CHUNK_SIZE):
+    """(column_names, rows) 청크를 yield하는 unbuffered 조회"""
+    with connection() as conn:
+        cur = conn.cursor(buffered=False)
+        try:
+            cur.execute(sql, params or ())
+            names = cur.column_names
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield names, rows
+        finally:
+            # 중간에 중단된 경우 남은 결과를 비워야 풀에 반환 가능
+            if conn.unread_result:
+                conn.consume_results()
+            cur.close()
+
+
+def iter_chunks(sql, params=None, chunk_size=CHUNK_SIZE):
+    """쿼리 결과를 chunk_size개의 tuple 리스트 단위로 yield"""
+    for _, rows in _stream(sql, params, chunk_size):
+        yield rows
+
+
+def _to_array(values, column):
+    if column.dtype is object:
+        return np.array(values, dtype=object)
+    if column.default is not None:
+        values = [column.default if v is None else v for v in values]
+    elif np.issubdtype(column.dtype, np.floating):
+        values = [np.nan if v is None else v for v in values]
+    return np.asarray(values, dtype=column.dtype)
+
+
+def fetch_columns(sql, columns, params=None, chunk_size=CHUNK_SIZE):
+    """
+    SELECT 결과를 {컬럼명: ndarray} 로 적재
+
+    columns는 SELECT 순서와 같은 Column 리스트.
+    청크 단위로 변환하므로 전체 결과를 Python 객체로 보관하지 않음.
+    """
+    parts = {c.name: [] for c in columns}
+    for rows in iter_chunks(sql, params, chunk_size):
+        for column, values in zip(columns, zip(*rows)):
+            parts[column.name].append(_to_array(values, column))
+
+    result = {}
+    for c in columns:
+        if parts[c.name]:
+            result[c.name] = np.concatenate(parts[c.name])
+        else:
+            result[c.name] = np.empty(0, dtype=c.dtype)
+    return result
+
+
+def fetch_records(sql, params=None, chunk_size=CHUNK_SIZE):
+    """작은 결과셋용: dict 리스트로 반환 (PMS/EMS 트랙 등)"""
+    records = []
+    for names, rows in _stream(sql, params, chunk_size):
+        records.extend(dict(zip(names, row)) for row in rows)
+    return records
+
+
+def _upsert(cur, table, columns, rows, update_columns, chunk_size):
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    tail = " ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = VALUES({c})" for c in update_columns)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cur.execute(head + ', '.join([placeholders] * len(chunk)) + tail,
+                    [v for row in chunk for v in row])
+
+
+def _delete_keys(cur, table, key_column, keys, where, params, chunk_size):
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        cur.execute(f"DELETE FROM {table} WHERE {where} AND {key_column} IN ({', '.join(['%s'] * len(chunk))})",
+                    list(params) + list(chunk))
+
+
+def _write(ops):
+    """ops(cursor)를 한 트랜잭션으로 실행 (실패 시 rollback)"""
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            ops(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+
+def upsert_rows(table, columns, rows, update_columns, chunk_size=WRITE_CHUNK_SIZE):
+    """
+    rows(columns 순서의 tuple 리스트)를 multi-row INSERT ... ON DUPLICATE KEY UPDATE로 기록
+
+    chunk_size행마다 한 문장으로 보내고 전체를 한 트랜잭션으로 커밋. 반환: 기록한 행 수
+    값은 Python 기본 타입이어야 함 (NumPy 배열은 .tolist()로 변환)
+    """
+    if not rows:
+        return 0
+    _write(lambda cur: _upsert(cur, table, columns, rows, update_columns, chunk_size))
+    return len(rows)
+
+
+def sync_rows(table, columns, rows, update_columns, key_column, stale_keys, where, params=(),
+              chunk_size=WRITE_CHUNK_SIZE):
+    """
+    upsert_rows와 같은 방식으로 rows를 기록하고, 같은 트랜잭션에서
+    `where`(예: "user_id = %s")에 해당하면서 key_column이 stale_keys인 행을 삭제
+
+    반환: (기록한 행 수, 삭제한 행 수)
+    """
+    stale_keys = list(stale_keys)
+    if not rows and not stale_keys:
+        return 0, 0
+
+    def ops(cur):
+        if rows:
+            _upsert(cur, table, columns, rows, update_columns, chunk_size)
+        _delete_keys(cur, table, key_column, stale_keys, where, params, chunk_size)
+
+    _write(ops)
+    return len(rows), len(stale_keys)
@@ -0,0 +1,452 @@
+"""
+추천 모델 오프라인 평가 + 비용 측정 하네스
+
+7개 추천기(v2–v5, NCF, Hybrid, Track2Vec)를 같은 holdout / 같은 후보 풀에서 비교한다.
+- holdout: 사용자마다 PMS 트랙의 HOLDOUT_RATIO를 떼어 두고 (seed 고정) 나머지로만 학습
+- 후보 풀: EMS 트랙 ∪ held-out 트랙 − 학습용 PMS 트랙 (모든 모델 동일)
+- 딥러닝 모델의 negative 풀에서는 held-out을 포함한 사용자 PMS 트랙 전체를 제외
+- 품질: Recall@K / NDCG@K (held-out 트랙 = 정답, 사용자 평균)
+- 비용: 학습(fit) 시간, 추천 1회(후보 전체 점수 + top-k) 지연 p50/p95/p99,
+  최대 RSS 증가분 (import 포함, 모델마다 별도 프로세스에서 실행해 메모리를 분리)
+
+v2–v5는 플레이리스트/CSV 단위 스크립트라서 같은 규칙을 트랙 단위로 옮겨 평가한다.
+- v2: TF-IDF(트랙 제목 + 아티스트), 사용자 문서 = 학습 트랙 텍스트를 이어붙인 문서
+- v3: v2 텍스트 유사도 0.5 + MinMax 정규화 오디오 특성 평균 코사인 0.5
+- v4: MinMax 정규화 오디오 특성 평균 코사인
+- v5: StandardScaler(후보 풀 기준) 오디오 특성 + popularity 평균 코사인
+오디오 특성은 v3 export(training_data_v3.json)에서 track_id로 가져오며, 없으면 v3–v5는 skip.
+
+결과: MODEL_DIR/evaluation_report.json
+
+실행: cd server/ml && python evaluate.py [--models v2,ncf] [--users 3,5] [--max-users 50] [--k 10,30] [--epochs 10]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import importlib
+import traceback
+import multiprocessing as mp
+from datetime import datetime
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog import load_catalog
+from ranking import top_indices
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')
+REPORT_FILE = 'evaluation_report.json'
+FEATURES_FILE = os.path.join(os.path.dirname(ML_DIR), 'training_data_v3.json')
+
+HOLDOUT_RATIO = 0.2
+MIN_POSITIVES = 10  # PMS 트랙이 이보다 적은 사용자는 평가 제외
+DEFAULT_K = (10, 30)
+LATENCY_REPEATS = 5  # 사용자당 추천 지연 측정 횟수
+SEED = 42
+
+# ============================================
+# Holdout / 지표
+# ============================================
+def make_splits(catalog, user_ids=None, max_users=None, ratio=HOLDOUT_RATIO, seed=SEED):
+    """user_id → (학습 row, held-out row, 후보 row)"""
+    users, rows = catalog.user_track_rows('PMS')
+    ems_rows = catalog.playlist_track_rows('EMS')
+    rng = np.random.default_rng(seed)
+
+    splits = {}
+    bounds = np.flatnonzero(np.diff(users)) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(users)]):
+        user_id = int(users[start])
+        user_rows = rows[start:end]
+        if user_ids is not None and user_id not in user_ids:
+            continue
+        if len(user_rows) < MIN_POSITIVES:
+            continue
+        order = rng.permutation(user_rows)
+        num_held = max(1, int(len(user_rows) * ratio))
+        held, train = np.sort(order[:num_held]), np.sort(order[num_held:])
+        splits[user_id] = (train, held, np.setdiff1d(np.union1d(ems_rows, held), train))
+        if max_users and len(splits) >= max_users:
+            break
+    return splits
+
+
+def ranking_quality(top, candidate_rows, held_rows, k):
+    """top: 후보 인덱스 (점수 순) → (Recall@K, NDCG@K)"""
+    hits = np.isin(candidate_rows[top[:k]], held_rows)
+    discounts = 1.0 / np.log2(np.arange(2, len(hits) + 2))
+    ideal = (1.0 / np.log2(np.arange(2, min(len(held_rows), k) + 2))).sum()
+    return hits.sum() / len(held_rows), (hits * discounts).sum() / ideal
+
+# ============================================
+# 공용 데이터 (후보 풀 텍스트 / 오디오 특성)
+# ============================================
+def load_track_features(catalog, path=FEATURES_FILE):
+    """v3 export의 트랙별 오디오 특성 → 카탈로그 row 정렬 (N, 6) float32 (없으면 None, 특성 없는 트랙은 0)"""
+    if not os.path.exists(path):
+        return None
+    server_dir = os.path.dirname(ML_DIR)
+    if server_dir not in sys.path:
+        sys.path.append(server_dir)  # playlist_corpus는 server/ 루트 모듈 (ml.columnar 사용)
+    from playlist_corpus import load_corpus
+
+    corpus = load_corpus(path)
+    if not corpus.has_features:
+        return None
+    features = np.zeros((catalog.num_tracks, corpus.features.shape[1]), dtype=np.float32)
+    rows = catalog.rows_of(corpus.track_ids)
+    found = rows >= 0
+    features[rows[found]] = corpus.features[found]
+    return features
+
+
+class EvalContext:
+    def __init__(self, catalog, features=None):
+        self.catalog = catalog
+        self.features = features
+        # 후보가 될 수 있는 트랙 전체 (EMS ∪ PMS) — 텍스트/특성 행렬은 이 순서로 한 번만 계산
+        self.pool_rows = np.union1d(catalog.playlist_track_rows('EMS'), catalog.playlist_track_rows('PMS'))
+
+    def pool_index(self, rows):
+        return np.searchsorted(self.pool_rows, rows)
+
+    def texts(self, rows):
+        """트랙 텍스트 (v2 export의 text 필드와 같은 '제목 아티스트' 형식)"""
+        return [f"{r['title'] or ''} {r['artist'] or ''}".strip()
+                for r in self.catalog.records(rows, ['title', 'artist'])]
+
+    def track_features(self, rows, with_popularity=False):
+        features = self.features[rows].astype(np.float64)
+        if with_popularity:
+            popularity = np.nan_to_num(np.asarray(self.catalog.popularity[rows], dtype=np.float64))
+            features = np.hstack([features, popularity[:, None]])
+        return features
+
+# ============================================
+# 추천기 어댑터: setup() 공용 준비, fit(학습 row, 후보 row, 사용자 positive row 전체) → score() (후보 순서의 점수)
+# negative 샘플링은 held-out을 포함한 positive 전체를 제외 (정답 트랙을 negative로 학습하지 않도록)
+# ============================================
+def _trainer(name):
+    """학습 모듈 import (torch는 딥러닝 모델에서만 로드해 메모리 측정에 섞이지 않게 함)"""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        module = importlib.import_module(name)
+    import torch
+    torch.manual_seed(SEED)
+    return module
+
+
+class TextRecommender:
+    """v2: TF-IDF 코사인"""
+    needs_features = False
+
+    def __init__(self, ctx, epochs=None):
+        self.ctx = ctx
+
+    def setup(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+        self.matrix = self.vectorizer.fit_transform(self.ctx.texts(self.ctx.pool_rows))
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        from sklearn.metrics.pairwise import cosine_similarity
+        user = self.vectorizer.transform([" ".join(self.ctx.texts(train_rows))])
+        candidates = self.matrix[self.ctx.pool_index(candidate_rows)]
+        return lambda: cosine_similarity(user, candidates).ravel()
+
+
+class FeatureRecommender:
+    """v4 (MinMax) / v5 (Standard + popularity): 학습 트랙 평균 특성과의 코사인"""
+    needs_features = True
+
+    def __init__(self, ctx, epochs=None, scaler='minmax', with_popularity=False):
+        self.ctx = ctx
+        self.scaler_name = scaler
+        self.with_popularity = with_popularity
+
+    def setup(self):
+        from sklearn.preprocessing import MinMaxScaler, StandardScaler
+        self.scaler = MinMaxScaler() if self.scaler_name == 'minmax' else StandardScaler()
+        self.matrix = self.scaler.fit_transform(self.ctx.track_features(self.ctx.pool_rows, self.with_popularity))
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        from sklearn.metrics.pairwise import cosine_similarity
+        profile = self.ctx.track_features(train_rows, self.with_popularity).mean(axis=0, keepdims=True)
+        profile = self.scaler.transform(profile)
+        candidates = self.matrix[self.ctx.pool_index(candidate_rows)]
+        return lambda: cosine_similarity(profile, candidates).ravel()
+
+
+class PopularityFeatureRecommender(FeatureRecommender):
+    """v5: StandardScaler + popularity"""
+
+    def __init__(self, ctx, epochs=None):
+        super().__init__(ctx, scaler='standard', with_popularity=True)
+
+
+class BlendRecommender:
+    """v3: 텍스트 alpha + 특성(MinMax) 1 - alpha"""
+    needs_features = True
+
+    def __init__(self, ctx, epochs=None, alpha=0.5):
+        self.ctx = ctx
+        self.text = TextRecommender(ctx)
+        self.feature = FeatureRecommender(ctx)
+        self.alpha = alpha
+
+    def setup(self):
+        self.text.setup()
+        self.feature.setup()
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        text = self.text.fit(train_rows, candidate_rows, positive_rows)
+        feature = self.feature.fit(train_rows, candidate_rows, positive_rows)
+        return lambda: self.alpha * text() + (1 - self.alpha) * feature()
+
+
+class NCFRecommender:
+    needs_features = False
+
+    def __init__(self, ctx, epochs=None):
+        self.ctx = ctx
+        self.epochs = epochs
+
+    def setup(self):
+        from checkpoint import build_vocab
+        self.trainer = _trainer('train_ncf')
+        self.vocab = build_vocab(self.ctx.catalog.track_ids)
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        import torch
+        from batching import batch_loader, batched_scores
+        from checkpoint import vocab_lookup
+        t = self.trainer
+        track_ids = self.ctx.catalog.track_ids
+        positives = vocab_lookup(self.vocab, track_ids[train_rows])
+        dataset = t.MusicDataset(positives, len(self.vocab), t.NEGATIVE_SAMPLES, seed=SEED,
+                                 all_positives=vocab_lookup(self.vocab, track_ids[positive_rows]))
+        model = t.NCF(len(self.vocab), t.EMBEDDING_DIM, t.HIDDEN_LAYERS).to(t.DEVICE)
+        with redirect_stdout(None):
+            t.train_model(model, batch_loader(dataset, t.BATCH_SIZE), self.epochs or t.EPOCHS, t.LEARNING_RATE)
+        model.eval()
+        mapped = torch.from_numpy(vocab_lookup(self.vocab, self.ctx.catalog.track_ids[candidate_rows]))
+        return lambda: batched_scores(model, mapped, batch_size=t.INFERENCE_BATCH_SIZE, device=t.DEVICE).numpy()
+
+
+class HybridRecommender:
+    needs_features = False
+
+    def __init__(self, ctx, epochs=None):
+        self.ctx = ctx
+        self.epochs = epochs
+
+    def setup(self):
+        from features import FeatureEncoder, load_encoded_tracks
+        self.trainer = _trainer('train_hybrid')
+        self.encoder = FeatureEncoder(self.ctx.catalog.artists.tolist())
+        self.table = load_encoded_tracks(self.encoder, self.ctx.catalog, MODEL_DIR)
+        self.ems_rows = self.ctx.catalog.playlist_track_rows('EMS')
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        from batching import batch_loader, batched_scores
+        t = self.trainer
+        dataset = t.TripletDataset(train_rows, np.setdiff1d(self.ems_rows, positive_rows), self.table, neg_ratio=4)
+        model = t.HybridRecommender(self.encoder.num_artists, t.ARTIST_EMBEDDING_DIM, t.HIDDEN_LAYERS[0]).to(t.DEVICE)
+        with redirect_stdout(None):
+            t.train_model(model, batch_loader(dataset, t.BATCH_SIZE), self.epochs or t.EPOCHS, t.LEARNING_RATE)
+        model.eval()
+        feats = self.table.tensors(candidate_rows)
+        return lambda: batched_scores(model, feats['artist'], feats['pop'], feats['dur'],
+                                      batch_size=t.INFERENCE_BATCH_SIZE, device=t.DEVICE).numpy()
+
+
+class EmbeddingRecommender:
+    """Track2Vec: 후보 임베딩은 fit 시 한 번만 계산 (서빙의 인덱스 빌드에 해당), 요청은 프로필 내적"""
+    needs_features = False
+
+    def __init__(self, ctx, epochs=None):
+        self.ctx = ctx
+        self.epochs = epochs
+
+    def setup(self):
+        from features import FeatureEncoder, load_encoded_tracks
+        self.trainer = _trainer('train_embedding')
+        self.artists = self.ctx.catalog.artists.tolist()
+        self.table = load_encoded_tracks(FeatureEncoder(self.artists), self.ctx.catalog, MODEL_DIR)
+        self.ems_rows = self.ctx.catalog.playlist_track_rows('EMS')
+
+    def fit(self, train_rows, candidate_rows, positive_rows):
+        from batching import batch_loader
+        t = self.trainer
+        dataset = t.TripletDataset(train_rows, np.setdiff1d(self.ems_rows, positive_rows), self.table)
+        loader = batch_loader(dataset, t.BATCH_SIZE, drop_last=len(dataset) >= t.BATCH_SIZE)
+        model = t.Track2Vec(len(self.artists), t.ARTIST_DIM, t.EMBEDDING_DIM).to(t.DEVICE)
+        with redirect_stdout(None):
+            t.train_embedding_model(model, loader, self.epochs or t.EPOCHS, t.LR)
+        profile = t.user_profile(model, self.table, train_rows)
+        candidates = t.encode_tracks(model, self.table, candidate_rows)
+        return lambda: candidates @ profile
+
+
+RECOMMENDERS = {
+    'v2': TextRecommender,
+    'v3': BlendRecommender,
+    'v4': FeatureRecommender,
+    'v5': PopularityFeatureRecommender,
+    'ncf': NCFRecommender,
+    'hybrid': HybridRecommender,
+    'embedding': EmbeddingRecommender,
+}
+
+# ============================================
+# 평가 실행 (모델마다 별도 프로세스)
+# ============================================
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: KB
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)}
+
+
+def evaluate_model(name, splits, ks=DEFAULT_K, epochs=None, repeats=LATENCY_REPEATS, features_path=FEATURES_FILE):
+    """한 모델을 전체 사용자에 대해 평가 → 리포트 dict"""
+    base_rss = _peak_rss_mb()
+    np.random.seed(SEED)
+
+    catalog = load_catalog(refresh=False)
+    features = None
+    if RECOMMENDERS[name].needs_features:
+        features = load_track_features(catalog, features_path)
+        if features is None:
+            return {'status': 'skipped', 'reason': f'오디오 특성 없음 ({os.path.basename(features_path)})'}
+    recommender = RECOMMENDERS[name](EvalContext(catalog, features), epochs)
+
+    started = time.perf_counter()
+    recommender.setup()
+    setup_seconds = time.perf_counter() - started
+
+    fit_seconds, latencies = [], []
+    quality = {f'{metric}@{k}': [] for k in ks for metric in ('recall', 'ndcg')}
+    max_k = max(ks)
+    for train_rows, held_rows, candidate_rows in splits.values():
+        started = time.perf_counter()
+        score = recommender.fit(train_rows, candidate_rows, np.union1d(train_rows, held_rows))
+        fit_seconds.append(time.perf_counter() - started)
+
+        for _ in range(repeats):
+            started = time.perf_counter()
+            top = top_indices(np.asarray(score(), dtype=np.float64), max_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        for k in ks:
+            recall, ndcg = ranking_quality(top, candidate_rows, held_rows, k)
+            quality[f'recall@{k}'].append(recall)
+            quality[f'ndcg@{k}'].append(ndcg)
+
+    return {
+        'status': 'ok',
+        'users': len(splits),
+        'metrics': {key: round(float(np.mean(v)), 4) if v else None for key, v in quality.items()},
+        'setup_seconds': round(setup_seconds, 3),
+        'fit_seconds': {
+            'mean': round(float(np.mean(fit_seconds)), 3) if fit_seconds else None,
+            'total': round(float(np.sum(fit_seconds)), 3),
+        },
+        'latency_ms': _percentiles(latencies),
+        'peak_rss_mb': round(_peak_rss_mb() - base_rss, 1),
+    }
+
+
+def _evaluate_safely(*args, **kwargs):
+    try:
+        return evaluate_model(*args, **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        return {'status': 'failed', 'reason': f'{type(e).__name__}: {e}'}
+
+
+def run_evaluation(models, splits, ks=DEFAULT_K, epochs=None, repeats=LATENCY_REPEATS, features_path=FEATURES_FILE):
+    method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+    results = {}
+    for name in models:
+        # 모델마다 새 프로세스: 최대 RSS와 import 비용이 서로 섞이지 않음
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context(method)) as pool:
+            results[name] = pool.submit(_evaluate_safely, name, splits, ks, epochs, repeats, features_path).result()
+        print(f"  {name}: {_summary_line(results[name], ks)}")
+    return results
+
+
+def _summary_line(result, ks):
+    if result['status'] != 'ok':
+        return f"{result['status']} - {result['reason']}"
+    k = max(ks)
+    return (f"Recall@{k} {result['metrics'][f'recall@{k}']:.4f}, NDCG@{k} {result['metrics'][f'ndcg@{k}']:.4f}, "
+            f"fit {result['fit_seconds']['mean']:.2f}s/user, "
+            f"p95 {result['latency_ms']['p95']:.2f}ms, peak +{result['peak_rss_mb']:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='추천 모델 오프라인 평가 / 비용 비교')
+    parser.add_argument('--models', default=','.join(RECOMMENDERS), help='쉼표로 구분 (기본: 전체)')
+    parser.add_argument('--users', help='쉼표로 구분된 사용자 ID (기본: PMS 트랙이 충분한 사용자 전체)')
+    parser.add_argument('--max-users', type=int)
+    parser.add_argument('--k', default=','.join(map(str, DEFAULT_K)))
+    parser.add_argument('--epochs', type=int, help='NCF/Hybrid/Track2Vec 에폭 수 (기본: 각 트레이너 설정)')
+    parser.add_argument('--repeats', type=int, default=LATENCY_REPEATS)
+    parser.add_argument('--features', default=FEATURES_FILE, help='오디오 특성이 든 v3 export JSON')
+    parser.add_argument('--out', default=os.path.join(MODEL_DIR, REPORT_FILE))
+    args = parser.parse_args()
+
+    models = [m for m in args.models.split(',') if m]
+    unknown = set(models) - set(RECOMMENDERS)
+    if unknown:
+        parser.error(f"unknown models: {', '.join(sorted(unknown))}")
+    ks = sorted({int(k) for k in args.k.split(',')})
+    user_ids = {int(u) for u in args.users.split(',')} if args.users else None
+
+    catalog = load_catalog()
+    splits = make_splits(catalog, user_ids, args.max_users)
+
+    print("=" * 60)
+    print(f"[Evaluate] 모델 {len(models)}개, 사용자 {len(splits)}명 (holdout {HOLDOUT_RATIO:.0%}, seed {SEED})")
+    print("=" * 60)
+    if not splits:
+        print("[ERROR] 평가할 사용자가 없습니다")
+        return None
+
+    results = run_evaluation(models, splits, ks, args.epochs, args.repeats, args.features)
+
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'config': {
+            'holdout_ratio': HOLDOUT_RATIO,
+            'min_positives': MIN_POSITIVES,
+            'seed': SEED,
+            'k': ks,
+            'epochs': args.epochs,
+            'latency_repeats': args.repeats,
+            'users': sorted(splits),
+            'mean_candidates': round(float(np.mean([len(c) for _, _, c in splits.values()])), 1),
+        },
+        'models': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n[DONE] {args.out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+기존 체크포인트(.pt) → TorchScript 추론 아티팩트(.ts) 변환
+
+학습 스크립트는 학습 직후 아티팩트를 함께 저장하므로, 이 스크립트는
+아티팩트가 없던 시점의 체크포인트를 일괄 변환할 때 사용한다.
+(모델 클래스를 다시 만들어야 하므로 학습 모듈을 import함)
+
+실행: cd server/ml && python export_models.py [--model ncf|hybrid|embedding|ncf_multi] [--users 3,5,7]
+"""
+
+import os
+import re
+import sys
+import argparse
+import importlib
+from contextlib import redirect_stdout
+
+from checkpoint import CHECKPOINT_FILES, export_scripted, is_per_user, load_checkpoint, load_vocab, scripted_path
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')
+
+TRAINERS = {
+    'ncf': 'train_ncf',
+    'hybrid': 'train_hybrid',
+    'embedding': 'train_embedding',
+    'ncf_multi': 'train_ncf_multi',
+}
+
+
+def _trainer(model):
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        return importlib.import_module(TRAINERS[model])
+
+
+def _artists(artist_to_idx):
+    """artist_to_idx (1부터 연속) → 인덱스 순 아티스트 목록"""
+    return sorted(artist_to_idx, key=artist_to_idx.get)
+
+
+def build_module(model, ckpt):
+    """체크포인트 → (nn.Module, 추론 메타데이터)"""
+    trainer = _trainer(model)
+    if model == 'ncf':
+        if 'vocab' not in ckpt:
+            raise ValueError("track_id_map 형식의 이전 체크포인트는 재학습 필요")
+        module = trainer.NCF(ckpt['num_tracks'], ckpt['embedding_dim'], ckpt['hidden_layers'])
+        meta = {'vocab': ckpt['vocab']}
+    elif model == 'ncf_multi':
+        module = trainer.MultiUserNCF(ckpt['num_users'], ckpt['num_tracks'], ckpt['embedding_dim'],
+                                      ckpt['hidden_layers'])
+        meta = {'track_vocab': ckpt['track_vocab'], 'user_vocab': ckpt['user_vocab']}
+    elif model == 'hybrid':
+        artists = _artists(ckpt['artist_to_idx'])
+        module = trainer.HybridRecommender(len(artists) + 1, trainer.ARTIST_EMBEDDING_DIM,
+                                           trainer.HIDDEN_LAYERS[0])
+        meta = {'artists': artists}
+    else:
+        artists = _artists(ckpt['artist_to_idx'])
+        module = trainer.Track2Vec(len(artists), trainer.ARTIST_DIM, ckpt['embedding_dim'])
+        meta = {'artists': artists, 'index': ckpt.get('index')}
+
+    module.load_state_dict(ckpt['model_state_dict'])
+    meta['model'] = model
+    if 'user_id' in ckpt:
+        meta['user_id'] = ckpt['user_id']
+    return module, meta
+
+
+def export_user(model, user_id, model_dir=MODEL_DIR):
+    """체크포인트 하나를 변환 → 아티팩트 경로 (체크포인트 없음 → FileNotFoundError)"""
+    path = os.path.join(model_dir, CHECKPOINT_FILES[model].format(user_id))
+    module, meta = build_module(model, load_checkpoint(path))
+    out_path = scripted_path(path)
+    export_scripted(module, out_path, meta)
+    return out_path
+
+
+def trained_users(model, model_dir=MODEL_DIR):
+    if not is_per_user(model):
+        path = os.path.join(model_dir, CHECKPOINT_FILES[model])
+        if not os.path.exists(path):
+            return []
+        return load_vocab(load_checkpoint(path)['user_vocab'], model_dir).tolist()
+    pattern = re.compile('^' + CHECKPOINT_FILES[model].replace('.', r'\.').format(r'(\d+)') + '$')
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(model_dir)) if m)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='체크포인트 → TorchScript 아티팩트 변환')
+    parser.add_argument('--model', choices=sorted(CHECKPOINT_FILES), action='append',
+                        help='변환할 모델 (여러 번 지정 가능, 기본: 전체)')
+    parser.add_argument('--users', help='쉼표로 구분된 사용자 ID (기본: 체크포인트가 있는 사용자 전체)')
+    args = parser.parse_args()
+
+    for model in args.model or sorted(CHECKPOINT_FILES):
+        if not is_per_user(model):
+            user_ids = [None]  # 공용 체크포인트는 한 번만 변환
+        elif args.users:
+            user_ids = [int(u) for u in args.users.split(',')]
+        else:
+            user_ids = trained_users(model)
+        for user_id in user_ids:
+            try:
+                print(f"  [OK] {export_user(model, user_id)}")
+            except FileNotFoundError:
+                print(f"  [SKIP] {model} user {user_id}: 체크포인트 없음")
+            except ValueError as e:
+                print(f"  [SKIP] {model} user {user_id}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+트랙 콘텐츠 특성 인코딩 (Hybrid / Track2Vec 공용)
+
+- FeatureEncoder: 아티스트 → 모델 인덱스 (0 = 미상), popularity/duration 정규화
+- EncodedTracks: 카탈로그 row에 정렬된 인코딩 배열 (artist_idx, popularity, duration)
+- load_encoded_tracks: 카탈로그 인코딩 테이블을 MODEL_DIR에 캐시
+"""
+
+import os
+import zipfile
+
+import numpy as np
+import torch
+
+ENCODED_TRACKS_FILE = 'encoded_tracks.npz'
+
+
+class FeatureEncoder:
+    def __init__(self, artists):
+        self.artist_to_idx = {a: i+1 for i, a in enumerate(artists)}
+        self.num_artists = len(artists) + 1
+
+    def encode_track(self, track):
+        """트랙을 특성 벡터로 인코딩"""
+        artist_idx = self.artist_to_idx.get(track.get('artist'), 0)
+        popularity = (track.get('popularity') or 50) / 100.0
+        duration = min((track.get('duration') or 240) / 600.0, 1.0)
+        return {
+            'artist_idx': artist_idx,
+            'popularity': popularity,
+            'duration': duration
+        }
+
+    def encode_catalog(self, catalog):
+        """카탈로그 전체를 row 정렬된 배열로 한 번에 인코딩 (encode_track과 같은 규칙)"""
+        # 카탈로그 아티스트 코드 → 모델 artist_idx (코드 -1 = 아티스트 없음 → 마지막 원소 0)
+        code_to_idx = np.array(
+            [self.artist_to_idx.get(a, 0) for a in catalog.artists.tolist()] + [0],
+            dtype=np.int32
+        )
+        popularity = np.asarray(catalog.popularity, dtype=np.float32)
+        duration = np.asarray(catalog.duration, dtype=np.float32)
+
+        # NULL/0은 기본값 (encode_track의 `or` 규칙과 동일)
+        popularity = np.where(np.isnan(popularity) | (popularity == 0), 50, popularity) / 100.0
+        duration = np.minimum(np.where(np.isnan(duration) | (duration == 0), 240, duration) / 600.0, 1.0)
+
+        return EncodedTracks(
+            code_to_idx[catalog.artist_codes],
+            popularity.astype(np.float32),
+            duration.astype(np.float32)
+        )
+
+
+class EncodedTracks:
+    """카탈로그 row에 정렬된 인코딩 특성 테이블 (artist_idx int32, popularity/duration float32)"""
+
+    def __init__(self, artist_idx, popularity, duration):
+        self.artist_idx = artist_idx
+        self.popularity = popularity
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.artist_idx)
+
+    def tensors(self, rows):
+        """row 배열 → 모델 입력 텐서 dict"""
+        rows = np.asarray(rows, dtype=np.int64)
+        return {
+            'artist': torch.from_numpy(self.artist_idx[rows].astype(np.int64)),
+            'pop': torch.from_numpy(self.popularity[rows]),
+            'dur': torch.from_numpy(self.duration[rows]),
+        }
+
+    def save(self, path, key):
+        """같은 디렉터리의 임시 파일에 쓴 뒤 교체 (동시에 읽고 쓰는 배치 워커가 반쯤 쓰인 파일을 보지 않도록)"""
+        tmp_path = f'{path}.tmp.{os.getpid()}.npz'
+        np.savez(tmp_path, key=key, artist_idx=self.artist_idx,
+                 popularity=self.popularity, duration=self.duration)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, key):
+        """저장된 key가 일치할 때만 로드 (불일치/없음 → None)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if not np.array_equal(data['key'], key):
+                    return None
+                return cls(data['artist_idx'], data['popularity'], data['duration'])
+        except (zipfile.BadZipFile, KeyError, EOFError, ValueError):
+            return None  # 이전 버전이 쓰다 만 파일 → 다시 인코딩
+
+
+_encoded_cache = {}
+
+
+def load_encoded_tracks(encoder, catalog, model_dir):
+    """카탈로그 인코딩 테이블을 model_dir에 캐시 (트랙 컬럼 변경 시각/크기, 아티스트 수로 검증)
+
+    refreshed_at(DB 확인 시각)이 아니라 트랙 컬럼이 실제로 바뀐 시각을 키로 쓴다
+    (플레이리스트만 바뀌거나 변경 없는 갱신이면 저장된 테이블을 그대로 사용)
+    """
+    meta = catalog.meta or {}
+    key = np.array([
+        meta.get('tracks_changed_at', meta.get('refreshed_at', 0.0)),
+        catalog.num_tracks,
+        encoder.num_artists
+    ], dtype=np.float64)
+    cache_key = (model_dir, key.tobytes())
+    if cache_key in _encoded_cache:
+        return _encoded_cache[cache_key]
+
+    path = os.path.join(model_dir, ENCODED_TRACKS_FILE)
+    table = EncodedTracks.load(path, key)
+    if table is None:
+        table = encoder.encode_catalog(catalog)
+        os.makedirs(model_dir, exist_ok=True)
+        table.save(path, key)
+
+    _encoded_cache[cache_key] = table
+    return table
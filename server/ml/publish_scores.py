@@ -0,0 +1,154 @@
+"""
+모델 점수 → track_scored_id / playlist_scored_id 일괄 반영
+
+사용자별 체크포인트로 EMS 후보 전체 점수(0-100)를 계산해 MySQL에 직접 기록한다.
+- 트랙 점수: 모델 점수 그대로
+- 플레이리스트 점수: EMS 플레이리스트에 담긴 트랙 점수의 평균
+- 기존 점수를 한 번에 읽어 DECIMAL(5,2) 기준으로 비교, 바뀐 행만 기록
+- 후보에서 빠진 키(같은 score_type)의 기존 행은 삭제
+- 기록은 multi-row INSERT ... ON DUPLICATE KEY UPDATE + DELETE (사용자·테이블당 한 트랜잭션)
+
+실행: cd server/ml && python publish_scores.py --model ncf [--users 3,5,7] [--score-type personalized]
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from catalog import SPACE_CODES, load_catalog
+from db import Column, fetch_columns, sync_rows
+from serve import SCORERS, ModelRegistry
+from train_batch import pms_users
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+DEFAULT_SCORE_TYPE = 'personalized'
+
+SCORE_TABLES = {
+    'track': ('track_scored_id', 'track_id'),
+    'playlist': ('playlist_scored_id', 'playlist_id'),
+}
+
+# ============================================
+# 점수 계산
+# ============================================
+def to_cents(scores):
+    """0-100 점수 → DECIMAL(5,2)와 같은 단위의 정수 (0.01 단위)"""
+    return np.clip(np.round(np.asarray(scores, dtype=np.float64) * 100), 0, 10000).astype(np.int64)
+
+
+def playlist_scores(catalog, track_ids, scores):
+    """EMS 플레이리스트별 트랙 점수 평균 (점수가 있는 트랙만 집계)"""
+    ems_playlists = catalog.playlist_ids[catalog.playlist_spaces == SPACE_CODES['EMS']]
+    member = np.isin(catalog.member_playlists, ems_playlists)
+    playlists = catalog.member_playlists[member]
+    tracks = catalog.member_tracks[member]
+
+    if not len(track_ids):
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    order = np.argsort(track_ids)
+    sorted_ids = np.asarray(track_ids)[order]
+    pos = np.clip(np.searchsorted(sorted_ids, tracks), 0, len(sorted_ids) - 1)
+    hit = sorted_ids[pos] == tracks
+
+    ids, inverse = np.unique(playlists[hit], return_inverse=True)
+    sums = np.bincount(inverse, weights=np.asarray(scores, dtype=np.float64)[order][pos[hit]],
+                       minlength=len(ids))
+    counts = np.bincount(inverse, minlength=len(ids))
+    return ids, sums / np.maximum(counts, 1)
+
+# ============================================
+# 기록
+# ============================================
+def diff_existing(table, key_column, user_id, keys, cents, score_type):
+    """기존 행과 비교 → (바뀐 키 mask: 점수/타입이 같으면 False, 후보에서 빠진 같은 타입의 기존 키)"""
+    existing = fetch_columns(
+        f"SELECT {key_column}, ai_score, score_type FROM {table} WHERE user_id = %s",
+        [Column(key_column, np.int64), Column('ai_score', np.float64, default=-1),
+         Column('score_type', object)],
+        (user_id,)
+    )
+    if not len(existing[key_column]):
+        return np.ones(len(keys), dtype=bool), np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(existing[key_column])
+    old_keys = existing[key_column][order]
+    old_cents = to_cents(existing['ai_score'][order])
+    old_types = existing['score_type'][order]
+
+    pos = np.clip(np.searchsorted(old_keys, keys), 0, len(old_keys) - 1)
+    same = (old_keys[pos] == keys) & (old_cents[pos] == cents) & (old_types[pos] == score_type)
+    stale = old_keys[(old_types == score_type) & ~np.isin(old_keys, keys)]
+    return ~same, stale
+
+
+def publish(kind, user_id, keys, scores, score_type=DEFAULT_SCORE_TYPE):
+    """한 사용자의 점수를 기록하고 (기록 행 수, 변경 없음 행 수, 삭제 행 수) 반환"""
+    table, key_column = SCORE_TABLES[kind]
+    keys = np.asarray(keys, dtype=np.int64)
+    cents = to_cents(scores)
+
+    changed, stale = diff_existing(table, key_column, user_id, keys, cents, score_type)
+    now = datetime.now().replace(microsecond=0)
+    rows = [(key, user_id, cent / 100, score_type, now)
+            for key, cent in zip(keys[changed].tolist(), cents[changed].tolist())]
+
+    written, deleted = sync_rows(table, [key_column, 'user_id', 'ai_score', 'score_type', 'calculated_at'],
+                                 rows, ['ai_score', 'score_type', 'calculated_at'],
+                                 key_column, stale.tolist(), "user_id = %s AND score_type = %s",
+                                 (user_id, score_type))
+    return written, len(keys) - written, deleted
+
+
+def publish_user(registry, model, user_id, score_type=DEFAULT_SCORE_TYPE):
+    loaded = registry.get(model, user_id)
+    track_ids, scores = loaded.scorer.all_scores()
+    registry.unload(model, user_id)  # 사용자 수만큼 모델이 메모리에 쌓이지 않도록
+
+    result = {'track': publish('track', user_id, track_ids, scores, score_type)}
+    # 플레이리스트 멤버십은 점수를 계산한 모델과 같은 스냅샷 기준
+    result['playlist'] = publish('playlist', user_id,
+                                 *playlist_scores(loaded.catalog, track_ids, scores), score_type)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='모델 점수 DB 일괄 반영')
+    parser.add_argument('--model', choices=sorted(SCORERS), default='ncf')
+    parser.add_argument('--users', help='쉼표로 구분된 사용자 ID (기본: PMS 보유 사용자 전체)')
+    parser.add_argument('--score-type', default=DEFAULT_SCORE_TYPE)
+    args = parser.parse_args()
+
+    catalog = load_catalog()
+    registry = ModelRegistry(catalog)
+    user_ids = [int(u) for u in args.users.split(',')] if args.users else pms_users(catalog)
+
+    print("=" * 60)
+    print(f"[Publish] {args.model} - 사용자 {len(user_ids)}명")
+    print("=" * 60)
+
+    started = time.time()
+    totals = {'track': [0, 0, 0], 'playlist': [0, 0, 0]}
+    for user_id in user_ids:
+        try:
+            result = publish_user(registry, args.model, user_id, args.score_type)
+        except (FileNotFoundError, LookupError):
+            print(f"  user {user_id}: 체크포인트 없음 - skip")
+            continue
+        for kind, counts in result.items():
+            totals[kind] = [t + c for t, c in zip(totals[kind], counts)]
+        print(f"  user {user_id}: " + ", ".join(
+            f"{kind} {written:,} 기록 / {unchanged:,} 변경 없음 / {deleted:,} 삭제"
+            for kind, (written, unchanged, deleted) in result.items()))
+
+    print(f"\n[DONE] {time.time() - started:.1f}s")
+    for kind, (written, unchanged, deleted) in totals.items():
+        print(f"   - {SCORE_TABLES[kind][0]}: {written:,} 기록, {unchanged:,} 변경 없음, {deleted:,} 삭제")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+임베딩 테이블 int8 양자화 (서빙용 post-training quantization)
+
+- QuantizedEmbedding: int8 가중치 + 행별 float32 scale, gather한 행만 float로 복원
+- quantize_embeddings: 모델 안의 nn.Embedding을 모두 QuantizedEmbedding으로 교체 (메모리 약 1/4)
+- 리포트: 같은 EMS 후보에 대해 float 모델과 양자화 모델의 top-k 겹침 비율, 점수 오차, 테이블 크기
+
+--apply를 주면 겹침 비율이 --min-overlap 이상인 사용자만 양자화 모델로 추론 아티팩트(.ts)를 교체
+(추론 서버는 아티팩트 mtime 변경을 감지해 자동으로 교체)
+ncf_multi처럼 전체 사용자 공용 아티팩트는 한 번만 양자화해 사용자별로 비교하고,
+비교한 사용자 중 최소 겹침 비율이 기준 이상일 때만 한 번 교체한다.
+이전 형식 등으로 변환할 수 없는 체크포인트는 리포트에 error로 기록하고 다음 사용자로 넘어간다.
+
+실행: cd server/ml && python quantize.py --model ncf [--users 3,5] [--k 30] [--apply]
+"""
+
+import os
+import sys
+import copy
+import json
+import argparse
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from catalog import load_catalog
+from checkpoint import CHECKPOINT_FILES, export_scripted, is_per_user, load_checkpoint, scripted_path
+from ranking import top_indices
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')
+REPORT_FILE = 'quantization_report.json'
+
+
+class QuantizedEmbedding(nn.Module):
+    """행별 대칭 int8 양자화 임베딩 (weight ≈ weight_int8 * scale[:, None])"""
+
+    def __init__(self, weight_int8, scale):
+        super().__init__()
+        self.register_buffer('weight_int8', weight_int8)
+        self.register_buffer('scale', scale)
+
+    @classmethod
+    def from_embedding(cls, embedding):
+        weight = embedding.weight.detach().float().cpu()
+        scale = weight.abs().amax(dim=1) / 127.0
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        weight_int8 = torch.round(weight / scale.unsqueeze(1)).clamp(-127, 127).to(torch.int8)
+        return cls(weight_int8, scale)
+
+    def forward(self, idx: torch.Tensor) -> torch.Tensor:
+        return self.weight_int8[idx].float() * self.scale[idx].unsqueeze(-1)
+
+
+def quantize_embeddings(model):
+    """nn.Embedding을 QuantizedEmbedding으로 교체한 복사본 (원본은 그대로)"""
+    model = copy.deepcopy(model).cpu().eval()
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, nn.Embedding):
+                setattr(parent, name, QuantizedEmbedding.from_embedding(child))
+    return model
+
+
+def embedding_bytes(model):
+    """임베딩 테이블(float 또는 int8+scale)이 차지하는 바이트 수"""
+    total = 0
+    for module in model.modules():
+        if isinstance(module, nn.Embedding):
+            total += module.weight.numel() * module.weight.element_size()
+        elif isinstance(module, QuantizedEmbedding):
+            total += module.weight_int8.numel() + module.scale.numel() * module.scale.element_size()
+    return total
+
+# ============================================
+# Report
+# ============================================
+def topk_overlap(float_scores, quant_scores, k):
+    k = min(k, len(float_scores))
+    if not k:
+        return 1.0
+    return len(np.intersect1d(top_indices(float_scores, k), top_indices(quant_scores, k))) / k
+
+
+def compare(model, user_id, module, quantized, meta, catalog, k):
+    """같은 후보에 대한 float / int8 점수 비교 (Track2Vec은 EMS 임베딩도 각 모델로 다시 계산)"""
+    from serve import SCORERS  # 후보 구성/점수 계산은 추론 서버와 동일하게
+
+    meta = dict(meta, index=None)
+    with torch.no_grad():
+        ids_f, scores_f = SCORERS[model](module.cpu().eval(), meta, catalog, user_id).all_scores()
+        ids_q, scores_q = SCORERS[model](quantized, meta, catalog, user_id).all_scores()
+
+    # Track2Vec은 인덱스 저장 순서가 모델마다 다르므로 track_id 순으로 정렬
+    order_f, order_q = np.argsort(ids_f), np.argsort(ids_q)
+    scores_f, scores_q = np.asarray(scores_f)[order_f], np.asarray(scores_q)[order_q]
+
+    return {
+        'model': model,
+        'user_id': user_id,
+        'candidates': len(scores_f),
+        'k': k,
+        'topk_overlap': round(topk_overlap(scores_f, scores_q, k), 4),
+        'max_abs_score_diff': round(float(np.abs(scores_f - scores_q).max()), 4) if len(scores_f) else 0.0,
+        'embedding_bytes_float': embedding_bytes(module),
+        'embedding_bytes_int8': embedding_bytes(quantized),
+    }
+
+
+def load_quantized(model, path):
+    """체크포인트 → (float 모듈, int8 양자화 모듈, 메타데이터)"""
+    from export_models import build_module
+
+    module, meta = build_module(model, load_checkpoint(path))
+    return module, quantize_embeddings(module), meta
+
+
+def quantize_user(model, user_id, catalog, k=30, apply=False, min_overlap=0.9, model_dir=MODEL_DIR):
+    """사용자별 모델: 비교 후 기준을 넘으면 그 사용자의 아티팩트만 교체"""
+    path = os.path.join(model_dir, CHECKPOINT_FILES[model].format(user_id))
+    module, quantized, meta = load_quantized(model, path)
+
+    row = compare(model, user_id, module, quantized, meta, catalog, k)
+    row['applied'] = bool(apply and row['topk_overlap'] >= min_overlap)
+    if row['applied']:
+        export_scripted(quantized, scripted_path(path), dict(meta, quantized='int8'))
+    return row
+
+
+def quantize_shared(model, user_ids, catalog, k=30, apply=False, min_overlap=0.9, model_dir=MODEL_DIR):
+    """공용 모델(ncf_multi): 한 번 양자화해 사용자별로 비교하고, 최소 겹침 비율로 교체를 한 번만 결정
+
+    사용자마다 교체를 결정하면 마지막 사용자가 모든 사용자의 아티팩트를 정하게 되므로
+    가장 나쁜 사용자 기준으로 판단한다. 반환: 사용자별 리포트 행 (비교 실패는 error 행)
+    """
+    path = os.path.join(model_dir, CHECKPOINT_FILES[model])
+    module, quantized, meta = load_quantized(model, path)
+
+    rows = []
+    for user_id in user_ids:
+        try:
+            rows.append(compare(model, user_id, module, quantized, meta, catalog, k))
+        except (LookupError, ValueError) as e:
+            rows.append(error_row(model, user_id, e))
+        _print_row(rows[-1], k)
+
+    overlaps = [r['topk_overlap'] for r in rows if 'error' not in r]
+    applied = bool(apply and overlaps and min(overlaps) >= min_overlap)
+    if applied:
+        export_scripted(quantized, scripted_path(path), dict(meta, quantized='int8'))
+    for row in rows:
+        if 'error' not in row:
+            row['applied'] = applied
+    if overlaps:
+        print(f"\n  공용 아티팩트: 최소 overlap@{k} {min(overlaps):.3f} → "
+              f"{'양자화 모델로 교체' if applied else '교체 안 함'}")
+    return rows
+
+
+def error_row(model, user_id, error):
+    return {'model': model, 'user_id': user_id, 'error': f'{type(error).__name__}: {error}'}
+
+
+def _print_row(row, k):
+    if 'error' in row:
+        print(f"  [ERROR] user {row['user_id']}: {row['error']}")
+        return
+    print(f"  user {row['user_id']}: overlap@{k} {row['topk_overlap']:.3f}, "
+          f"max |Δscore| {row['max_abs_score_diff']:.3f}, "
+          f"embedding {row['embedding_bytes_float'] / 1e6:.2f}MB → {row['embedding_bytes_int8'] / 1e6:.2f}MB"
+          f"{' (applied)' if row.get('applied') else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='임베딩 테이블 int8 양자화 + top-k 겹침 리포트')
+    parser.add_argument('--model', choices=sorted(CHECKPOINT_FILES), default='ncf')
+    parser.add_argument('--users', help='쉼표로 구분된 사용자 ID (기본: 체크포인트가 있는 사용자 전체)')
+    parser.add_argument('--k', type=int, default=30)
+    parser.add_argument('--apply', action='store_true', help='기준을 넘는 사용자의 추론 아티팩트를 양자화 모델로 교체')
+    parser.add_argument('--min-overlap', type=float, default=0.9)
+    args = parser.parse_args()
+
+    from export_models import trained_users
+
+    catalog = load_catalog()
+    user_ids = [int(u) for u in args.users.split(',')] if args.users else trained_users(args.model, MODEL_DIR)
+
+    print("=" * 60)
+    print(f"[Quantize] {args.model} - 사용자 {len(user_ids)}명, top-{args.k} 겹침 비교")
+    print("=" * 60)
+
+    report = []
+    if is_per_user(args.model):
+        for user_id in user_ids:
+            try:
+                row = quantize_user(args.model, user_id, catalog, args.k, args.apply, args.min_overlap)
+            except FileNotFoundError:
+                print(f"  [SKIP] user {user_id}: 체크포인트 없음")
+                continue
+            except (ValueError, KeyError, LookupError) as e:
+                # 이전 형식 체크포인트 등 → 기록하고 나머지 사용자는 계속
+                row = error_row(args.model, user_id, e)
+            report.append(row)
+            _print_row(row, args.k)
+    else:
+        try:
+            report = quantize_shared(args.model, user_ids, catalog, args.k, args.apply, args.min_overlap)
+        except FileNotFoundError:
+            print(f"  [SKIP] {args.model}: 체크포인트 없음")
+        except (ValueError, KeyError) as e:
+            print(f"  [ERROR] {args.model}: {type(e).__name__}: {e}")
+
+    overlaps = [r['topk_overlap'] for r in report if 'error' not in r]
+    if overlaps:
+        print(f"\n[DONE] 평균 overlap@{args.k}: {np.mean(overlaps):.3f}")
+    if report:
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        with open(os.path.join(MODEL_DIR, REPORT_FILE), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
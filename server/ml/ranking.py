@@ -0,0 +1,78 @@
+"""
+공용 top-k 선택 (v2–v5, NCF, Hybrid, Track2Vec, 추론 서버)
+
+- top_indices: 점수 벡터 → argpartition으로 상위 k개만 고른 뒤 그 k개만 정렬
+  (include / exclude 마스크로 후보 제한: EMS만, 이미 아는 트랙 제외, 자기 자신 제외 등)
+- block_top_k: (질의 × 후보) 점수를 블록 단위로 계산하며 행별 top-k만 유지 (O(Q·k) 메모리)
+
+결과 dict/레코드는 호출 측에서 반환된 k개 위치에 대해서만 만든다.
+외부 의존성은 NumPy뿐이므로 server/ 루트 스크립트에서도 `from ml.ranking import ...`로 사용 가능.
+"""
+
+import numpy as np
+
+QUERY_CHUNK = 256  # block_top_k: 한 번에 계산할 질의 행 수
+TARGET_CHUNK = 8192  # block_top_k: 한 번에 계산할 후보 열 수
+
+
+def _as_mask(n, positions):
+    positions = np.asarray(positions)
+    if positions.dtype == bool:
+        return positions
+    mask = np.zeros(n, dtype=bool)
+    mask[positions] = True
+    return mask
+
+
+def candidate_mask(n, include=None, exclude=None):
+    """include: 후보로 허용할 위치, exclude: 제외할 위치 (각각 bool 마스크 또는 인덱스, None = 제한 없음) → bool (n,)"""
+    mask = _as_mask(n, include).copy() if include is not None else np.ones(n, dtype=bool)
+    if exclude is not None:
+        mask &= ~_as_mask(n, exclude)
+    return mask
+
+
+def top_indices(scores, k, include=None, exclude=None):
+    """scores (N,) → 상위 최대 k개 위치 (점수 내림차순)"""
+    scores = np.asarray(scores)
+    if include is not None or exclude is not None:
+        positions = np.flatnonzero(candidate_mask(len(scores), include, exclude))
+        return positions[top_indices(scores[positions], k)]
+
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def block_top_k(score_block, num_queries, num_targets, k,
+                query_chunk=QUERY_CHUNK, target_chunk=TARGET_CHUNK):
+    """score_block(q_start, q_end, t_start, t_end) → 조밀한 (q, t) 점수 블록.
+
+    블록마다 행별 top-k에 병합 → (scores, targets) 각각 (Q, k), 점수 내림차순.
+    후보가 k개 미만이면 나머지는 -inf / -1.
+    """
+    best_scores = np.full((num_queries, k), -np.inf)
+    best_targets = np.full((num_queries, k), -1, dtype=np.int64)
+    if k <= 0:
+        return best_scores, best_targets
+
+    for q_start in range(0, num_queries, query_chunk):
+        q_end = min(q_start + query_chunk, num_queries)
+        top_scores = best_scores[q_start:q_end]
+        top_targets = best_targets[q_start:q_end]
+
+        for t_start in range(0, num_targets, target_chunk):
+            t_end = min(t_start + target_chunk, num_targets)
+            block = np.asarray(score_block(q_start, q_end, t_start, t_end), dtype=np.float64)
+
+            # 기존 top-k와 이번 블록을 이어붙여 다시 k개만 남김
+            scores = np.hstack([top_scores, block])
+            targets = np.hstack([top_targets, np.broadcast_to(np.arange(t_start, t_end), block.shape)])
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores[:] = np.take_along_axis(scores, keep, axis=1)
+            top_targets[:] = np.take_along_axis(targets, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_targets, order, axis=1)
@@ -0,0 +1,403 @@
+"""
+추천 추론 서버 (상주 프로세스)
+
+학습이 끝난 사용자별 추론 아티팩트(.ts, TorchScript)를 한 번만 로드해 메모리에 두고,
+요청마다 EMS 후보 전체에 대한 배치 forward 한 번으로 top-k를 반환한다.
+- 학습 모듈을 import하지 않음 (아티팩트가 없을 때만 export_models로 .pt에서 변환)
+- 카탈로그 스냅샷은 mmap으로 열고, 다른 프로세스(학습/catalog.py)가 스냅샷 내용을 바꾸면 새 버전을 연다
+  (내용 버전 비교 — 변경 없는 갱신으로 버전 디렉터리만 바뀐 경우는 다시 열지 않음)
+- 아티팩트 mtime이 바뀐 모델만 새로 로드한 뒤 참조만 교체 (그때의 최신 카탈로그 사용)
+  이미 로드된 모델은 카탈로그가 바뀌어도 자기를 만든 카탈로그를 계속 사용 (후보 row가 그 스냅샷 기준)
+- Track2Vec은 학습 시 저장된 IVF 인덱스(mmap, id = track_id)로 프로필 → 카탈로그 검색
+- ncf_multi는 전체 사용자 공용 아티팩트 1개를 모든 사용자 Scorer가 공유 (user_embedding 조회)
+- 백그라운드 스레드가 로드된 아티팩트를 주기적으로 확인해 미리 교체
+
+API:
+  GET /health
+  GET /recommendations/<ncf|hybrid|embedding|ncf_multi>/<user_id>?limit=30
+
+실행: cd server/ml && python serve.py [--port 8765 | --socket /tmp/ml.sock] [--poll 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import traceback
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import torch
+
+from ann import IVFIndex, mean_direction
+from batching import batched_outputs, batched_scores
+from catalog import SNAPSHOT_DIR, load_catalog, open_snapshot, snapshot_changed
+from checkpoint import CHECKPOINT_FILES, is_per_user, load_scripted, load_vocab, scripted_path, vocab_lookup
+from features import FeatureEncoder, load_encoded_tracks
+from ranking import top_indices
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')
+INFERENCE_BATCH_SIZE = 4096
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 500
+
+RECORD_FIELDS = ['track_id', 'title', 'artist', 'album', 'popularity', 'artwork']
+
+# ============================================
+# 모델별 Scorer (아티팩트 1개 = Scorer 1개)
+# ============================================
+def _top_records(catalog, rows, scores, top_k, score_key):
+    """점수(0-1) 상위 top_k row → 추천 결과 dict 리스트"""
+    if not len(rows):
+        return []
+    scores = scores.numpy()
+    top = top_indices(scores, top_k)
+    results = catalog.records(np.asarray(rows)[top], RECORD_FIELDS)
+    for r, score in zip(results, scores[top].tolist()):
+        r[score_key] = round(score * 100, 2)
+    return results
+
+
+class NCFScorer:
+    score_key = 'ncf_score'
+
+    def __init__(self, module, meta, catalog, user_id):
+        self.module = module
+        self.catalog = catalog
+
+        # 후보(EMS 중 학습 당시 vocabulary에 있던 트랙)와 매핑 ID를 로드 시 한 번만 계산
+        ems_rows = catalog.playlist_track_rows('EMS')
+        mapped = vocab_lookup(load_vocab(meta['vocab'], MODEL_DIR), catalog.track_ids[ems_rows])
+        known = mapped > 0
+        self.rows = ems_rows[known]
+        self.mapped_ids = torch.from_numpy(mapped[known])
+
+    def _scores(self):
+        return batched_scores(self.module, self.mapped_ids,
+                              batch_size=INFERENCE_BATCH_SIZE, device=DEVICE)
+
+    def recommend(self, top_k):
+        if not len(self.rows):
+            return []
+        return _top_records(self.catalog, self.rows, self._scores(), top_k, self.score_key)
+
+    def all_scores(self):
+        """후보 전체의 (track_ids, 0-100 점수)"""
+        return self.catalog.track_ids[self.rows], self._scores().numpy() * 100
+
+
+class HybridScorer:
+    score_key = 'dl_score'
+
+    def __init__(self, module, meta, catalog, user_id):
+        self.module = module
+        self.catalog = catalog
+        self.rows = catalog.playlist_track_rows('EMS')
+        self.feats = load_encoded_tracks(FeatureEncoder(meta['artists']), catalog, MODEL_DIR).tensors(self.rows)
+
+    def _scores(self):
+        return batched_scores(self.module, self.feats['artist'], self.feats['pop'], self.feats['dur'],
+                              batch_size=INFERENCE_BATCH_SIZE, device=DEVICE)
+
+    def recommend(self, top_k):
+        if not len(self.rows):
+            return []
+        return _top_records(self.catalog, self.rows, self._scores(), top_k, self.score_key)
+
+    def all_scores(self):
+        return self.catalog.track_ids[self.rows], self._scores().numpy() * 100
+
+
+class EmbeddingScorer:
+    score_key = 'similarity'
+
+    def __init__(self, module, meta, catalog, user_id):
+        self.catalog = catalog
+        table = load_encoded_tracks(FeatureEncoder(meta['artists']), catalog, MODEL_DIR)
+
+        def embed(rows):
+            feats = table.tensors(rows)
+            return batched_outputs(module, feats['artist'], feats['pop'], feats['dur'],
+                                   batch_size=INFERENCE_BATCH_SIZE, device=DEVICE).numpy()
+
+        # 프로필은 로드 시 한 번만 계산, 요청은 ANN 검색만 수행
+        self.profile = mean_direction(embed(catalog.playlist_track_rows('PMS', user_id)))
+
+        self.index = None
+        index_path = os.path.join(MODEL_DIR, meta.get('index') or '')
+        if meta.get('index') and os.path.exists(index_path):
+            try:
+                self.index = IVFIndex.load(index_path)
+            except ValueError:
+                print(f"[WARN] {index_path}: 이전 형식 인덱스 - 다시 생성")
+        if self.index is None:
+            ems_rows = catalog.playlist_track_rows('EMS')
+            self.index = IVFIndex.build(embed(ems_rows), catalog.track_ids[ems_rows])
+
+    def _found(self, scores, track_ids):
+        """인덱스 id(track_id) → 현재 카탈로그 row (인덱스 생성 후 삭제된 트랙은 제외)"""
+        rows = self.catalog.rows_of(track_ids)
+        found = rows >= 0
+        return scores[found], rows[found]
+
+    def recommend(self, top_k):
+        scores, rows = self._found(*self.index.search(self.profile, top_k))
+        results = self.catalog.records(rows, RECORD_FIELDS)
+        for r, score in zip(results, scores.tolist()):
+            r[self.score_key] = round(score * 100, 2)
+        return results
+
+    def all_scores(self):
+        scores, rows = self._found(*self.index.score_all(self.profile))
+        return self.catalog.track_ids[rows], scores * 100
+
+
+class MultiNCFScorer(NCFScorer):
+    """전체 사용자 공용 NCF: 후보는 NCFScorer와 같고, user 인덱스 하나를 후보 수만큼 broadcast"""
+
+    def __init__(self, module, meta, catalog, user_id):
+        super().__init__(module, dict(meta, vocab=meta['track_vocab']), catalog, user_id)
+        user_idx = int(vocab_lookup(load_vocab(meta['user_vocab'], MODEL_DIR), [user_id])[0])
+        if not user_idx:
+            raise LookupError(f'user {user_id} is not in the ncf_multi user vocabulary')
+        self.user = torch.tensor([user_idx], dtype=torch.long, device=DEVICE)
+
+    def _scores(self):
+        return batched_scores(lambda tracks: self.module(self.user.expand(len(tracks)), tracks),
+                              self.mapped_ids, batch_size=INFERENCE_BATCH_SIZE, device=DEVICE)
+
+
+SCORERS = {
+    'ncf': NCFScorer,
+    'hybrid': HybridScorer,
+    'embedding': EmbeddingScorer,
+    'ncf_multi': MultiNCFScorer,
+}
+
+# ============================================
+# 모델 레지스트리 (hot-swap)
+# ============================================
+class LoadedModel:
+    def __init__(self, scorer, path, mtime_ns, catalog):
+        self.scorer = scorer
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.catalog = catalog  # scorer의 후보 row / 결과 레코드가 가리키는 스냅샷
+        self.loaded_at = datetime.now().isoformat()
+
+
+class ModelRegistry:
+    def __init__(self, catalog, model_dir=MODEL_DIR, catalog_path=SNAPSHOT_DIR):
+        self._catalog = catalog
+        self.catalog_path = catalog_path
+        self.model_dir = model_dir
+        self._models = {}  # (model, user_id) -> LoadedModel
+        self._shared = {}  # 공용 아티팩트 경로 -> (mtime_ns, module, meta)
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @property
+    def catalog(self):
+        """최신 카탈로그 (스냅샷 내용이 바뀌었으면 새 버전의 배열만 열어 교체, 이미 로드된 모델은 그대로)"""
+        if snapshot_changed(self._catalog, self.catalog_path):
+            with self._lock_for('catalog'):
+                if snapshot_changed(self._catalog, self.catalog_path):
+                    self._catalog = open_snapshot(self.catalog_path)
+                    print(f"[Serve] catalog reload: {os.path.basename(self._catalog.snapshot)} "
+                          f"(tracks: {self._catalog.num_tracks:,})")
+        return self._catalog
+
+    def artifact_path(self, model, user_id):
+        """추론 아티팩트 경로 (없고 체크포인트만 있으면 변환)"""
+        path = scripted_path(os.path.join(self.model_dir, CHECKPOINT_FILES[model].format(user_id)))
+        if not os.path.exists(path):
+            from export_models import export_user  # 이전 체크포인트 변환 시에만 학습 모듈 import
+            with self._lock_for((model, user_id)):
+                if not os.path.exists(path):
+                    export_user(model, user_id, self.model_dir)
+        return path
+
+    def _load_artifact(self, model, path, mtime_ns):
+        """사용자 공용 아티팩트(ncf_multi)는 모듈 1개를 모든 사용자가 공유"""
+        if is_per_user(model):
+            return load_scripted(path, DEVICE)
+        with self._lock_for(path):
+            shared = self._shared.get(path)
+            if shared is None or shared[0] != mtime_ns:
+                shared = (mtime_ns, *load_scripted(path, DEVICE))
+                self._shared[path] = shared
+            return shared[1], shared[2]
+
+    def get(self, model, user_id):
+        """최신 아티팩트 기준 LoadedModel 반환 (체크포인트 없음 → FileNotFoundError)
+
+        아티팩트 mtime이 바뀐 경우에만 새로 로드하고, 이때 최신 카탈로그를 사용한다.
+        """
+        key = (model, user_id)
+        path = self.artifact_path(model, user_id)
+        mtime_ns = os.stat(path).st_mtime_ns
+        current = self._models.get(key)
+        if current is not None and current.mtime_ns == mtime_ns:
+            return current
+
+        with self._lock_for(key):
+            current = self._models.get(key)
+            if current is not None and current.mtime_ns == mtime_ns:
+                return current
+            catalog = self.catalog
+            try:
+                module, meta = self._load_artifact(model, path, mtime_ns)
+                scorer = SCORERS[model](module, meta, catalog, user_id)
+                scorer.recommend(1)  # TorchScript 첫 호출(프로파일링) 비용을 교체 전에 지불
+            except Exception:
+                if current is None:
+                    raise
+                # 새 아티팩트를 못 읽으면 기존 모델로 계속 서비스
+                print(f"[WARN] {path} 로드 실패 - 기존 모델 유지")
+                traceback.print_exc()
+                return current
+            loaded = LoadedModel(scorer, path, mtime_ns, catalog)
+            self._models[key] = loaded  # 참조 교체 (원자적)
+            print(f"[Serve] {'reload' if current else 'load'}: {model} user {user_id}")
+            return loaded
+
+    def unload(self, model, user_id):
+        self._models.pop((model, user_id), None)
+
+    def refresh(self):
+        """로드된 모델 중 아티팩트가 갱신된 것을 미리 교체"""
+        for model, user_id in list(self._models):
+            try:
+                self.get(model, user_id)
+            except FileNotFoundError:
+                pass
+
+    def status(self):
+        return [{
+            'model': model,
+            'user_id': user_id,
+            'artifact': os.path.basename(loaded.path),
+            'catalog': os.path.basename(loaded.catalog.snapshot or ''),
+            'loaded_at': loaded.loaded_at,
+        } for (model, user_id), loaded in sorted(self._models.items())]
+
+
+def poll_checkpoints(registry, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            registry.refresh()
+        except Exception:
+            traceback.print_exc()
+
+# ============================================
+# HTTP
+# ============================================
+class RecommendationHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+
+        if parts == ['health']:
+            return self._send(200, {'status': 'ok', 'models': self.registry.status()})
+
+        if len(parts) != 3 or parts[0] != 'recommendations' or parts[1] not in SCORERS:
+            return self._send(404, {'error': 'not found'})
+        try:
+            user_id = int(parts[2])
+            limit = int(parse_qs(url.query).get('limit', [DEFAULT_LIMIT])[0])
+        except ValueError:
+            return self._send(400, {'error': 'user_id and limit must be integers'})
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        model = parts[1]
+        try:
+            started = time.perf_counter()
+            loaded = self.registry.get(model, user_id)
+            recommendations = loaded.scorer.recommend(limit)
+        except (FileNotFoundError, LookupError):
+            return self._send(404, {'error': f'no trained {model} model for user {user_id}'})
+        except Exception as e:
+            traceback.print_exc()
+            return self._send(500, {'error': str(e)})
+
+        self._send(200, {
+            'user_id': user_id,
+            'model': model,
+            'artifact': os.path.basename(loaded.path),
+            'loaded_at': loaded.loaded_at,
+            'generated_at': datetime.now().isoformat(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+            'recommendations': recommendations,
+        })
+
+    def address_string(self):
+        # Unix 소켓은 client_address가 비어 있음
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(registry, port=None, socket_path=None, host='127.0.0.1'):
+    handler = type('Handler', (RecommendationHandler,), {'registry': registry})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='추천 추론 서버')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('ML_SERVE_PORT', 8765)))
+    parser.add_argument('--socket', help='Unix 소켓 경로 (지정 시 TCP 대신 사용)')
+    parser.add_argument('--poll', type=float, default=5.0, help='체크포인트 확인 주기(초), 0 = 요청 시에만 확인')
+    parser.add_argument('--refresh', action='store_true', help='시작 시 카탈로그 스냅샷 증분 갱신')
+    args = parser.parse_args()
+
+    catalog = load_catalog(refresh=args.refresh)
+    registry = ModelRegistry(catalog)
+    if args.poll > 0:
+        threading.Thread(target=poll_checkpoints, args=(registry, args.poll), daemon=True).start()
+
+    server = make_server(registry, args.port, args.socket, args.host)
+    print("=" * 60)
+    print(f"[Serve] {args.socket or f'http://{args.host}:{args.port}'} (tracks: {catalog.num_tracks:,})")
+    print("=" * 60)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+카탈로그 증분 갱신 회귀 테스트
+
+DB(fetch_columns)를 메모리 테이블로 대체해, 변경이 없는 갱신은 스냅샷을 다시 쓰지 않고
+(워터마크 경계의 플레이리스트를 다시 읽어도) 내용이 바뀐 경우에만 변경 시각이 바뀌는지 확인한다.
+
+실행: cd server/ml && python -m pytest -q test_catalog_refresh.py
+"""
+
+import os
+
+import numpy as np
+
+import catalog
+from catalog import refresh_snapshot
+
+
+class FakeDB:
+    def __init__(self):
+        self.tracks = [(i, f'artist {i % 3}', float(i), 200.0, f'title {i}', None, None) for i in range(1, 11)]
+        self.playlists = [(1, 3, 'PMS', 100.0), (2, 0, 'EMS', 200.0)]
+        self.members = [(i, 1 + i % 2, i) for i in range(1, 11)]
+
+    def fetch_columns(self, sql, columns, params=None):
+        if 'COUNT(*)' in sql:
+            table = self.tracks if 'FROM tracks' in sql else self.members
+            rows = [(len(table), max((r[0] for r in table), default=0))]
+        elif 'FROM tracks' in sql:
+            rows = [r for r in self.tracks if r[0] > params[0]]
+        elif 'FROM playlist_tracks' in sql:
+            rows = [r for r in self.members if r[0] > params[0]]
+        elif sql.strip().startswith('SELECT playlist_id FROM playlists'):
+            rows = [r[:1] for r in self.playlists]
+        else:
+            rows = [r for r in self.playlists if not params or r[3] >= params[0]]
+        values = list(zip(*rows)) or [()] * len(columns)
+        return {c.name: np.array([np.nan if v is None and c.dtype != object else v for v in vals], dtype=c.dtype)
+                for c, vals in zip(columns, values)}
+
+
+def versions(path):
+    return sorted(name for name in os.listdir(path) if name.startswith('v'))
+
+
+def test_refresh_without_changes_keeps_snapshot(tmp_path, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(catalog, 'fetch_columns', db.fetch_columns)
+    path = str(tmp_path)
+
+    first = refresh_snapshot(path)
+    written = versions(path)
+
+    for _ in range(2):
+        meta = refresh_snapshot(path)
+        assert meta['refreshed_at'] == first['refreshed_at']
+        assert versions(path) == written
+
+    # 새 플레이리스트 → 경계에서 다시 읽힌 플레이리스트 2는 빼고 1개만 변경
+    db.playlists.append((3, 0, 'EMS', 300.0))
+    meta = refresh_snapshot(path)
+    assert meta['last_changes']['playlists'] == 1
+    assert meta['content_changed_at'] > first['content_changed_at']
+    assert meta['tracks_changed_at'] == first['tracks_changed_at']
+
+
+def test_periodic_track_reload_keeps_content_version(tmp_path, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(catalog, 'fetch_columns', db.fetch_columns)
+    path = str(tmp_path)
+    first = refresh_snapshot(path)
+
+    # 재적재 주기가 지났지만 트랙 값이 그대로 → 변경 시각 유지
+    monkeypatch.setattr(catalog, 'TRACKS_MAX_AGE', -1.0)
+    meta = refresh_snapshot(path)
+    assert meta['last_changes']['tracks'] == 0
+    assert meta['tracks_changed_at'] == first['tracks_changed_at']
+    assert meta['content_changed_at'] == first['content_changed_at']
+
+    # 기존 트랙의 메타데이터 변경 → 해당 row만 변경으로 셈
+    db.tracks[4] = (5, 'artist 2', 99.0, 200.0, 'renamed', None, None)
+    meta = refresh_snapshot(path)
+    assert meta['last_changes']['tracks'] == 1
+    assert meta['tracks_changed_at'] > first['tracks_changed_at']
+    assert catalog.open_snapshot(path).titles[4] == 'renamed'
@@ -0,0 +1,105 @@
+"""
+Track2Vec IVF 인덱스 id 회귀 테스트
+
+인덱스는 track_id를 id로 저장하므로, 인덱스 생성 후 카탈로그를 다시 덤프해
+row 위치가 바뀌어도(앞쪽 트랙 삭제, 뒤쪽 트랙 추가) 같은 트랙을 추천해야 한다.
+
+실행: cd server/ml && python -m pytest -q test_serve_index.py
+"""
+
+import numpy as np
+import torch
+
+import serve
+from catalog import SPACE_CODES, Catalog, StringColumn
+from features import FeatureEncoder, load_encoded_tracks
+from train_embedding import Track2Vec, build_index
+
+USER_ID = 3
+NUM_TRACKS = 500
+NUM_ARTISTS = 40
+
+
+def make_arrays(seed=0):
+    rng = np.random.default_rng(seed)
+    track_ids = np.arange(1, NUM_TRACKS + 1, dtype=np.int64)
+    # 플레이리스트 1 = 사용자 PMS, 2-5 = EMS (앞쪽 20개 트랙은 어느 플레이리스트에도 없음)
+    members = [(1, t) for t in rng.choice(track_ids[20:], 30, replace=False)]
+    for playlist_id in range(2, 6):
+        members += [(playlist_id, t) for t in rng.choice(track_ids[20:], 80, replace=False)]
+    member_playlist, member_track = np.array(members, dtype=np.int64).T
+
+    return {
+        'track_id': track_ids,
+        'artist_code': rng.integers(0, NUM_ARTISTS, NUM_TRACKS).astype(np.int32),
+        'popularity': rng.integers(1, 100, NUM_TRACKS).astype(np.float32),
+        'duration': rng.integers(60, 600, NUM_TRACKS).astype(np.float32),
+        'title': [f'title {t}' for t in track_ids],
+        'album': [None] * NUM_TRACKS,
+        'artwork': [None] * NUM_TRACKS,
+        'artists': StringColumn.from_list([f'artist {i}' for i in range(NUM_ARTISTS)]),
+        'playlist_id': np.arange(1, 6, dtype=np.int64),
+        'playlist_user': np.array([USER_ID, 0, 0, 0, 0], dtype=np.int64),
+        'playlist_space': np.array([SPACE_CODES['PMS']] + [SPACE_CODES['EMS']] * 4, dtype=np.int8),
+        'playlist_updated_at': np.zeros(5),
+        'member_map_id': np.arange(1, len(member_track) + 1, dtype=np.int64),
+        'member_playlist': member_playlist,
+        'member_track': member_track,
+    }
+
+
+def make_catalog(arrays, keep, refreshed_at):
+    """keep: 남길 트랙 mask → 해당 트랙만 담아 다시 덤프한 카탈로그 (row 위치가 바뀜)"""
+    arrays = dict(arrays)
+    for name in ('track_id', 'artist_code', 'popularity', 'duration'):
+        arrays[name] = arrays[name][keep]
+    for name in ('title', 'album', 'artwork'):
+        arrays[name] = StringColumn.from_list([v for v, k in zip(arrays[name], keep) if k])
+    alive = np.isin(arrays['member_track'], arrays['track_id'])
+    for name in ('member_map_id', 'member_playlist', 'member_track'):
+        arrays[name] = arrays[name][alive]
+    return Catalog(arrays, {'refreshed_at': refreshed_at})
+
+
+def append_tracks(arrays, count):
+    """track_id가 더 큰 새 트랙을 카탈로그 끝에 추가 (인덱스에는 없는 트랙)"""
+    arrays = dict(arrays)
+    new_ids = arrays['track_id'][-1] + np.arange(1, count + 1, dtype=np.int64)
+    arrays['track_id'] = np.concatenate([arrays['track_id'], new_ids])
+    arrays['artist_code'] = np.concatenate([arrays['artist_code'], np.zeros(count, dtype=np.int32)])
+    arrays['popularity'] = np.concatenate([arrays['popularity'], np.full(count, 50, dtype=np.float32)])
+    arrays['duration'] = np.concatenate([arrays['duration'], np.full(count, 240, dtype=np.float32)])
+    for name in ('title', 'album', 'artwork'):
+        arrays[name] = list(arrays[name]) + [f'new {t}' if name == 'title' else None for t in new_ids]
+    return arrays
+
+
+def test_index_survives_catalog_redump(tmp_path, monkeypatch):
+    monkeypatch.setattr(serve, 'MODEL_DIR', str(tmp_path))
+    torch.manual_seed(0)
+
+    arrays = make_arrays()
+    before = make_catalog(arrays, np.ones(NUM_TRACKS, dtype=bool), refreshed_at=1.0)
+    artists = before.artists.tolist()
+    model = Track2Vec(len(artists)).eval()
+    table = load_encoded_tracks(FeatureEncoder(artists), before, str(tmp_path))
+    ems_rows = before.playlist_track_rows('EMS')
+    build_index(model, table, before, ems_rows).save(str(tmp_path / 'track2vec_index_3'))
+
+    meta = {'artists': artists, 'index': 'track2vec_index_3'}
+    expected = serve.EmbeddingScorer(model, meta, before, USER_ID).recommend(20)
+
+    # 다시 덤프: 앞쪽 10개 트랙 삭제(row가 10칸 이동) + 추천된 EMS 트랙 1개 삭제 + 새 트랙 추가
+    # (삭제할 트랙은 사용자 PMS에 없는 것으로 골라 프로필이 그대로이게 함)
+    pms_ids = set(before.track_ids[before.playlist_track_rows('PMS', USER_ID)].tolist())
+    removed = next(r['track_id'] for r in expected if r['track_id'] not in pms_ids)
+    keep = (arrays['track_id'] > 10) & (arrays['track_id'] != removed)
+    after = make_catalog(append_tracks(arrays, 50), np.r_[keep, np.ones(50, dtype=bool)], refreshed_at=2.0)
+
+    actual = serve.EmbeddingScorer(model, meta, after, USER_ID).recommend(20)
+
+    assert actual == [r for r in expected if r['track_id'] != removed]
+
+    track_ids, scores = serve.EmbeddingScorer(model, meta, after, USER_ID).all_scores()
+    assert removed not in track_ids
+    assert set(track_ids) == set(before.track_ids[ems_rows]) - {removed}
@@ -0,0 +1,128 @@
+"""
+다중 사용자 배치 학습 드라이버
+
+카탈로그 스냅샷을 한 번만 갱신/로드한 뒤, 사용자별 학습을 크기가 제한된 프로세스 풀로 분산한다.
+- 워커는 카탈로그 배열을 mmap으로 공유 (fork 시 부모의 매핑을 그대로 상속)
+- 워커마다 torch/학습 모듈을 한 번만 import
+- 사용자별 체크포인트/추천 파일은 각 트레이너의 MODEL_DIR에 저장
+- 사용자별 로그는 MODEL_DIR/logs/ 에 기록
+- --incremental: 이전 체크포인트가 있는 사용자는 이어서 fine-tuning (플레이리스트 소폭 변경 후 재학습용)
+- --budget: 사용자당 학습 시간 상한(초). 넘으면 그 시점까지 검증 성능이 가장 좋았던 가중치로 저장
+
+실행: cd server/ml && python train_batch.py --model ncf [--users 3,5,7] [--workers 4] [--incremental] [--budget 60]
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import traceback
+import multiprocessing as mp
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from catalog import SPACE_CODES, load_catalog
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+TRAINERS = {
+    'ncf': 'train_ncf',
+    'hybrid': 'train_hybrid',
+    'embedding': 'train_embedding',
+}
+
+_trainer = None
+
+
+def _init_worker(module_name, torch_threads, budget=None):
+    """워커 초기화: 카탈로그(mmap)와 학습 모듈을 한 번만 로드"""
+    global _trainer
+    load_catalog(refresh=False)  # fork면 부모의 캐시를 그대로 사용
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        _trainer = importlib.import_module(module_name)
+    if budget:
+        _trainer.TIME_BUDGET = budget
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def _train_one(user_id, incremental=False):
+    log_dir = os.path.join(_trainer.MODEL_DIR, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f'{_trainer.__name__}_user_{user_id}.log')
+
+    started = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log, redirect_stdout(log):
+        try:
+            recommendations = _trainer.train_user(user_id, incremental=incremental)
+            status = 'ok' if recommendations is not None else 'skipped'
+        except Exception:
+            traceback.print_exc(file=log)
+            status = 'failed'
+    return user_id, status, time.time() - started
+
+
+def pms_users(catalog):
+    """PMS 플레이리스트를 가진 사용자 ID 목록"""
+    mask = catalog.playlist_spaces == SPACE_CODES['PMS']
+    return np.unique(catalog.playlist_users[mask]).tolist()
+
+
+def run_batch(model, user_ids=None, workers=None, incremental=False, budget=None):
+    module_name = TRAINERS[model]
+    catalog = load_catalog()
+    if user_ids is None:
+        user_ids = pms_users(catalog)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(user_ids) or 1))
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    method = 'fork' if 'fork' in mp.get_all_start_methods() else 'spawn'
+
+    print("=" * 60)
+    print(f"[Batch] {module_name} - 사용자 {len(user_ids)}명, 워커 {workers}개 ({method})"
+          f"{', 증분 학습' if incremental else ''}")
+    print("=" * 60)
+
+    started = time.time()
+    results = {'ok': [], 'skipped': [], 'failed': []}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context(method),
+        initializer=_init_worker,
+        initargs=(module_name, torch_threads, budget)
+    ) as pool:
+        futures = [pool.submit(_train_one, uid, incremental) for uid in user_ids]
+        for done, future in enumerate(as_completed(futures), 1):
+            user_id, status, seconds = future.result()
+            results[status].append(user_id)
+            elapsed = time.time() - started
+            print(f"  [{done}/{len(user_ids)}] user {user_id}: {status} ({seconds:.1f}s) "
+                  f"- {done / elapsed * 60:.1f} users/min")
+
+    elapsed = time.time() - started
+    print("\n" + "=" * 60)
+    print(f"[DONE] {elapsed:.1f}s, {len(user_ids) / elapsed * 60:.1f} users/min" if elapsed else "[DONE]")
+    print(f"   - 성공: {len(results['ok'])}")
+    print(f"   - 데이터 부족: {len(results['skipped'])}")
+    print(f"   - 실패: {len(results['failed'])} {results['failed'] or ''}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='다중 사용자 배치 학습')
+    parser.add_argument('--model', choices=sorted(TRAINERS), default='ncf')
+    parser.add_argument('--users', help='쉼표로 구분된 사용자 ID (기본: PMS 보유 사용자 전체)')
+    parser.add_argument('--workers', type=int, help='프로세스 수 (기본: CPU 코어 수)')
+    parser.add_argument('--incremental', action='store_true', help='이전 체크포인트에서 이어 fine-tuning')
+    parser.add_argument('--budget', type=float, help='사용자당 학습 시간 상한(초)')
+    args = parser.parse_args()
+
+    user_ids = [int(u) for u in args.users.split(',')] if args.users else None
+    run_batch(args.model, user_ids, args.workers, args.incremental, args.budget)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,9 @@ Track Embedding 기반 음악 추천 시스템
 2. User Profile: 사용자가 좋아하는 트랙들의 평균 임베딩
 3. Cosine Similarity: 사용자 프로필과 EMS 트랙 간 유사도 계산
 
+증분 모드(train_user(..., incremental=True)): 이전 체크포인트에서 이어 fine-tuning
+(새 아티스트는 artist 임베딩 행만 새로 초기화)
+
 실행: cd server/ml && python train_embedding.py
 """
 
@@ -16,12 +19,19 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import numpy as np
-import mysql.connector
 from datetime import datetime
 from collections import defaultdict
 
+from ann import IVFIndex, mean_direction
+from batching import batch_loader, batched_outputs
+from catalog import load_catalog
+from checkpoint import export_scripted, save_checkpoint, scripted_path
+from features import FeatureEncoder, load_encoded_tracks
+from validation import VAL_NEGATIVES, TrainingMonitor, holdout_split
+from warm_start import load_previous, replay_split, warm_start
+
 sys.stdout.reconfigure(encoding='utf-8')
 
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -31,52 +41,32 @@ print(f"[Track2Vec] Device: {DEVICE}")
 EMBEDDING_DIM = 64
 ARTIST_DIM = 32
 EPOCHS = 100
+FINETUNE_EPOCHS = 10  # 증분 모드 에폭 수
+TIME_BUDGET = None  # 사용자당 학습 시간 상한(초), None = 제한 없음
 BATCH_SIZE = 512
 LR = 0.01
+INFERENCE_BATCH_SIZE = 500  # 카탈로그 임베딩 계산 시 배치 크기
+ANN_NLIST = None  # IVF 리스트 수 (None = 4 * sqrt(N))
+ANN_NPROBE = 16  # 검색 시 탐색할 리스트 수 (클수록 recall↑ 지연↑)
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')  # 체크포인트/추천 결과 저장 위치
 
 # ============================================
 # DB
 # ============================================
-def get_db():
-    return mysql.connector.connect(
-        host='localhost', port=3307,
-        user='root', password='0000',
-        database='music_space_db'
-    )
-
 def load_all_data(user_id):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    """카탈로그와 사용자 PMS / EMS 트랙 row 반환 (row = 카탈로그 인덱스)"""
+    catalog = load_catalog()
 
     # 사용자 PMS 트랙
-    cur.execute("""
-        SELECT DISTINCT t.track_id, t.artist, t.popularity, t.duration
-        FROM tracks t
-        JOIN playlist_tracks pt ON t.track_id = pt.track_id
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        WHERE p.user_id = %s AND p.space_type = 'PMS'
-    """, (user_id,))
-    user_tracks = cur.fetchall()
+    user_rows = catalog.playlist_track_rows('PMS', user_id)
 
     # EMS 트랙
-    cur.execute("""
-        SELECT DISTINCT t.track_id, t.title, t.artist, t.album,
-               t.popularity, t.duration, t.artwork
-        FROM tracks t
-        JOIN playlist_tracks pt ON t.track_id = pt.track_id
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        WHERE p.space_type = 'EMS'
-    """)
-    ems_tracks = cur.fetchall()
+    ems_rows = catalog.playlist_track_rows('EMS')
 
     # 모든 아티스트
-    cur.execute("SELECT DISTINCT artist FROM tracks WHERE artist IS NOT NULL")
-    all_artists = [r['artist'] for r in cur.fetchall()]
-
-    cur.close()
-    conn.close()
+    all_artists = catalog.artists.tolist()
 
-    return user_tracks, ems_tracks, all_artists
+    return catalog, user_rows, ems_rows, all_artists
 
 # ============================================
 # Track Embedding Model
@@ -120,7 +110,7 @@ class Track2Vec(nn.Module):
         ], dim=-1)
 
         # Encode to embedding
-        return F.normalize(self.encoder(features), p=2, dim=-1)
+        return F.normalize(self.encoder(features), p=2.0, dim=-1)
 
 # ============================================
 # Triplet Dataset
@@ -131,69 +121,76 @@ class TripletDataset(Dataset):
 
     목표: 같은 사용자가 좋아하는 트랙들은 가깝게,
           다른 트랙들은 멀게 임베딩
-    """
-
-    def __init__(self, positive_tracks, negative_tracks, artist_to_idx):
-        self.pos = positive_tracks
-        self.neg = negative_tracks
-        self.artist_map = artist_to_idx
-        self.triplets = self._create_triplets()
-
-    def _create_triplets(self):
-        triplets = []
-        for i, anchor in enumerate(self.pos):
-            # 같은 아티스트의 다른 곡 = positive
-            same_artist = [t for t in self.pos if t['artist'] == anchor['artist'] and t != anchor]
-            if same_artist:
-                positive = np.random.choice(same_artist)
-            else:
-                # 없으면 랜덤 positive
-                others = [t for t in self.pos if t != anchor]
-                positive = np.random.choice(others) if others else anchor
-
-            # Negative
-            negative = np.random.choice(self.neg)
 
-            triplets.append((anchor, positive, negative))
-
-        return triplets
+    특성은 인코딩 테이블에서 gather한 텐서로 보관하고, triplet은 정수 인덱스로만 다룬다.
+    """
 
-    def _encode(self, track):
-        artist_idx = self.artist_map.get(track['artist'], 0)
-        pop = (track['popularity'] or 50) / 100.0
-        dur = min((track['duration'] or 240) / 600.0, 1.0)
-        return artist_idx, pop, dur
+    def __init__(self, pos_rows, neg_rows, table):
+        self.pos_features = table.tensors(pos_rows)
+        self.neg_features = table.tensors(neg_rows)
+        self.num_neg = len(neg_rows)
+
+        # triplet (anchor, positive, negative) 인덱스 텐서 (T, 3)
+        artists = np.asarray(table.artist_idx)[np.asarray(pos_rows, dtype=np.int64)]
+        self.triplets = torch.from_numpy(self._create_triplets(artists, self.num_neg))
+
+    @staticmethod
+    def _create_triplets(artists, num_neg):
+        """artist → positive 인덱스 역색인으로 anchor마다 positive/negative를 한 번에 샘플링"""
+        n = len(artists)
+
+        # 역색인: 아티스트 순으로 정렬한 인덱스(order)와 아티스트별 구간 [start, end)
+        order = np.argsort(artists, kind='stable')
+        sorted_artists = artists[order]
+        start = np.searchsorted(sorted_artists, sorted_artists, side='left')
+        end = np.searchsorted(sorted_artists, sorted_artists, side='right')
+        size = end - start
+
+        # 같은 아티스트의 다른 곡 = positive (자기 자신을 건너뛰도록 구간 내 오프셋 보정)
+        pos = np.arange(n)
+        same = size > 1
+        pick = start + np.random.randint(0, np.maximum(size - 1, 1))
+        pick += pick >= pos
+        # 없으면 랜덤 positive (자기 자신 제외, 트랙이 하나뿐이면 자기 자신)
+        other = np.random.randint(0, max(n - 1, 1), size=n)
+        other += (other >= pos) & (n > 1)
+        pick = np.where(same, pick, other)
+
+        anchor = order
+        positive = order[pick]
+        negative = np.random.randint(0, num_neg, size=n)
+
+        return np.stack([anchor, positive, negative], axis=1).astype(np.int64)
 
     def __len__(self):
         return len(self.triplets) * 5  # 증강
 
     def __getitem__(self, idx):
-        anchor, pos, neg = self.triplets[idx % len(self.triplets)]
+        """idx: 정수 또는 배치 인덱스 텐서"""
+        idx = torch.as_tensor(idx)
+        anchor, pos, neg = self.triplets[idx % len(self.triplets)].unbind(-1)
 
         # 랜덤 negative 재선택 (다양성)
-        if np.random.random() > 0.5:
-            neg = np.random.choice(self.neg)
-
-        a_artist, a_pop, a_dur = self._encode(anchor)
-        p_artist, p_pop, p_dur = self._encode(pos)
-        n_artist, n_pop, n_dur = self._encode(neg)
+        resample = torch.rand(idx.shape) > 0.5
+        neg = torch.where(resample, torch.randint(0, self.num_neg, idx.shape), neg)
 
         return {
-            'a_artist': torch.tensor(a_artist, dtype=torch.long),
-            'a_pop': torch.tensor(a_pop, dtype=torch.float),
-            'a_dur': torch.tensor(a_dur, dtype=torch.float),
-            'p_artist': torch.tensor(p_artist, dtype=torch.long),
-            'p_pop': torch.tensor(p_pop, dtype=torch.float),
-            'p_dur': torch.tensor(p_dur, dtype=torch.float),
-            'n_artist': torch.tensor(n_artist, dtype=torch.long),
-            'n_pop': torch.tensor(n_pop, dtype=torch.float),
-            'n_dur': torch.tensor(n_dur, dtype=torch.float),
+            'a_artist': self.pos_features['artist'][anchor],
+            'a_pop': self.pos_features['pop'][anchor],
+            'a_dur': self.pos_features['dur'][anchor],
+            'p_artist': self.pos_features['artist'][pos],
+            'p_pop': self.pos_features['pop'][pos],
+            'p_dur': self.pos_features['dur'][pos],
+            'n_artist': self.neg_features['artist'][neg],
+            'n_pop': self.neg_features['pop'][neg],
+            'n_dur': self.neg_features['dur'][neg],
         }
 
 # ============================================
 # Training
 # ============================================
-def train_embedding_model(model, dataloader, epochs, lr):
+def train_embedding_model(model, dataloader, epochs, lr, monitor=None):
+    """monitor: 검증/early stopping/시간 상한 (validation.TrainingMonitor)"""
     optimizer = optim.Adam(model.parameters(), lr=lr)
     scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=30, gamma=0.5)
     triplet_loss = nn.TripletMarginLoss(margin=0.3)
@@ -238,133 +235,182 @@ def train_embedding_model(model, dataloader, epochs, lr):
         if (epoch + 1) % 20 == 0 or epoch == 0:
             print(f"  Epoch [{epoch+1}/{epochs}] Triplet Loss: {avg_loss:.4f}")
 
+        if monitor is not None and monitor.end_epoch(epoch, model):
+            break
+
+    if monitor is not None:
+        monitor.finish(model)
     return history
 
 # ============================================
-# Recommendation via Cosine Similarity
+# Catalog Embeddings + ANN Index
 # ============================================
-def get_recommendations(model, user_tracks, ems_tracks, artist_to_idx, top_k=30):
+def encode_tracks(model, table, rows):
+    """row → L2 정규화된 트랙 임베딩 (N, D) float32"""
     model.eval()
+    feats = table.tensors(rows)
+    return batched_outputs(model, feats['artist'], feats['pop'], feats['dur'],
+                           batch_size=INFERENCE_BATCH_SIZE, device=DEVICE).numpy()
+
+
+def build_index(model, table, catalog, ems_rows, nlist=ANN_NLIST):
+    """EMS 트랙 임베딩 행렬 위에 IVF 인덱스 생성 (id = track_id, 스냅샷이 바뀌어도 유효)"""
+    return IVFIndex.build(encode_tracks(model, table, ems_rows), catalog.track_ids[ems_rows], nlist=nlist)
+
+
+def user_profile(model, table, user_rows):
+    """사용자 프로필: positive 트랙 임베딩의 평균 (코사인 검색용으로 정규화)"""
+    return mean_direction(encode_tracks(model, table, user_rows))
 
-    def encode_batch(tracks):
-        artists = torch.tensor([artist_to_idx.get(t['artist'], 0) for t in tracks], dtype=torch.long).to(DEVICE)
-        pops = torch.tensor([(t['popularity'] or 50) / 100.0 for t in tracks], dtype=torch.float).to(DEVICE)
-        durs = torch.tensor([min((t['duration'] or 240) / 600.0, 1.0) for t in tracks], dtype=torch.float).to(DEVICE)
-        with torch.no_grad():
-            return model(artists, pops, durs)
-
-    # 사용자 프로필: positive 트랙 임베딩의 평균
-    user_embeddings = encode_batch(user_tracks)
-    user_profile = user_embeddings.mean(dim=0, keepdim=True)  # (1, 64)
-
-    # EMS 트랙 임베딩
-    batch_size = 500
-    all_scores = []
-
-    for i in range(0, len(ems_tracks), batch_size):
-        batch = ems_tracks[i:i+batch_size]
-        embeddings = encode_batch(batch)
-
-        # Cosine similarity
-        similarities = F.cosine_similarity(user_profile, embeddings, dim=-1)
-        all_scores.extend(similarities.cpu().numpy())
-
-    # 결과 정리
-    results = []
-    for track, score in zip(ems_tracks, all_scores):
-        results.append({
-            'track_id': track['track_id'],
-            'title': track['title'],
-            'artist': track['artist'],
-            'album': track.get('album'),
-            'popularity': track.get('popularity'),
-            'artwork': track.get('artwork'),
-            'similarity': round(float(score) * 100, 2)  # 0-100 스케일
-        })
-
-    # 정렬
-    results.sort(key=lambda x: x['similarity'], reverse=True)
-    return results[:top_k]
+# ============================================
+# Recommendation via Cosine Similarity (ANN)
+# ============================================
+def get_recommendations(catalog, profile, index, top_k=30, nprobe=ANN_NPROBE):
+    scores, track_ids = index.search(profile, top_k, nprobe)
+    rows = catalog.rows_of(track_ids)
+    found = rows >= 0  # 인덱스 생성 후 카탈로그에서 삭제된 트랙은 제외
+    rows, scores = rows[found], scores[found]
+
+    results = catalog.records(rows, ['track_id', 'title', 'artist', 'album', 'popularity', 'artwork'])
+    for r, score in zip(results, scores.tolist()):
+        r['similarity'] = round(score * 100, 2)  # 0-100 스케일
+
+    return results
 
 # ============================================
 # Main
 # ============================================
-def main():
-    USER_ID = 3
+def train_user(user_id, incremental=False):
+    """한 사용자의 모델 학습 → 체크포인트/추천 결과 저장 (데이터 부족 시 None)
 
+    incremental=True면 이전 체크포인트가 있을 때 이어서 fine-tuning (없으면 전체 학습)
+    """
     print("=" * 60)
     print("[Track2Vec] Embedding 기반 음악 추천 시스템")
     print("=" * 60)
 
     # 1. 데이터 로드
     print("\n[1] 데이터 로드")
-    user_tracks, ems_tracks, all_artists = load_all_data(USER_ID)
-    print(f"   - 사용자 트랙: {len(user_tracks)}")
-    print(f"   - EMS 트랙: {len(ems_tracks)}")
+    catalog, user_rows, ems_rows, all_artists = load_all_data(user_id)
+    print(f"   - 사용자 트랙: {len(user_rows)}")
+    print(f"   - EMS 트랙: {len(ems_rows)}")
     print(f"   - 아티스트 수: {len(all_artists)}")
 
+    if not len(user_rows):
+        print("[ERROR] 학습할 PMS 트랙이 없습니다")
+        return None
+
     # 선호 아티스트
     artist_counts = defaultdict(int)
-    for t in user_tracks:
-        artist_counts[t['artist']] += 1
+    for artist in catalog.artist_names(user_rows):
+        artist_counts[artist] += 1
     top_artists = sorted(artist_counts.items(), key=lambda x: x[1], reverse=True)[:10]
     print(f"\n   [선호 아티스트 TOP 5]")
     for a, c in top_artists[:5]:
         print(f"     - {a}: {c}곡")
 
-    # 아티스트 인덱싱
-    artist_to_idx = {a: i+1 for i, a in enumerate(all_artists)}
+    # 아티스트 인덱싱 + 카탈로그 인코딩 테이블
+    encoder = FeatureEncoder(all_artists)
+    artist_to_idx = encoder.artist_to_idx
+    table = load_encoded_tracks(encoder, catalog, MODEL_DIR)
 
     # 2. Negative 샘플 준비
     print("\n[2] Negative 샘플 준비")
-    user_track_ids = {t['track_id'] for t in user_tracks}
-    negative_tracks = [t for t in ems_tracks if t['track_id'] not in user_track_ids]
-    print(f"   - Negative 트랙: {len(negative_tracks)}")
-
-    # 3. Dataset
-    print("\n[3] Triplet Dataset 생성")
-    dataset = TripletDataset(user_tracks, negative_tracks, artist_to_idx)
-    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True, drop_last=True)
-    print(f"   - 학습 샘플: {len(dataset)}")
-
-    # 4. 모델
-    print("\n[4] Track2Vec 모델 생성")
+    negative_rows = np.setdiff1d(ems_rows, user_rows)
+    print(f"   - Negative 트랙: {len(negative_rows)}")
+
+    # 3. 모델
+    print("\n[3] Track2Vec 모델 생성")
     model = Track2Vec(
         num_artists=len(all_artists),
         artist_dim=ARTIST_DIM,
         output_dim=EMBEDDING_DIM
-    ).to(DEVICE)
+    )
+    model_path = os.path.join(MODEL_DIR, f'track2vec_user_{user_id}.pt')
+
+    previous = load_previous(model_path) if incremental else None
+
+    # 검증용 held-out positive (학습에서 제외, track_id 기준 고정 split)
+    fit_idx, val_idx = holdout_split(catalog.track_ids[user_rows],
+                                     trained_ids=previous['trained_tracks'] if previous else None)
+    fit_rows = np.asarray(user_rows)[fit_idx]
+    val_rows = np.asarray(user_rows)[val_idx]
+    trained_tracks = catalog.track_ids[fit_rows]
+
+    # 증분 모드: artist 임베딩은 아티스트 이름 기준으로 옮기고 새 트랙 + replay만 학습
+    warm = previous is not None and warm_start(model, previous['model_state_dict'], {
+        'artist_embed.weight': (sorted(previous['artist_to_idx'], key=previous['artist_to_idx'].get), all_artists)
+    })
+    model = model.to(DEVICE)
+    epochs = EPOCHS
+    train_rows = fit_rows
+    if warm:
+        new_idx, replay_idx = replay_split(trained_tracks, previous['trained_tracks'])
+        train_rows = fit_rows[np.concatenate([new_idx, replay_idx])]
+        epochs = FINETUNE_EPOCHS
+        print(f"   - 증분 학습: 새 트랙 {len(new_idx)}개 + replay {len(replay_idx)}개")
+
     params = sum(p.numel() for p in model.parameters())
     print(f"   - 파라미터: {params:,}")
     print(f"   - Embedding 차원: {EMBEDDING_DIM}")
 
+    # 4. Dataset
+    print("\n[4] Triplet Dataset 생성")
+    dataset = TripletDataset(train_rows, negative_rows, table)
+    dataloader = batch_loader(dataset, BATCH_SIZE, shuffle=True, drop_last=len(dataset) >= BATCH_SIZE)
+    print(f"   - 학습 샘플: {len(dataset)}, 검증 positive: {len(val_rows)}")
+
+    # 검증: 학습 트랙 프로필과의 코사인 유사도로 held-out positive vs negative VAL_NEGATIVES개의 순위
+    validate = None
+    if len(val_rows) and len(negative_rows):
+        val_neg = np.random.choice(negative_rows, min(VAL_NEGATIVES, len(negative_rows)), replace=False)
+
+        def validate(m):
+            profile = user_profile(m, table, fit_rows)
+            return encode_tracks(m, table, val_rows) @ profile, encode_tracks(m, table, val_neg) @ profile
+
     # 5. 학습
-    print(f"\n[5] 학습 시작 (Epochs: {EPOCHS})")
-    history = train_embedding_model(model, dataloader, EPOCHS, LR)
+    print(f"\n[5] 학습 시작 (Epochs: {epochs}{', warm start' if warm else ''})")
+    monitor = TrainingMonitor(validate, budget=TIME_BUDGET)
+    history = train_embedding_model(model, dataloader, epochs, LR, monitor)
 
     # 6. 저장
     print("\n[6] 모델 저장")
-    os.makedirs('models', exist_ok=True)
-    torch.save({
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    index = build_index(model, table, catalog, ems_rows)
+    index_name = f'track2vec_index_{user_id}'
+    index.save(os.path.join(MODEL_DIR, index_name))
+    print(f"   - ANN 인덱스: {len(index):,} tracks, {index.nlist} lists")
+    save_checkpoint({
         'model_state_dict': model.state_dict(),
         'artist_to_idx': artist_to_idx,
         'embedding_dim': EMBEDDING_DIM,
-        'user_id': USER_ID,
+        'index': index_name,  # MODEL_DIR 기준 EMS 임베딩 IVF 인덱스
+        'user_id': user_id,
+        'trained_tracks': torch.from_numpy(trained_tracks),  # 증분 학습 시 새 트랙 판별용
+        'warm_start': warm,
+        'validation': monitor.summary(),
+        'trained_at': datetime.now().isoformat(),
         'history': history
-    }, f'models/track2vec_user_{USER_ID}.pt')
+    }, model_path)
+    export_scripted(model, scripted_path(model_path), {
+        'model': 'embedding', 'user_id': user_id, 'artists': all_artists, 'index': index_name
+    })
 
     # 7. 추천
     print("\n[7] 추천 생성 (Cosine Similarity)")
-    recommendations = get_recommendations(model, user_tracks, ems_tracks, artist_to_idx, top_k=50)
+    profile = user_profile(model, table, user_rows)
+    recommendations = get_recommendations(catalog, profile, index, top_k=50)
 
     # 저장
-    with open(f'models/track2vec_recommendations_{USER_ID}.json', 'w', encoding='utf-8') as f:
+    with open(os.path.join(MODEL_DIR, f'track2vec_recommendations_{user_id}.json'), 'w', encoding='utf-8') as f:
         json.dump({
-            'user_id': USER_ID,
+            'user_id': user_id,
             'model': 'Track2Vec + Cosine Similarity',
             'embedding_dim': EMBEDDING_DIM,
             'generated_at': datetime.now().isoformat(),
             'final_loss': history[-1],
+            'validation': monitor.summary()['best'],
             'recommendations': recommendations
         }, f, ensure_ascii=False, indent=2)
 
@@ -402,5 +448,9 @@ def main():
 
     return recommendations
 
+def main():
+    USER_ID = 3
+    return train_user(USER_ID)
+
 if __name__ == "__main__":
     main()
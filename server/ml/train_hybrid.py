@@ -6,6 +6,9 @@ NCF + Content-Based Features 결합:
 - Content features: popularity, duration, artist embedding
 - Multi-task learning: predict interaction + similarity
 
+증분 모드(train_user(..., incremental=True)): 이전 체크포인트에서 이어 fine-tuning
+(새 아티스트는 artist 임베딩 행만 새로 초기화)
+
 실행: cd server/ml && python train_hybrid.py
 """
 
@@ -16,12 +19,19 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import numpy as np
-import mysql.connector
 from datetime import datetime
 from collections import defaultdict
 
+from batching import batch_loader, batched_scores
+from catalog import load_catalog
+from checkpoint import export_scripted, save_checkpoint, scripted_path
+from features import ENCODED_TRACKS_FILE, FeatureEncoder, load_encoded_tracks
+from ranking import top_indices
+from validation import VAL_NEGATIVES, TrainingMonitor, holdout_split
+from warm_start import load_previous, replay_split, warm_start
+
 sys.stdout.reconfigure(encoding='utf-8')
 
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -36,73 +46,29 @@ HIDDEN_LAYERS = [64, 32]
 LEARNING_RATE = 0.005
 BATCH_SIZE = 128
 EPOCHS = 30
+FINETUNE_EPOCHS = 5  # 증분 모드 에폭 수
+TIME_BUDGET = None  # 사용자당 학습 시간 상한(초), None = 제한 없음
 MARGIN = 0.5  # Triplet loss margin
-
-# ============================================
-# DB 연결
-# ============================================
-def get_db():
-    return mysql.connector.connect(
-        host='localhost', port=3307,
-        user='root', password='0000',
-        database='music_space_db'
-    )
+INFERENCE_BATCH_SIZE = 4096  # 추천 생성 시 한 번에 점수를 계산할 후보 수
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')  # 체크포인트/추천 결과 저장 위치
 
 # ============================================
 # 데이터 로드
 # ============================================
 def load_data(user_id):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    """카탈로그와 사용자 PMS / EMS 트랙 row 반환 (row = 카탈로그 인덱스)"""
+    catalog = load_catalog()
 
     # 사용자의 positive tracks (PMS)
-    cur.execute("""
-        SELECT DISTINCT t.track_id, t.artist, t.popularity, t.duration
-        FROM tracks t
-        JOIN playlist_tracks pt ON t.track_id = pt.track_id
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        WHERE p.user_id = %s AND p.space_type = 'PMS'
-    """, (user_id,))
-    pos_tracks = cur.fetchall()
+    pos_rows = catalog.playlist_track_rows('PMS', user_id)
 
     # EMS 트랙 (추천 대상)
-    cur.execute("""
-        SELECT DISTINCT t.track_id, t.title, t.artist, t.album,
-               t.popularity, t.duration, t.artwork
-        FROM tracks t
-        JOIN playlist_tracks pt ON t.track_id = pt.track_id
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        WHERE p.space_type = 'EMS'
-    """)
-    ems_tracks = cur.fetchall()
+    ems_rows = catalog.playlist_track_rows('EMS')
 
     # 전체 아티스트 목록
-    cur.execute("SELECT DISTINCT artist FROM tracks WHERE artist IS NOT NULL")
-    artists = [r['artist'] for r in cur.fetchall()]
+    artists = catalog.artists.tolist()
 
-    cur.close()
-    conn.close()
-
-    return pos_tracks, ems_tracks, artists
-
-# ============================================
-# Feature Engineering
-# ============================================
-class FeatureEncoder:
-    def __init__(self, artists):
-        self.artist_to_idx = {a: i+1 for i, a in enumerate(artists)}
-        self.num_artists = len(artists) + 1
-
-    def encode_track(self, track):
-        """트랙을 특성 벡터로 인코딩"""
-        artist_idx = self.artist_to_idx.get(track.get('artist'), 0)
-        popularity = (track.get('popularity') or 50) / 100.0
-        duration = min((track.get('duration') or 240) / 600.0, 1.0)
-        return {
-            'artist_idx': artist_idx,
-            'popularity': popularity,
-            'duration': duration
-        }
+    return catalog, pos_rows, ems_rows, artists
 
 # ============================================
 # Hybrid Model
@@ -175,37 +141,43 @@ class HybridRecommender(nn.Module):
 # Dataset
 # ============================================
 class TripletDataset(Dataset):
-    """Triplet Loss용 데이터셋: (anchor_user, positive_track, negative_track)"""
+    """Triplet Loss용 데이터셋: (anchor_user, positive_track, negative_track)
 
-    def __init__(self, pos_tracks, all_tracks, encoder, neg_ratio=3):
-        self.pos_features = [encoder.encode_track(t) for t in pos_tracks]
-        self.neg_features = [encoder.encode_track(t) for t in all_tracks
-                            if t['track_id'] not in {p['track_id'] for p in pos_tracks}]
+    인코딩 테이블에서 gather한 특성을 연속 텐서로 보관하고, 배치 인덱스 텐서 하나로 gather한다.
+    """
+
+    def __init__(self, pos_rows, candidate_rows, table, neg_ratio=3):
+        # negative pool = 후보 - positive (정렬 기반 차집합)
+        neg_rows = np.setdiff1d(candidate_rows, pos_rows)
+        self.pos = table.tensors(pos_rows)
+        self.neg = table.tensors(neg_rows)
+        self.num_pos = len(pos_rows)
+        self.num_neg = len(neg_rows)
         self.neg_ratio = neg_ratio
 
     def __len__(self):
-        return len(self.pos_features) * self.neg_ratio
+        return self.num_pos * self.neg_ratio
 
     def __getitem__(self, idx):
-        pos_idx = idx % len(self.pos_features)
-        neg_idx = np.random.randint(0, len(self.neg_features))
-
-        pos = self.pos_features[pos_idx]
-        neg = self.neg_features[neg_idx]
+        """idx: 정수 또는 배치 인덱스 텐서"""
+        idx = torch.as_tensor(idx)
+        pos_idx = idx % self.num_pos
+        neg_idx = torch.randint(0, self.num_neg, idx.shape)
 
         return {
-            'pos_artist': torch.tensor(pos['artist_idx'], dtype=torch.long),
-            'pos_pop': torch.tensor(pos['popularity'], dtype=torch.float),
-            'pos_dur': torch.tensor(pos['duration'], dtype=torch.float),
-            'neg_artist': torch.tensor(neg['artist_idx'], dtype=torch.long),
-            'neg_pop': torch.tensor(neg['popularity'], dtype=torch.float),
-            'neg_dur': torch.tensor(neg['duration'], dtype=torch.float),
+            'pos_artist': self.pos['artist'][pos_idx],
+            'pos_pop': self.pos['pop'][pos_idx],
+            'pos_dur': self.pos['dur'][pos_idx],
+            'neg_artist': self.neg['artist'][neg_idx],
+            'neg_pop': self.neg['pop'][neg_idx],
+            'neg_dur': self.neg['dur'][neg_idx],
         }
 
 # ============================================
 # Training
 # ============================================
-def train_model(model, dataloader, epochs, lr):
+def train_model(model, dataloader, epochs, lr, monitor=None):
+    """monitor: 검증/early stopping/시간 상한 (validation.TrainingMonitor)"""
     optimizer = optim.Adam(model.parameters(), lr=lr, weight_decay=1e-4)
     scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, epochs)
 
@@ -254,57 +226,64 @@ def train_model(model, dataloader, epochs, lr):
         if (epoch + 1) % 5 == 0 or epoch == 0:
             print(f"  Epoch [{epoch+1}/{epochs}] Loss: {avg_loss:.4f}")
 
+        if monitor is not None and monitor.end_epoch(epoch, model):
+            break
+
+    if monitor is not None:
+        monitor.finish(model)
     return history
 
 # ============================================
 # Recommendation
 # ============================================
-def generate_recommendations(model, ems_tracks, encoder, top_k=30):
+def generate_recommendations(model, catalog, ems_rows, table, top_k=30):
     model.eval()
-    results = []
-
-    with torch.no_grad():
-        for track in ems_tracks:
-            feat = encoder.encode_track(track)
-            artist_t = torch.tensor([feat['artist_idx']], dtype=torch.long).to(DEVICE)
-            pop_t = torch.tensor([feat['popularity']], dtype=torch.float).to(DEVICE)
-            dur_t = torch.tensor([feat['duration']], dtype=torch.float).to(DEVICE)
-
-            score = model(artist_t, pop_t, dur_t).item()
-
-            results.append({
-                'track_id': track['track_id'],
-                'title': track['title'],
-                'artist': track['artist'],
-                'album': track.get('album'),
-                'popularity': track.get('popularity'),
-                'artwork': track.get('artwork'),
-                'dl_score': round(score * 100, 2)
-            })
-
-    results.sort(key=lambda x: x['dl_score'], reverse=True)
-    return results[:top_k]
+    if not len(ems_rows):
+        return []
+
+    # 인코딩 테이블에서 후보 특성 gather → 청크 단위 배치 추론
+    feats = table.tensors(ems_rows)
+    scores = batched_scores(model, feats['artist'], feats['pop'], feats['dur'],
+                            batch_size=INFERENCE_BATCH_SIZE, device=DEVICE).numpy()
+    top = top_indices(scores, top_k)
+
+    # 상위 top_k개만 결과 dict로 변환
+    results = catalog.records(
+        np.asarray(ems_rows)[top],
+        ['track_id', 'title', 'artist', 'album', 'popularity', 'artwork']
+    )
+    for r, score in zip(results, scores[top].tolist()):
+        r['dl_score'] = round(score * 100, 2)
+
+    return results
 
 # ============================================
 # Main
 # ============================================
-def main():
-    USER_ID = 3
+def train_user(user_id, incremental=False):
+    """한 사용자의 모델 학습 → 체크포인트/추천 결과 저장 (데이터 부족 시 None)
+
+    incremental=True면 이전 체크포인트가 있을 때 이어서 fine-tuning (없으면 전체 학습)
+    """
     print("=" * 60)
     print("[Hybrid DL] 하이브리드 딥러닝 추천 모델 학습")
     print("=" * 60)
 
     # 1. 데이터 로드
     print("\n[1] 데이터 로드")
-    pos_tracks, ems_tracks, artists = load_data(USER_ID)
-    print(f"   - 학습 트랙: {len(pos_tracks)}")
-    print(f"   - EMS 트랙: {len(ems_tracks)}")
+    catalog, pos_rows, ems_rows, artists = load_data(user_id)
+    print(f"   - 학습 트랙: {len(pos_rows)}")
+    print(f"   - EMS 트랙: {len(ems_rows)}")
     print(f"   - 아티스트 수: {len(artists)}")
 
+    if not len(pos_rows):
+        print("[ERROR] 학습할 PMS 트랙이 없습니다")
+        return None
+
     # 선호 아티스트 분석
     artist_counts = defaultdict(int)
-    for t in pos_tracks:
-        artist_counts[t['artist']] += 1
+    for artist in catalog.artist_names(pos_rows):
+        artist_counts[artist] += 1
     top_artists = sorted(artist_counts.items(), key=lambda x: x[1], reverse=True)[:10]
     print(f"\n   선호 아티스트 TOP 5:")
     for a, c in top_artists[:5]:
@@ -313,48 +292,92 @@ def main():
     # 2. Feature Encoder
     print("\n[2] Feature Encoding")
     encoder = FeatureEncoder(artists)
+    table = load_encoded_tracks(encoder, catalog, MODEL_DIR)
+    print(f"   - 인코딩 테이블: {len(table):,} tracks")
 
-    # 3. Dataset
-    print("\n[3] Dataset 생성")
-    dataset = TripletDataset(pos_tracks, ems_tracks, encoder, neg_ratio=4)
-    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
-    print(f"   - 학습 샘플: {len(dataset)}")
-
-    # 4. 모델
-    print("\n[4] 모델 생성")
+    # 3. 모델
+    print("\n[3] 모델 생성")
     model = HybridRecommender(
         num_artists=encoder.num_artists,
         artist_embed_dim=ARTIST_EMBEDDING_DIM,
         hidden_dim=HIDDEN_LAYERS[0]
-    ).to(DEVICE)
+    )
+    model_path = os.path.join(MODEL_DIR, f'hybrid_user_{user_id}.pt')
+
+    previous = load_previous(model_path) if incremental else None
+
+    # 검증용 held-out positive (학습에서 제외, track_id 기준 고정 split)
+    train_idx, val_idx = holdout_split(catalog.track_ids[pos_rows],
+                                       trained_ids=previous['trained_tracks'] if previous else None)
+    train_rows = np.asarray(pos_rows)[train_idx]
+    val_rows = np.asarray(pos_rows)[val_idx]
+    trained_tracks = catalog.track_ids[train_rows]
+
+    # 증분 모드: artist 임베딩은 아티스트 이름 기준으로 옮기고 새 트랙 + replay만 학습
+    warm = previous is not None and warm_start(model, previous['model_state_dict'], {
+        'artist_embed.weight': (sorted(previous['artist_to_idx'], key=previous['artist_to_idx'].get), artists)
+    })
+    model = model.to(DEVICE)
+    epochs = EPOCHS
+    if warm:
+        new_idx, replay_idx = replay_split(trained_tracks, previous['trained_tracks'])
+        train_rows = train_rows[np.concatenate([new_idx, replay_idx])]
+        epochs = FINETUNE_EPOCHS
+        print(f"   - 증분 학습: 새 트랙 {len(new_idx)}개 + replay {len(replay_idx)}개")
 
     params = sum(p.numel() for p in model.parameters())
     print(f"   - 파라미터: {params:,}")
 
+    # 4. Dataset (negative pool에서는 학습에 안 쓰는 positive도 제외)
+    print("\n[4] Dataset 생성")
+    neg_rows = np.setdiff1d(ems_rows, pos_rows)
+    dataset = TripletDataset(train_rows, neg_rows, table, neg_ratio=4)
+    dataloader = batch_loader(dataset, BATCH_SIZE, shuffle=True)
+    print(f"   - 학습 샘플: {len(dataset)}, 검증 positive: {len(val_rows)}")
+
+    # 검증: held-out positive vs EMS negative VAL_NEGATIVES개의 순위
+    validate = None
+    if len(val_rows) and len(neg_rows):
+        val_pos = table.tensors(val_rows)
+        val_neg = table.tensors(np.random.choice(neg_rows, min(VAL_NEGATIVES, len(neg_rows)), replace=False))
+        validate = lambda m: (
+            batched_scores(m, val_pos['artist'], val_pos['pop'], val_pos['dur'], device=DEVICE),
+            batched_scores(m, val_neg['artist'], val_neg['pop'], val_neg['dur'], device=DEVICE))
+
     # 5. 학습
-    print(f"\n[5] 모델 학습 (Epochs: {EPOCHS})")
-    history = train_model(model, dataloader, EPOCHS, LEARNING_RATE)
+    print(f"\n[5] 모델 학습 (Epochs: {epochs}{', warm start' if warm else ''})")
+    monitor = TrainingMonitor(validate, budget=TIME_BUDGET)
+    history = train_model(model, dataloader, epochs, LEARNING_RATE, monitor)
 
     # 6. 저장
     print("\n[6] 모델 저장")
-    os.makedirs('models', exist_ok=True)
-    torch.save({
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    save_checkpoint({
         'model_state_dict': model.state_dict(),
         'artist_to_idx': encoder.artist_to_idx,
-        'user_id': USER_ID,
+        'encoded_tracks': ENCODED_TRACKS_FILE,  # MODEL_DIR 기준 카탈로그 인코딩 캐시
+        'user_id': user_id,
+        'trained_tracks': torch.from_numpy(trained_tracks),  # 증분 학습 시 새 트랙 판별용
+        'warm_start': warm,
+        'validation': monitor.summary(),
+        'trained_at': datetime.now().isoformat(),
         'history': history
-    }, f'models/hybrid_user_{USER_ID}.pt')
+    }, model_path)
+    export_scripted(model, scripted_path(model_path), {
+        'model': 'hybrid', 'user_id': user_id, 'artists': artists
+    })
 
     # 7. 추천
     print("\n[7] 추천 생성")
-    recommendations = generate_recommendations(model, ems_tracks, encoder, top_k=30)
+    recommendations = generate_recommendations(model, catalog, ems_rows, table, top_k=30)
 
     # 저장
-    with open(f'models/hybrid_recommendations_{USER_ID}.json', 'w', encoding='utf-8') as f:
+    with open(os.path.join(MODEL_DIR, f'hybrid_recommendations_{user_id}.json'), 'w', encoding='utf-8') as f:
         json.dump({
-            'user_id': USER_ID,
+            'user_id': user_id,
             'model': 'Hybrid DL (Triplet + BCE)',
             'generated_at': datetime.now().isoformat(),
+            'validation': monitor.summary()['best'],
             'recommendations': recommendations
         }, f, ensure_ascii=False, indent=2)
 
@@ -381,5 +404,9 @@ def main():
 
     return recommendations
 
+def main():
+    USER_ID = 3
+    return train_user(USER_ID)
+
 if __name__ == "__main__":
     main()
@@ -6,6 +6,9 @@ Neural Collaborative Filtering (NCF) 기반 음악 추천 시스템
 - MLP (Multi-Layer Perceptron): 비선형 상호작용 학습
 - NCF: GMF + MLP 결합
 
+증분 모드(train_user(..., incremental=True)): 이전 체크포인트에서 이어
+새로 추가된 트랙 + 이전 트랙 일부(replay)만 FINETUNE_EPOCHS 동안 fine-tuning
+
 실행: cd server/ml && python train_ncf.py
 """
 
@@ -15,11 +18,17 @@ import json
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
 import numpy as np
-import mysql.connector
 from datetime import datetime
 
+from batching import batch_loader, batched_scores
+from catalog import load_catalog
+from checkpoint import build_vocab, export_scripted, load_vocab, save_checkpoint, save_vocab, scripted_path, vocab_lookup
+from ranking import top_indices
+from validation import VAL_NEGATIVES, TrainingMonitor, holdout_split
+from warm_start import load_previous, replay_split, warm_start
+
 # UTF-8 출력 설정
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -31,6 +40,10 @@ LEARNING_RATE = 0.001
 BATCH_SIZE = 256
 EPOCHS = 50
 NEGATIVE_SAMPLES = 4  # 각 positive sample당 negative samples 수
+FINETUNE_EPOCHS = 5  # 증분 모드 에폭 수
+TIME_BUDGET = None  # 사용자당 학습 시간 상한(초), None = 제한 없음
+INFERENCE_BATCH_SIZE = 4096  # 추천 생성 시 한 번에 점수를 계산할 후보 수
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')  # 체크포인트/추천 결과 저장 위치
 
 print(f"[NCF] Device: {DEVICE}")
 
@@ -38,106 +51,80 @@ print(f"[NCF] Device: {DEVICE}")
 # 1. 데이터베이스 연결 및 데이터 로드
 # ============================================
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=os.environ.get('DB_HOST', 'localhost'),
-        port=int(os.environ.get('DB_PORT', 3307)),
-        user=os.environ.get('DB_USER', 'root'),
-        password=os.environ.get('DB_PASSWORD', '0000'),
-        database=os.environ.get('DB_NAME', 'music_space_db')
-    )
-
 def load_training_data(user_id):
-    """사용자의 플레이리스트에서 학습 데이터 로드"""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    """사용자의 플레이리스트에서 학습 데이터 로드 (로컬 카탈로그 스냅샷 기반)"""
+    catalog = load_catalog()
 
     # 사용자가 플레이리스트에 추가한 트랙 = positive interactions
-    cursor.execute("""
-        SELECT DISTINCT
-            pt.track_id,
-            t.artist,
-            t.popularity,
-            t.duration,
-            1 as interaction
-        FROM playlist_tracks pt
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        JOIN tracks t ON pt.track_id = t.track_id
-        WHERE p.user_id = %s AND p.space_type = 'PMS'
-    """, (user_id,))
-    positive_tracks = cursor.fetchall()
-
-    # 전체 트랙 목록 (negative sampling용)
-    cursor.execute("""
-        SELECT DISTINCT track_id, artist, popularity, duration
-        FROM tracks
-        WHERE track_id IS NOT NULL
-    """)
-    all_tracks = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    return positive_tracks, all_tracks
+    positive_rows = catalog.playlist_track_rows('PMS', user_id)
+    positive_tracks = catalog.records(positive_rows, ['track_id', 'artist', 'popularity', 'duration'])
+
+    # 전체 트랙 ID (negative sampling용) - int64 배열
+    all_track_ids = catalog.track_ids
+
+    return positive_tracks, all_track_ids
 
 def load_ems_tracks():
-    """EMS 트랙 로드 (추천 대상)"""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
-        SELECT DISTINCT
-            t.track_id,
-            t.title,
-            t.artist,
-            t.album,
-            t.popularity,
-            t.duration,
-            t.artwork
-        FROM tracks t
-        JOIN playlist_tracks pt ON t.track_id = pt.track_id
-        JOIN playlists p ON pt.playlist_id = p.playlist_id
-        WHERE p.space_type = 'EMS'
-    """)
-    tracks = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
-
-    return tracks
+    """EMS 트랙 row 로드 (추천 대상, 결과 dict는 추천된 트랙에 대해서만 생성)"""
+    catalog = load_catalog()
+    return catalog, catalog.playlist_track_rows('EMS')
 
 # ============================================
 # 2. 데이터 전처리
 # ============================================
 
 class MusicDataset(Dataset):
-    """PyTorch Dataset for NCF"""
+    """PyTorch Dataset for NCF (negative samples는 에폭마다 벡터화 재샘플링)"""
 
-    def __init__(self, interactions, num_tracks, negative_samples=4):
-        self.interactions = interactions
+    def __init__(self, interactions, num_tracks, negative_samples=4, seed=None, all_positives=None):
+        self.positives = np.asarray(interactions, dtype=np.int64)
         self.num_tracks = num_tracks
         self.negative_samples = negative_samples
-        self.positive_set = set(interactions)
-
-        # Negative sampling으로 데이터 확장
-        self.samples = []
-        for track_id in interactions:
-            # Positive sample
-            self.samples.append((track_id, 1.0))
-
-            # Negative samples
-            for _ in range(negative_samples):
-                neg_track = np.random.randint(1, num_tracks + 1)
-                while neg_track in self.positive_set:
-                    neg_track = np.random.randint(1, num_tracks + 1)
-                self.samples.append((neg_track, 0.0))
+        self.rng = np.random.default_rng(seed)
+
+        # positive 여부 bitmap (index = 매핑된 track id, 증분 학습 시 학습에 안 쓰는 positive도 제외)
+        self.positive_mask = np.zeros(num_tracks + 1, dtype=bool)
+        self.positive_mask[self.positives] = True
+        if all_positives is not None:
+            self.positive_mask[np.asarray(all_positives, dtype=np.int64)] = True
+        if self.positive_mask[1:].all():
+            raise ValueError("negative sampling에 사용할 트랙이 없습니다")
+
+        # [positives | negatives] 배치 (DataLoader가 shuffle하므로 순서 무관)
+        num_pos = len(self.positives)
+        num_neg = num_pos * negative_samples
+        self.track_ids = np.empty(num_pos + num_neg, dtype=np.int64)
+        self.track_ids[:num_pos] = self.positives
+        self.labels = np.concatenate([
+            np.ones(num_pos, dtype=np.float32),
+            np.zeros(num_neg, dtype=np.float32)
+        ])
+
+        # NumPy 배열과 메모리를 공유하는 텐서 (resample이 in-place로 반영됨)
+        self.track_tensor = torch.from_numpy(self.track_ids)
+        self.label_tensor = torch.from_numpy(self.labels)
+        self.resample()
+
+    def sample_negatives(self, size):
+        """한 번에 size개를 뽑고 positive에 걸린 위치만 다시 뽑음"""
+        negatives = self.rng.integers(1, self.num_tracks + 1, size=size)
+        rejected = np.flatnonzero(self.positive_mask[negatives])
+        while len(rejected):
+            negatives[rejected] = self.rng.integers(1, self.num_tracks + 1, size=len(rejected))
+            rejected = rejected[self.positive_mask[negatives[rejected]]]
+        return negatives
+
+    def resample(self):
+        """negative samples 재추출 (에폭 시작 시 호출)"""
+        num_pos = len(self.positives)
+        self.track_ids[num_pos:] = self.sample_negatives(num_pos * self.negative_samples)
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.track_ids)
 
     def __getitem__(self, idx):
-        track_id, label = self.samples[idx]
-        return torch.tensor(track_id, dtype=torch.long), torch.tensor(label, dtype=torch.float32)
+        """idx: 정수 또는 배치 인덱스 텐서 (batch_loader 사용 시 한 번의 gather)"""
+        return self.track_tensor[idx], self.label_tensor[idx]
 
 # ============================================
 # 3. Neural Collaborative Filtering 모델
@@ -220,8 +207,8 @@ class NCF(nn.Module):
 # 4. 학습
 # ============================================
 
-def train_model(model, train_loader, epochs, lr):
-    """모델 학습"""
+def train_model(model, train_loader, epochs, lr, monitor=None):
+    """모델 학습 (monitor: 검증/early stopping/시간 상한, validation.TrainingMonitor)"""
     criterion = nn.BCELoss()
     optimizer = optim.Adam(model.parameters(), lr=lr, weight_decay=1e-5)
     scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=10, gamma=0.5)
@@ -230,6 +217,10 @@ def train_model(model, train_loader, epochs, lr):
     history = {'loss': [], 'accuracy': []}
 
     for epoch in range(epochs):
+        # 에폭마다 새로운 negative samples 사용
+        if epoch > 0 and hasattr(train_loader.dataset, 'resample'):
+            train_loader.dataset.resample()
+
         total_loss = 0
         correct = 0
         total = 0
@@ -262,58 +253,60 @@ def train_model(model, train_loader, epochs, lr):
         if (epoch + 1) % 5 == 0 or epoch == 0:
             print(f"  Epoch [{epoch+1}/{epochs}] Loss: {avg_loss:.4f}, Accuracy: {accuracy:.2f}%")
 
+        if monitor is not None and monitor.end_epoch(epoch, model):
+            break
+
+    if monitor is not None:
+        monitor.finish(model)
     return history
 
 # ============================================
 # 5. 추천 생성
 # ============================================
 
-def generate_recommendations(model, ems_tracks, track_id_map, top_k=30):
-    """EMS 트랙에 대한 추천 점수 생성"""
+def generate_recommendations(model, catalog, ems_rows, vocab, top_k=30):
+    """EMS 트랙에 대한 추천 점수 생성 (청크 단위 배치 추론 + top-k 선택)"""
     model.eval()
-    recommendations = []
-
-    with torch.no_grad():
-        for track in ems_tracks:
-            track_id = track['track_id']
-            if track_id in track_id_map:
-                mapped_id = track_id_map[track_id]
-                track_tensor = torch.tensor([mapped_id], dtype=torch.long).to(DEVICE)
-                score = model(track_tensor).item()
-
-                recommendations.append({
-                    'track_id': track_id,
-                    'title': track['title'],
-                    'artist': track['artist'],
-                    'album': track.get('album'),
-                    'popularity': track.get('popularity'),
-                    'artwork': track.get('artwork'),
-                    'ncf_score': round(score * 100, 2)  # 0-100 스케일
-                })
-
-    # 점수로 정렬
-    recommendations.sort(key=lambda x: x['ncf_score'], reverse=True)
-    return recommendations[:top_k]
+
+    mapped = vocab_lookup(vocab, catalog.track_ids[ems_rows])
+    candidates = np.asarray(ems_rows)[mapped > 0]
+    if not len(candidates):
+        return []
+
+    mapped_ids = torch.from_numpy(mapped[mapped > 0])
+    scores = batched_scores(model, mapped_ids, batch_size=INFERENCE_BATCH_SIZE, device=DEVICE).numpy()
+    top = top_indices(scores, top_k)
+
+    # 상위 top_k개만 결과 dict로 변환
+    recommendations = catalog.records(
+        candidates[top], ['track_id', 'title', 'artist', 'album', 'popularity', 'artwork']
+    )
+    for r, score in zip(recommendations, scores[top].tolist()):
+        r['ncf_score'] = round(score * 100, 2)  # 0-100 스케일
+
+    return recommendations
 
 # ============================================
 # 6. 메인 실행
 # ============================================
 
-def main():
+def train_user(user_id, incremental=False):
+    """한 사용자의 모델 학습 → 체크포인트/추천 결과 저장 (데이터 부족 시 None)
+
+    incremental=True면 이전 체크포인트가 있을 때 이어서 fine-tuning (없으면 전체 학습)
+    """
     print("=" * 60)
     print("🧠 Neural Collaborative Filtering 학습 시작")
     print("=" * 60)
 
-    USER_ID = 3  # 학습 대상 사용자
-
     # 1. 데이터 로드
     print("\n📊 1단계: 데이터 로드")
-    positive_tracks, all_tracks = load_training_data(USER_ID)
-    ems_tracks = load_ems_tracks()
+    positive_tracks, all_track_ids = load_training_data(user_id)
+    catalog, ems_rows = load_ems_tracks()
 
     print(f"   - Positive interactions: {len(positive_tracks)}")
-    print(f"   - 전체 트랙 수: {len(all_tracks)}")
-    print(f"   - EMS 트랙 수: {len(ems_tracks)}")
+    print(f"   - 전체 트랙 수: {len(all_track_ids)}")
+    print(f"   - EMS 트랙 수: {len(ems_rows)}")
 
     if len(positive_tracks) < 10:
         print("[ERROR] 학습할 데이터가 부족합니다 (최소 10개 필요)")
@@ -322,22 +315,24 @@ def main():
     # 2. 데이터 전처리
     print("\n🔧 2단계: 데이터 전처리")
 
-    # Track ID 매핑 (연속적인 인덱스로)
-    track_ids = [t['track_id'] for t in all_tracks]
-    track_id_map = {tid: idx + 1 for idx, tid in enumerate(track_ids)}
-    reverse_map = {idx + 1: tid for idx, tid in enumerate(track_ids)}
-    num_tracks = len(track_ids)
+    # Track ID 매핑: 정렬된 vocabulary의 위치 + 1 (0 = 미등록)
+    vocab = build_vocab(all_track_ids)
+    num_tracks = len(vocab)
 
     # Positive interactions를 매핑된 ID로 변환
-    positive_mapped = [track_id_map[t['track_id']] for t in positive_tracks if t['track_id'] in track_id_map]
+    positive_mapped = vocab_lookup(vocab, [t['track_id'] for t in positive_tracks])
+    positive_mapped = positive_mapped[positive_mapped > 0]
 
     print(f"   - 매핑된 positive samples: {len(positive_mapped)}")
-    print(f"   - Negative samples per positive: {NEGATIVE_SAMPLES}")
-    print(f"   - 총 학습 샘플: {len(positive_mapped) * (1 + NEGATIVE_SAMPLES)}")
 
-    # Dataset & DataLoader
-    dataset = MusicDataset(positive_mapped, num_tracks, NEGATIVE_SAMPLES)
-    train_loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
+    model_path = os.path.join(MODEL_DIR, f'ncf_user_{user_id}.pt')
+    previous = load_previous(model_path) if incremental else None
+
+    # 검증용 held-out positive (학습에서 제외, track_id 기준 고정 split)
+    train_idx, val_idx = holdout_split(vocab[positive_mapped - 1],
+                                       trained_ids=previous['trained_tracks'] if previous else None)
+    val_positives = positive_mapped[val_idx]
+    print(f"   - 검증 positive: {len(val_positives)}")
 
     # 3. 모델 생성
     print("\n🏗️ 3단계: NCF 모델 생성")
@@ -345,7 +340,38 @@ def main():
         num_tracks=num_tracks,
         embedding_dim=EMBEDDING_DIM,
         hidden_layers=HIDDEN_LAYERS
-    ).to(DEVICE)
+    )
+    train_positives = positive_mapped[train_idx]
+    trained_tracks = vocab[train_positives - 1]
+
+    # 증분 모드: 이전 가중치를 새 vocabulary 위치로 옮기고 새 트랙 + replay만 학습
+    warm = previous is not None and warm_start(model, previous['model_state_dict'], {
+        name: (load_vocab(previous['vocab'], MODEL_DIR), vocab)
+        for name in ('gmf.track_embedding.weight', 'mlp.track_embedding.weight')
+    })
+    model = model.to(DEVICE)
+    epochs = EPOCHS
+    if warm:
+        new_idx, replay_idx = replay_split(trained_tracks, previous['trained_tracks'])
+        train_positives = train_positives[np.concatenate([new_idx, replay_idx])]
+        epochs = FINETUNE_EPOCHS
+        print(f"   - 증분 학습: 새 트랙 {len(new_idx)}개 + replay {len(replay_idx)}개 "
+              f"(이전 학습: {previous.get('trained_at')})")
+
+    print(f"   - Negative samples per positive: {NEGATIVE_SAMPLES}")
+    print(f"   - 총 학습 샘플: {len(train_positives) * (1 + NEGATIVE_SAMPLES)}")
+
+    # Dataset & DataLoader
+    dataset = MusicDataset(train_positives, num_tracks, NEGATIVE_SAMPLES, all_positives=positive_mapped)
+    train_loader = batch_loader(dataset, BATCH_SIZE, shuffle=True)
+
+    # 검증: held-out positive vs 사용자가 담지 않은 트랙 VAL_NEGATIVES개의 순위
+    validate = None
+    if len(val_positives):
+        val_items = torch.from_numpy(val_positives)
+        val_negatives = torch.from_numpy(dataset.sample_negatives(VAL_NEGATIVES))
+        validate = lambda m: (batched_scores(m, val_items, device=DEVICE),
+                              batched_scores(m, val_negatives, device=DEVICE))
 
     total_params = sum(p.numel() for p in model.parameters())
     trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
@@ -355,42 +381,52 @@ def main():
     print(f"   - Hidden layers: {HIDDEN_LAYERS}")
 
     # 4. 학습
-    print(f"\n🎯 4단계: 모델 학습 (Epochs: {EPOCHS})")
-    history = train_model(model, train_loader, EPOCHS, LEARNING_RATE)
+    print(f"\n🎯 4단계: 모델 학습 (Epochs: {epochs}{', warm start' if warm else ''})")
+    monitor = TrainingMonitor(validate, budget=TIME_BUDGET)
+    history = train_model(model, train_loader, epochs, LEARNING_RATE, monitor)
 
     # 5. 모델 저장
     print("\n💾 5단계: 모델 저장")
-    os.makedirs('models', exist_ok=True)
+    os.makedirs(MODEL_DIR, exist_ok=True)
 
-    model_path = f'models/ncf_user_{USER_ID}.pt'
-    torch.save({
+    vocab_name = save_vocab(vocab, MODEL_DIR)  # MODEL_DIR 기준 공유 track vocabulary
+    save_checkpoint({
         'model_state_dict': model.state_dict(),
-        'track_id_map': track_id_map,
-        'reverse_map': reverse_map,
+        'vocab': vocab_name,
         'num_tracks': num_tracks,
         'embedding_dim': EMBEDDING_DIM,
         'hidden_layers': HIDDEN_LAYERS,
-        'user_id': USER_ID,
+        'user_id': user_id,
+        'trained_tracks': torch.from_numpy(trained_tracks),  # 증분 학습 시 새 트랙 판별용
+        'warm_start': warm,
+        'validation': monitor.summary(),
         'trained_at': datetime.now().isoformat(),
         'history': history
     }, model_path)
     print(f"   [OK] 모델 저장: {model_path}")
 
+    # 추론 아티팩트 (학습 코드 없이 로드 가능한 TorchScript)
+    export_scripted(model, scripted_path(model_path), {
+        'model': 'ncf', 'user_id': user_id, 'vocab': vocab_name
+    })
+
     # 6. 추천 생성
     print("\n🎵 6단계: EMS 트랙 추천 생성")
-    recommendations = generate_recommendations(model, ems_tracks, track_id_map, top_k=30)
+    recommendations = generate_recommendations(model, catalog, ems_rows, vocab, top_k=30)
 
     # 추천 결과 저장
-    rec_path = f'models/recommendations_user_{USER_ID}.json'
+    rec_path = os.path.join(MODEL_DIR, f'recommendations_user_{user_id}.json')
     with open(rec_path, 'w', encoding='utf-8') as f:
         json.dump({
-            'user_id': USER_ID,
+            'user_id': user_id,
             'generated_at': datetime.now().isoformat(),
             'model_info': {
                 'type': 'NCF',
                 'embedding_dim': EMBEDDING_DIM,
                 'hidden_layers': HIDDEN_LAYERS,
-                'epochs': EPOCHS,
+                'epochs': monitor.epochs_run,
+                'warm_start': warm,
+                'validation': monitor.summary()['best'],
                 'final_loss': history['loss'][-1],
                 'final_accuracy': history['accuracy'][-1]
             },
@@ -416,5 +452,9 @@ def main():
     print("\n[OK] 완료!")
     return recommendations
 
+def main():
+    USER_ID = 3  # 학습 대상 사용자
+    return train_user(USER_ID)
+
 if __name__ == "__main__":
     main()
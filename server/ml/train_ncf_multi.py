@@ -0,0 +1,288 @@
+"""
+Multi-user Neural Collaborative Filtering
+
+train_ncf.py는 사용자마다 user 벡터 1개 + 트랙 임베딩 테이블 전체를 가진 모델을 따로 학습하지만,
+여기서는 user_embedding 테이블을 두고 전체 사용자의 PMS interaction을 한 번에 학습한다.
+- 체크포인트 1개 (models/ncf_multi.pt + 추론 아티팩트 ncf_multi.ts)
+- 사용자 점수 = user 임베딩 gather + 후보 트랙 배치 forward
+- 트랙/사용자 ID는 공유 vocabulary (정렬 위치 + 1, 0 = 미등록)
+
+실행: cd server/ml && python train_ncf_multi.py
+"""
+
+import os
+import sys
+import json
+import time
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import Dataset
+import numpy as np
+from datetime import datetime
+
+from batching import batch_loader, batched_scores
+from catalog import load_catalog
+from checkpoint import build_vocab, export_scripted, save_checkpoint, save_vocab, scripted_path, vocab_lookup
+from ranking import top_indices
+
+sys.stdout.reconfigure(encoding='utf-8')
+
+DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+EMBEDDING_DIM = 64
+HIDDEN_LAYERS = [128, 64, 32]
+LEARNING_RATE = 0.001
+BATCH_SIZE = 1024
+EPOCHS = 20
+NEGATIVE_SAMPLES = 4
+INFERENCE_BATCH_SIZE = 4096
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', 'models')
+
+print(f"[NCF-Multi] Device: {DEVICE}")
+
+# ============================================
+# 데이터
+# ============================================
+def load_interactions():
+    """전체 사용자의 PMS (user_id, 트랙 row) 쌍과 카탈로그"""
+    catalog = load_catalog()
+    user_ids, rows = catalog.user_track_rows('PMS')
+    return catalog, user_ids, rows
+
+
+class MultiUserDataset(Dataset):
+    """(user, track, label) — 사용자별 negative는 에폭마다 벡터화 재샘플링"""
+
+    def __init__(self, users, tracks, num_tracks, negative_samples=4, seed=None):
+        self.users = np.asarray(users, dtype=np.int64)
+        self.positives = np.asarray(tracks, dtype=np.int64)
+        self.num_tracks = num_tracks
+        self.negative_samples = negative_samples
+        self.rng = np.random.default_rng(seed)
+
+        # positive 여부 판정용 정렬 키 (user * (num_tracks + 1) + track)
+        self.positive_keys = np.unique(self.users * (num_tracks + 1) + self.positives)
+
+        num_neg = len(self.positives) * negative_samples
+        self.user_ids = np.concatenate([self.users, np.repeat(self.users, negative_samples)])
+        self.track_ids = np.concatenate([self.positives, np.zeros(num_neg, dtype=np.int64)])
+        self.labels = np.concatenate([np.ones(len(self.positives), dtype=np.float32),
+                                      np.zeros(num_neg, dtype=np.float32)])
+        self.user_tensor = torch.from_numpy(self.user_ids)
+        self.track_tensor = torch.from_numpy(self.track_ids)
+        self.label_tensor = torch.from_numpy(self.labels)
+        self.resample()
+
+    def _is_positive(self, users, tracks):
+        keys = users * (self.num_tracks + 1) + tracks
+        pos = np.clip(np.searchsorted(self.positive_keys, keys), 0, len(self.positive_keys) - 1)
+        return self.positive_keys[pos] == keys
+
+    def sample_negatives(self, users):
+        """각 user에 대해 그 사용자의 positive가 아닌 트랙 (1..num_tracks) 샘플"""
+        tracks = self.rng.integers(1, self.num_tracks + 1, size=len(users))
+        redraw = np.flatnonzero(self._is_positive(users, tracks))
+        while len(redraw):
+            tracks[redraw] = self.rng.integers(1, self.num_tracks + 1, size=len(redraw))
+            redraw = redraw[self._is_positive(users[redraw], tracks[redraw])]
+        return tracks
+
+    def resample(self):
+        start = len(self.positives)
+        self.track_ids[start:] = self.sample_negatives(self.user_ids[start:])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        """idx: 정수 또는 배치 인덱스 텐서"""
+        return self.user_tensor[idx], self.track_tensor[idx], self.label_tensor[idx]
+
+# ============================================
+# 모델
+# ============================================
+class MultiUserNCF(nn.Module):
+    """GMF + MLP, user/track 임베딩 테이블을 GMF·MLP가 각각 보유 (train_ncf.NCF와 같은 구조)"""
+
+    def __init__(self, num_users, num_tracks, embedding_dim=64, hidden_layers=[128, 64, 32]):
+        super().__init__()
+
+        self.gmf_user = nn.Embedding(num_users + 1, embedding_dim)
+        self.gmf_track = nn.Embedding(num_tracks + 1, embedding_dim)
+        self.mlp_user = nn.Embedding(num_users + 1, embedding_dim)
+        self.mlp_track = nn.Embedding(num_tracks + 1, embedding_dim)
+
+        layers = []
+        input_dim = embedding_dim * 2
+        for hidden_dim in hidden_layers:
+            layers.append(nn.Linear(input_dim, hidden_dim))
+            layers.append(nn.ReLU())
+            layers.append(nn.BatchNorm1d(hidden_dim))
+            layers.append(nn.Dropout(0.2))
+            input_dim = hidden_dim
+        self.mlp = nn.Sequential(*layers)
+
+        self.output_layer = nn.Sequential(
+            nn.Linear(embedding_dim + hidden_layers[-1], 32),
+            nn.ReLU(),
+            nn.Linear(32, 1),
+            nn.Sigmoid()
+        )
+
+        for embed in (self.gmf_user, self.gmf_track, self.mlp_user, self.mlp_track):
+            nn.init.normal_(embed.weight, std=0.01)
+
+    def forward(self, user_ids, track_ids):
+        gmf_out = self.gmf_user(user_ids) * self.gmf_track(track_ids)
+        mlp_out = self.mlp(torch.cat([self.mlp_user(user_ids), self.mlp_track(track_ids)], dim=-1))
+        return self.output_layer(torch.cat([gmf_out, mlp_out], dim=-1)).squeeze(-1)
+
+# ============================================
+# 학습
+# ============================================
+def train_model(model, train_loader, epochs, lr):
+    criterion = nn.BCELoss()
+    optimizer = optim.Adam(model.parameters(), lr=lr, weight_decay=1e-5)
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=10, gamma=0.5)
+
+    model.train()
+    history = {'loss': [], 'accuracy': []}
+
+    for epoch in range(epochs):
+        if epoch > 0:
+            train_loader.dataset.resample()
+
+        total_loss = 0
+        correct = 0
+        total = 0
+        for user_ids, track_ids, labels in train_loader:
+            user_ids = user_ids.to(DEVICE)
+            track_ids = track_ids.to(DEVICE)
+            labels = labels.to(DEVICE)
+
+            optimizer.zero_grad()
+            predictions = model(user_ids, track_ids)
+            loss = criterion(predictions, labels)
+            loss.backward()
+            optimizer.step()
+
+            total_loss += loss.item()
+            correct += ((predictions > 0.5).float() == labels).sum().item()
+            total += labels.size(0)
+
+        scheduler.step()
+        history['loss'].append(total_loss / len(train_loader))
+        history['accuracy'].append(correct / total * 100)
+
+        if (epoch + 1) % 5 == 0 or epoch == 0:
+            print(f"  Epoch [{epoch+1}/{epochs}] Loss: {history['loss'][-1]:.4f}, "
+                  f"Accuracy: {history['accuracy'][-1]:.2f}%")
+
+    return history
+
+# ============================================
+# 추천
+# ============================================
+def score_user(model, user_idx, mapped_track_ids):
+    """한 사용자의 후보 점수: user 인덱스 하나를 후보 수만큼 broadcast해 배치 forward"""
+    model.eval()
+    user = torch.tensor([user_idx], dtype=torch.long)
+    return batched_scores(lambda tracks: model(user.to(tracks.device).expand(len(tracks)), tracks),
+                          mapped_track_ids, batch_size=INFERENCE_BATCH_SIZE, device=DEVICE)
+
+# ============================================
+# Main
+# ============================================
+def train_all():
+    print("=" * 60)
+    print("[NCF-Multi] 전체 사용자 NCF 학습")
+    print("=" * 60)
+
+    # 1. 데이터
+    print("\n[1] 데이터 로드")
+    catalog, user_ids, rows = load_interactions()
+    track_vocab = build_vocab(catalog.track_ids)
+    user_vocab = build_vocab(user_ids)
+    users = vocab_lookup(user_vocab, user_ids)
+    tracks = vocab_lookup(track_vocab, catalog.track_ids[rows])
+    print(f"   - 사용자: {len(user_vocab)}")
+    print(f"   - 트랙: {len(track_vocab):,}")
+    print(f"   - Positive interactions: {len(tracks):,}")
+
+    if not len(tracks):
+        print("[ERROR] 학습할 PMS interaction이 없습니다")
+        return None
+
+    dataset = MultiUserDataset(users, tracks, len(track_vocab), NEGATIVE_SAMPLES)
+    train_loader = batch_loader(dataset, BATCH_SIZE, shuffle=True)
+    print(f"   - 학습 샘플: {len(dataset):,} (negative {NEGATIVE_SAMPLES}배)")
+
+    # 2. 모델
+    print("\n[2] 모델 생성")
+    model = MultiUserNCF(len(user_vocab), len(track_vocab), EMBEDDING_DIM, HIDDEN_LAYERS).to(DEVICE)
+    print(f"   - 파라미터: {sum(p.numel() for p in model.parameters()):,}")
+
+    # 3. 학습
+    print(f"\n[3] 모델 학습 (Epochs: {EPOCHS})")
+    started = time.time()
+    history = train_model(model, train_loader, EPOCHS, LEARNING_RATE)
+    print(f"   - 학습 시간: {time.time() - started:.1f}s")
+
+    # 4. 저장
+    print("\n[4] 모델 저장")
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path = os.path.join(MODEL_DIR, 'ncf_multi.pt')
+    track_vocab_name = save_vocab(track_vocab, MODEL_DIR)
+    user_vocab_name = save_vocab(user_vocab, MODEL_DIR, kind='users')
+    save_checkpoint({
+        'model_state_dict': model.state_dict(),
+        'track_vocab': track_vocab_name,
+        'user_vocab': user_vocab_name,
+        'num_users': len(user_vocab),
+        'num_tracks': len(track_vocab),
+        'embedding_dim': EMBEDDING_DIM,
+        'hidden_layers': HIDDEN_LAYERS,
+        'trained_at': datetime.now().isoformat(),
+        'history': history
+    }, model_path)
+    export_scripted(model, scripted_path(model_path), {
+        'model': 'ncf_multi', 'track_vocab': track_vocab_name, 'user_vocab': user_vocab_name
+    })
+    print(f"   [OK] 모델 저장: {model_path}")
+
+    # 5. 요약 (사용자별 EMS top 5)
+    ems_rows = catalog.playlist_track_rows('EMS')
+    mapped = torch.from_numpy(vocab_lookup(track_vocab, catalog.track_ids[ems_rows]))
+    summary = {}
+    for user_id, user_idx in zip(user_vocab.tolist(), range(1, len(user_vocab) + 1)):
+        if not len(ems_rows):
+            break
+        scores = score_user(model, user_idx, mapped).numpy()
+        top = top_indices(scores, 5)
+        summary[user_id] = [
+            {'track_id': int(catalog.track_ids[ems_rows[i]]), 'ncf_score': round(float(scores[i]) * 100, 2)}
+            for i in top
+        ]
+
+    with open(os.path.join(MODEL_DIR, 'ncf_multi_summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'generated_at': datetime.now().isoformat(),
+            'final_loss': history['loss'][-1],
+            'final_accuracy': history['accuracy'][-1],
+            'top5': summary
+        }, f, ensure_ascii=False, indent=2)
+
+    print("\n" + "=" * 60)
+    print("[DONE] 학습 완료!")
+    print("=" * 60)
+    print(f"   - Final Loss: {history['loss'][-1]:.4f}")
+    print(f"   - Final Accuracy: {history['accuracy'][-1]:.2f}%")
+    return model
+
+
+def main():
+    return train_all()
+
+
+if __name__ == "__main__":
+    main()
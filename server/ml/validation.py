@@ -0,0 +1,132 @@
+"""
+학습 중 검증 / early stopping / 학습 시간 상한 (NCF · Hybrid · Track2Vec 공용)
+
+- holdout_split: 사용자 positive 일부를 검증용으로 떼어 둠 (학습에는 사용하지 않음)
+  track_id 해시로 정하므로 같은 트랙은 실행마다 같은 쪽 → warm start에서도 검증 집합이 고정
+- rank_metrics: held-out positive마다 공용 negative 후보 안에서의 순위 → HR@K / NDCG@K
+- TrainingMonitor: 에폭 끝마다 호출. EVAL_EVERY 에폭마다 검증하고,
+  NDCG@K가 PATIENCE번 연속 개선되지 않거나 시간 상한(budget 초)을 넘으면 중단,
+  finish()에서 검증 성능이 가장 좋았던 가중치로 되돌림
+"""
+
+import time
+
+import numpy as np
+import torch
+
+VAL_RATIO = 0.1
+MIN_HOLDOUT_POSITIVES = 20  # positive가 이보다 적으면 검증 없이 전부 학습
+VAL_NEGATIVES = 100  # 순위 계산용 negative 후보 수
+EVAL_K = 10
+EVAL_EVERY = 5  # 검증 주기 (에폭)
+PATIENCE = 2  # 개선 없는 검증 횟수 허용치
+SPLIT_SALT = 0x5EED5A170B5E4D11  # 바꾸면 모든 사용자의 검증 집합이 바뀜 (이전 체크포인트의 학습 트랙이 검증으로 샐 수 있음)
+
+
+def _track_fraction(track_ids):
+    """track_id → [0, 1) 균등 분포 값 (salt + splitmix64, 실행/프로세스와 무관하게 고정)"""
+    x = np.asarray(track_ids, dtype=np.int64).astype(np.uint64) ^ np.uint64(SPLIT_SALT)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def holdout_split(track_ids, ratio=VAL_RATIO, trained_ids=None):
+    """positive track_id 배열 → (학습 인덱스, 검증 인덱스)
+
+    트랙마다 해시 값이 ratio 미만이면 검증 (개수는 약 ratio 비율). 같은 트랙은 항상 같은 쪽이므로
+    warm start 시 이전 모델이 학습한 트랙이 검증에 섞이거나, 지난번 검증 트랙이 '새 트랙'으로 잡히지 않는다.
+    trained_ids: 이전 체크포인트가 학습한 트랙 — 검증에서 제외 (무작위 split으로 학습된 이전 체크포인트 대비)
+    """
+    track_ids = np.asarray(track_ids, dtype=np.int64)
+    held = np.zeros(len(track_ids), dtype=bool)
+    if len(track_ids) >= MIN_HOLDOUT_POSITIVES:
+        held = _track_fraction(track_ids) < ratio
+        if trained_ids is not None:
+            held &= ~np.isin(track_ids, np.asarray(trained_ids, dtype=np.int64))
+    return np.flatnonzero(~held), np.flatnonzero(held)
+
+
+def rank_metrics(pos_scores, neg_scores, k=EVAL_K):
+    """positive 점수 (P,) / negative 점수 (N,) → {'hr', 'ndcg'} (동점은 negative가 앞선 것으로 계산)"""
+    pos_scores = np.asarray(pos_scores, dtype=np.float64)
+    neg_scores = np.sort(np.asarray(neg_scores, dtype=np.float64))
+    rank = len(neg_scores) - np.searchsorted(neg_scores, pos_scores, side='left')
+    hit = rank < k
+    return {
+        'hr': float(hit.mean()) if len(rank) else 0.0,
+        'ndcg': float(np.where(hit, 1.0 / np.log2(rank + 2), 0.0).mean()) if len(rank) else 0.0,
+    }
+
+
+class TrainingMonitor:
+    """validate(model) → (positive 점수, negative 점수). None이면 시간 상한만 적용"""
+
+    def __init__(self, validate=None, budget=None, eval_every=EVAL_EVERY, patience=PATIENCE, k=EVAL_K):
+        self.validate = validate
+        self.budget = budget
+        self.eval_every = eval_every
+        self.patience = patience
+        self.k = k
+        self.started = time.monotonic()
+        self.history = []
+        self.best = None  # (ndcg, epoch, state_dict 복사본)
+        self.bad_evals = 0
+        self.stopped = None  # 'early_stop' | 'budget'
+        self.epochs_run = 0
+
+    def _evaluate(self, epoch, model):
+        was_training = model.training
+        model.eval()
+        with torch.no_grad():
+            metrics = rank_metrics(*self.validate(model), self.k)
+        model.train(was_training)
+
+        metrics['epoch'] = epoch
+        self.history.append(metrics)
+        print(f"  [Val] Epoch {epoch} HR@{self.k}: {metrics['hr']:.3f}, NDCG@{self.k}: {metrics['ndcg']:.3f}")
+
+        if self.best is None or metrics['ndcg'] > self.best[0]:
+            state = {name: t.detach().clone() for name, t in model.state_dict().items()}
+            self.best = (metrics['ndcg'], epoch, state)
+            self.bad_evals = 0
+        else:
+            self.bad_evals += 1
+
+    def end_epoch(self, epoch, model):
+        """에폭(0부터) 종료 시 호출 → 학습을 멈춰야 하면 True"""
+        self.epochs_run = epoch + 1
+        if self.validate is not None and self.epochs_run % self.eval_every == 0:
+            self._evaluate(self.epochs_run, model)
+            if self.bad_evals >= self.patience:
+                self.stopped = 'early_stop'
+                return True
+        if self.budget and time.monotonic() - self.started > self.budget:
+            self.stopped = 'budget'
+            return True
+        return False
+
+    def finish(self, model):
+        """마지막 에폭까지 검증한 뒤 가장 좋았던 가중치로 복원"""
+        if self.validate is None:
+            return
+        if not self.history or self.history[-1]['epoch'] != self.epochs_run:
+            self._evaluate(self.epochs_run, model)
+        if self.best is not None and self.best[1] != self.epochs_run:
+            model.load_state_dict(self.best[2])
+        if self.stopped:
+            print(f"  [Stop] {self.stopped} at epoch {self.epochs_run} (best epoch {self.best[1]})")
+
+    def summary(self):
+        """체크포인트/결과 파일에 기록할 요약"""
+        best_epoch = self.best[1] if self.best else None
+        return {
+            'epochs_run': self.epochs_run,
+            'stopped': self.stopped,
+            'seconds': round(time.monotonic() - self.started, 2),
+            'best': next((h for h in self.history if h['epoch'] == best_epoch), None),
+            'history': self.history,
+        }
@@ -0,0 +1,77 @@
+"""
+이전 체크포인트에서 이어 학습 (증분 fine-tuning) 공용 함수
+
+플레이리스트에 곡 몇 개가 추가된 정도라면 처음부터 다시 학습하지 않고,
+이전 가중치에서 시작해 새 interaction + 이전 interaction 일부(replay)만 몇 에폭 학습한다.
+
+- load_previous: 이어 학습 가능한 이전 체크포인트 (없거나 형식이 다르면 None)
+- remap_rows: 임베딩 행을 key(트랙 ID / 아티스트) 기준으로 새 vocabulary 위치로 옮김
+- warm_start: 새 크기의 모델에 이전 state_dict 복사 (임베딩은 remap, 새 key 행은 초기값 유지)
+- replay_split: 현재 positive 중 새로 추가된 것 + replay 샘플 인덱스
+"""
+
+import os
+
+import numpy as np
+import torch
+
+from checkpoint import load_checkpoint
+
+REPLAY_RATIO = 4  # 새 positive 1개당 replay할 이전 positive 수
+MIN_REPLAY = 64
+
+
+def load_previous(path):
+    """이어 학습할 체크포인트 (학습 positive 목록이 없는 이전 형식이면 None)"""
+    if not os.path.exists(path):
+        return None
+    ckpt = load_checkpoint(path)
+    return ckpt if 'trained_tracks' in ckpt else None
+
+
+def remap_rows(old_weight, old_keys, new_weight, new_keys):
+    """old 임베딩의 행(key 위치 + 1)을 new의 같은 key 행으로 복사 (0행 = 미등록 행도 복사) → 옮긴 key 수"""
+    old_keys = np.asarray(old_keys)
+    new_keys = np.asarray(new_keys)
+    with torch.no_grad():
+        new_weight[0] = old_weight[0]
+        if not len(old_keys) or not len(new_keys):
+            return 0
+        order = np.argsort(old_keys, kind='stable')
+        sorted_keys = old_keys[order]
+        pos = np.clip(np.searchsorted(sorted_keys, new_keys), 0, len(sorted_keys) - 1)
+        found = sorted_keys[pos] == new_keys
+        dst = torch.from_numpy(np.flatnonzero(found) + 1)
+        src = torch.from_numpy(order[pos[found]] + 1)
+        new_weight[dst] = old_weight[src].to(new_weight.dtype)
+    return int(found.sum())
+
+
+def warm_start(model, state_dict, remaps):
+    """remaps: {파라미터 이름: (old_keys, new_keys)}
+
+    나머지 파라미터/버퍼는 모양이 같을 때만 그대로 복사. 모양이 다르면(하이퍼파라미터 변경)
+    아무것도 바꾸지 않고 False → 호출 측은 처음부터 학습.
+    """
+    current = model.state_dict()
+    if set(current) != set(state_dict) or any(
+            current[name].shape != state_dict[name].shape for name in current if name not in remaps):
+        return False
+
+    for name, tensor in current.items():
+        if name in remaps:
+            old_keys, new_keys = remaps[name]
+            remap_rows(state_dict[name], old_keys, tensor, new_keys)
+        else:
+            tensor.copy_(state_dict[name])
+    return True
+
+
+def replay_split(current_ids, trained_ids, rng=None):
+    """현재 positive(current_ids) 중 학습에 쓸 인덱스 → (새로 추가된 것, replay 샘플)"""
+    rng = rng or np.random.default_rng()
+    is_new = ~np.isin(np.asarray(current_ids), np.asarray(trained_ids))
+    new_idx = np.flatnonzero(is_new)
+    old_idx = np.flatnonzero(~is_new)
+    num_replay = min(len(old_idx), max(MIN_REPLAY, REPLAY_RATIO * len(new_idx)))
+    return new_idx, np.sort(rng.choice(old_idx, num_replay, replace=False))
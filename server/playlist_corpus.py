@@ -0,0 +1,190 @@
+"""
+플레이리스트 코퍼스 스트리밍 로더 (training_data.json / training_data_v3.json)
+
+JSON 배열을 한 번에 json.load 하지 않고 플레이리스트 객체를 하나씩 디코딩해
+컴팩트 배열로 누적한다:
+- playlist_ids / types / titles / offsets (플레이리스트별 트랙 구간)
+- track_ids, track_titles, track_artists, texts (TF-IDF 입력)
+- features: 트랙별 오디오 특성 (T, 6) float32 (v3 export에만 존재)
+
+변환 결과는 `<json>.cache/`에 .npy로 저장되며, 원본 mtime/크기가 같으면
+다음 실행부터 JSON 디코딩 없이 mmap으로 연다.
+"""
+
+import os
+import json
+from array import array
+
+import numpy as np
+
+from ml.columnar import StringColumn, begin_dir, commit_dir, current_dir
+
+CACHE_VERSION = 1
+READ_SIZE = 1 << 16
+
+SPACE_TYPES = ('PMS', 'EMS', 'GMS')
+FEATURE_NAMES = ('tempo', 'energy', 'valence', 'danceability', 'acousticness', 'instrumentalness')
+
+ARRAY_FIELDS = ('playlist_id', 'type_code', 'offsets', 'track_id', 'features')
+STRING_FIELDS = ('title', 'track_title', 'track_artist', 'text')
+
+
+class PlaylistCorpus:
+    def __init__(self, arrays):
+        self.playlist_ids = arrays['playlist_id']
+        self.type_codes = arrays['type_code']
+        self.titles = arrays['title']
+        self.offsets = arrays['offsets']
+        self.track_ids = arrays['track_id']
+        self.track_titles = arrays['track_title']
+        self.track_artists = arrays['track_artist']
+        self.texts = arrays['text']
+        self.features = arrays['features']
+
+    def __len__(self):
+        return len(self.playlist_ids)
+
+    @property
+    def has_features(self):
+        return self.features.shape[1] > 0
+
+    def types(self):
+        return [SPACE_TYPES[c] if c >= 0 else None for c in self.type_codes]
+
+    def track_range(self, idx):
+        return int(self.offsets[idx]), int(self.offsets[idx + 1])
+
+    def documents(self):
+        """플레이리스트별 트랙 텍스트를 공백으로 이어붙인 문서"""
+        for idx in range(len(self)):
+            start, end = self.track_range(idx)
+            yield " ".join(self.texts[i] for i in range(start, end))
+
+    def track_records(self, idx, limit=None):
+        start, end = self.track_range(idx)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [{
+            'track_id': int(self.track_ids[i]),
+            'title': self.track_titles[i],
+            'artist': self.track_artists[i],
+        } for i in range(start, end)]
+
+    def feature_means(self):
+        """플레이리스트별 평균 오디오 특성 (P, 6) — 빈 플레이리스트는 0 벡터"""
+        sizes = np.diff(self.offsets)
+        means = np.zeros((len(self), self.features.shape[1]), dtype=np.float64)
+        nonempty = sizes > 0
+        if nonempty.any():
+            sums = np.add.reduceat(self.features.astype(np.float64),
+                                   self.offsets[:-1][nonempty], axis=0)
+            means[nonempty] = sums / sizes[nonempty, None]
+        return means
+
+
+def iter_json_array(filepath, read_size=READ_SIZE):
+    """최상위 JSON 배열의 원소를 하나씩 yield (전체 파일을 메모리에 올리지 않음)"""
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buf = f.read(read_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError(f"{filepath}: top-level JSON array expected")
+        buf = buf[1:]
+        eof = False
+
+        while True:
+            buf = buf.lstrip().lstrip(',').lstrip()
+            if buf.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(read_size)
+                eof = not chunk
+                buf += chunk
+                continue
+            yield item
+            buf = buf[end:]
+
+
+def parse_corpus(filepath):
+    """JSON → PlaylistCorpus (플레이리스트 단위 스트리밍)"""
+    playlist_ids = array('q')
+    type_codes = array('b')
+    offsets = array('q', [0])
+    track_ids = array('q')
+    features = array('f')
+    strings = {name: [] for name in STRING_FIELDS}
+    has_features = None
+
+    for p in iter_json_array(filepath):
+        playlist_ids.append(p['playlist_id'])
+        type_codes.append(SPACE_TYPES.index(p['type']) if p.get('type') in SPACE_TYPES else -1)
+        strings['title'].append(p.get('title'))
+
+        for t in p['tracks']:
+            track_ids.append(t.get('track_id') or 0)
+            strings['track_title'].append(t.get('title'))
+            strings['track_artist'].append(t.get('artist'))
+            strings['text'].append(t.get('text') or t.get('name_text'))
+            if has_features is None:
+                has_features = 'features' in t
+            if has_features:
+                features.extend(t['features'][k] for k in FEATURE_NAMES)
+        offsets.append(len(track_ids))
+
+    width = len(FEATURE_NAMES) if has_features else 0
+    arrays = {
+        'playlist_id': np.frombuffer(playlist_ids, dtype=np.int64).copy(),
+        'type_code': np.frombuffer(type_codes, dtype=np.int8).copy(),
+        'offsets': np.frombuffer(offsets, dtype=np.int64).copy(),
+        'track_id': np.frombuffer(track_ids, dtype=np.int64).copy(),
+        'features': np.frombuffer(features, dtype=np.float32).copy().reshape(-1, width)
+        if width else np.zeros((len(track_ids), 0), dtype=np.float32),
+    }
+    for name, values in strings.items():
+        arrays[name] = StringColumn.from_list(values)
+    return PlaylistCorpus(arrays)
+
+
+def _source_key(filepath):
+    stat = os.stat(filepath)
+    return {'version': CACHE_VERSION, 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def load_corpus(filepath, cache_dir=None):
+    """캐시가 유효하면 mmap으로 열고, 아니면 스트리밍 파싱 후 캐시를 기록"""
+    cache_dir = cache_dir or filepath + '.cache'
+    key = _source_key(filepath)
+    current = current_dir(cache_dir)
+    key_path = os.path.join(current, 'source.json')
+
+    if os.path.exists(key_path):
+        with open(key_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == key:
+                arrays = {name: np.load(os.path.join(current, f'{name}.npy'), mmap_mode='r')
+                          for name in ARRAY_FIELDS}
+                for name in STRING_FIELDS:
+                    arrays[name] = StringColumn.load(current, name, mmap_mode='r')
+                return PlaylistCorpus(arrays)
+
+    corpus = parse_corpus(filepath)
+
+    tmp_path = begin_dir(cache_dir)
+    arrays = {
+        'playlist_id': corpus.playlist_ids, 'type_code': corpus.type_codes,
+        'offsets': corpus.offsets, 'track_id': corpus.track_ids, 'features': corpus.features,
+        'title': corpus.titles, 'track_title': corpus.track_titles,
+        'track_artist': corpus.track_artists, 'text': corpus.texts,
+    }
+    for name in ARRAY_FIELDS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), arrays[name])
+    for name in STRING_FIELDS:
+        arrays[name].save(tmp_path, name)
+    with open(os.path.join(tmp_path, 'source.json'), 'w', encoding='utf-8') as f:
+        json.dump(key, f)
+    commit_dir(tmp_path, cache_dir)
+
+    return corpus
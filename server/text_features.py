@@ -0,0 +1,185 @@
+"""
+플레이리스트 텍스트 특성의 증분 갱신 (feature hashing + 저장된 DF)
+
+TfidfVectorizer를 매 실행마다 코퍼스 전체에 다시 fit하지 않고:
+- HashingVectorizer(고정 차원, 상태 없음)로 플레이리스트 문서의 term count를 만든다
+- 플레이리스트별 count 행(CSR)과 문서 빈도(DF)를 `<json>.hashed/`에 저장
+- 다음 실행에서는 플레이리스트별 내용 digest를 비교해 새로 생기거나 바뀐 플레이리스트만
+  토큰화해 행을 뒤에 붙이고 DF를 갱신 (바뀌거나 사라진 플레이리스트의 이전 행은 DF에서 빼고 비활성 처리)
+- TF-IDF 가중치(smooth idf, L2 정규화)는 현재 DF로 조회 시점에 계산
+
+TfidfVectorizer(max_features=5000)와 달리 어휘 상한이 없고 해시 충돌이 있을 수 있다 (N_FEATURES로 조정).
+원본 JSON의 mtime/크기가 같으면 digest 비교도 건너뛴다.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from ml.columnar import begin_dir, commit_dir, current_dir
+
+CACHE_VERSION = 1
+N_FEATURES = 1 << 20
+COMPACT_RATIO = 0.5  # 비활성 행 비율이 이보다 크면 저장 전에 압축
+
+ARRAY_FIELDS = ('data', 'indices', 'indptr', 'playlist_ids', 'digests', 'alive', 'df')
+
+
+def _vectorizer(n_features):
+    # TfidfVectorizer(stop_words='english')와 같은 토큰화, 부호 없는 raw count
+    return HashingVectorizer(n_features=n_features, stop_words='english',
+                             alternate_sign=False, norm=None)
+
+
+def playlist_digests(corpus):
+    """플레이리스트별 텍스트 digest (int64) — 문서를 만들지 않고 텍스트 바이트/경계만 해시"""
+    texts = corpus.texts
+    data = np.asarray(texts.data)
+    text_offsets = np.asarray(texts.offsets)
+    digests = np.empty(len(corpus), dtype=np.int64)
+    for idx in range(len(corpus)):
+        start, end = corpus.track_range(idx)
+        h = hashlib.blake2b(digest_size=8)
+        h.update(np.diff(text_offsets[start:end + 1]).tobytes())
+        h.update(data[text_offsets[start]:text_offsets[end]].tobytes())
+        digests[idx] = np.frombuffer(h.digest(), dtype=np.int64)[0]
+    return digests
+
+
+class HashedTextFeatures:
+    """플레이리스트별 term count 행 (비활성 행 포함) + 활성 행 기준 DF"""
+
+    def __init__(self, counts, playlist_ids, digests, alive, df, meta):
+        self.counts = counts
+        self.playlist_ids = playlist_ids
+        self.digests = digests
+        self.alive = alive
+        self.df = df
+        self.meta = meta
+
+    @classmethod
+    def empty(cls, n_features=N_FEATURES):
+        return cls(sp.csr_matrix((0, n_features), dtype=np.float64), np.zeros(0, dtype=np.int64),
+                   np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool),
+                   np.zeros(n_features, dtype=np.int64), {'n_features': n_features})
+
+    @property
+    def num_docs(self):
+        return int(self.alive.sum())
+
+    def _live_rows(self):
+        """활성 행의 playlist_id 정렬 순서 → (정렬된 id, 행 번호)"""
+        rows = np.flatnonzero(self.alive)
+        order = np.argsort(self.playlist_ids[rows], kind='stable')
+        return self.playlist_ids[rows][order], rows[order]
+
+    def rows_of(self, playlist_ids):
+        """playlist_id 배열 → 활성 행 번호 (없으면 -1)"""
+        ids, rows = self._live_rows()
+        playlist_ids = np.asarray(playlist_ids, dtype=np.int64)
+        if not len(ids):
+            return np.full(len(playlist_ids), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(ids, playlist_ids), 0, len(ids) - 1)
+        return np.where(ids[pos] == playlist_ids, rows[pos], -1)
+
+    def update(self, corpus, digests=None):
+        """코퍼스와 비교해 새/변경 플레이리스트만 벡터화해 뒤에 붙이고 DF 갱신 → 통계 dict"""
+        digests = playlist_digests(corpus) if digests is None else digests
+        playlist_ids = np.asarray(corpus.playlist_ids, dtype=np.int64)
+        rows = self.rows_of(playlist_ids)
+        unchanged = rows >= 0
+        unchanged[unchanged] = self.digests[rows[unchanged]] == digests[unchanged]
+        stale = np.setdiff1d(np.flatnonzero(self.alive), rows[unchanged])
+
+        # 바뀌거나 사라진 플레이리스트의 이전 행은 DF에서 빼고 비활성 처리
+        if len(stale):
+            self.df -= np.bincount(self.counts[stale].indices, minlength=len(self.df))
+            self.alive[stale] = False
+
+        # 새/변경 플레이리스트만 토큰화
+        todo = np.flatnonzero(~unchanged)
+        if len(todo):
+            texts = corpus.texts
+            docs = [" ".join(texts[i] for i in range(*corpus.track_range(idx))) for idx in todo]
+            added = _vectorizer(len(self.df)).transform(docs).astype(np.float64).tocsr()
+            added.sum_duplicates()
+            self.df += np.bincount(added.indices, minlength=len(self.df))
+            self.counts = sp.vstack([self.counts, added], format='csr')
+            self.playlist_ids = np.concatenate([self.playlist_ids, playlist_ids[todo]])
+            self.digests = np.concatenate([self.digests, digests[todo]])
+            self.alive = np.concatenate([self.alive, np.ones(len(todo), dtype=bool)])
+
+        if len(self.alive) and (~self.alive).mean() > COMPACT_RATIO:
+            self.compact()
+        return {'reused': int(unchanged.sum()), 'vectorized': len(todo), 'dropped': len(stale)}
+
+    def compact(self):
+        keep = np.flatnonzero(self.alive)
+        self.counts = self.counts[keep]
+        self.playlist_ids = self.playlist_ids[keep]
+        self.digests = self.digests[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+
+    def tfidf(self, playlist_ids):
+        """playlist_id 순서의 TF-IDF 행렬 (CSR, smooth idf, L2 정규화 — TfidfVectorizer 기본값과 같은 가중)"""
+        rows = self.rows_of(playlist_ids)
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} playlists are not in the hashed text features")
+        idf = np.log((1 + self.num_docs) / (1 + self.df)) + 1
+        matrix = self.counts[rows].tocsr(copy=True)
+        matrix.data *= idf[matrix.indices]
+        return normalize(matrix)
+
+    def save(self, path):
+        tmp_path = begin_dir(path)
+        arrays = {
+            'data': self.counts.data, 'indices': self.counts.indices, 'indptr': self.counts.indptr,
+            'playlist_ids': self.playlist_ids, 'digests': self.digests, 'alive': self.alive, 'df': self.df,
+        }
+        for name in ARRAY_FIELDS:
+            np.save(os.path.join(tmp_path, f'{name}.npy'), arrays[name])
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(self.meta, version=CACHE_VERSION), f)
+        commit_dir(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, n_features=N_FEATURES):
+        """저장본이 없거나 버전/차원이 다르면 None"""
+        path = current_dir(path)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION or meta.get('n_features') != n_features:
+            return None
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy')) for name in ARRAY_FIELDS}
+        counts = sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                               shape=(len(arrays['playlist_ids']), n_features))
+        return cls(counts, arrays['playlist_ids'], arrays['digests'], arrays['alive'], arrays['df'], meta)
+
+
+def _source_key(filepath):
+    stat = os.stat(filepath)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def hashed_tfidf(corpus, filepath, cache_dir=None, n_features=N_FEATURES):
+    """코퍼스 순서의 TF-IDF 행렬 — 저장본을 증분 갱신해 사용 (반환: (행렬, 통계 dict))"""
+    cache_dir = cache_dir or filepath + '.hashed'
+    source = _source_key(filepath)
+    features = HashedTextFeatures.load(cache_dir, n_features)
+
+    if features is not None and features.meta.get('source') == source:
+        stats = {'reused': len(corpus), 'vectorized': 0, 'dropped': 0}
+    else:
+        features = features or HashedTextFeatures.empty(n_features)
+        stats = features.update(corpus)
+        features.meta['source'] = source
+        features.save(cache_dir)
+    return features.tfidf(corpus.playlist_ids), stats
@@ -1,92 +1,110 @@
 
-import json
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+import argparse
+import csv
 import sys
 import os
 
+from playlist_corpus import load_corpus
+from text_features import hashed_tfidf
+from ml.ranking import block_top_k
+
+TOP_K = 5
+
 def load_data(filepath):
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_corpus(filepath)
     except FileNotFoundError:
         print(f"Error: {filepath} not found.")
         sys.exit(1)
 
-def train_model():
+def write_table(path, ids, user_indices, ems_indices, scores, cols):
+    """One row per recommendation: pms_playlist_id, rank, ems_playlist_id, score"""
+    ems_ids = np.asarray(ids)[ems_indices]
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['pms_playlist_id', 'rank', 'ems_playlist_id', 'score'])
+        for row, user_idx in enumerate(user_indices):
+            for rank, (score, col) in enumerate(zip(scores[row], cols[row]), 1):
+                writer.writerow([int(ids[user_idx]), rank, int(ems_ids[col]), f"{score:.6f}"])
+
+def train_model(out_path=None, top_k=TOP_K, hashed=False):
     print("Loading data...")
     data_path = os.path.join(os.path.dirname(__file__), 'training_data.json')
     playlists = load_data(data_path)
 
-    if not playlists:
+    if not len(playlists):
         print("No playlist data found.")
         return
 
-    # Prepare corpus for TF-IDF
-    # We combine all track names & artists in a playlist into a single string document
-    documents = []
-    ids = []
-    types = []
-    titles = []
-
-    for p in playlists:
-        # Combine all tracks text
-        playlist_text = " ".join([t['text'] for t in p['tracks']])
-        documents.append(playlist_text)
-        ids.append(p['playlist_id'])
-        types.append(p['type'])
-        titles.append(p['title'])
-
-    print(f"Training TF-IDF model on {len(documents)} playlists...")
-    
-    # Initialize TF-IDF Vectorizer
-    vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = vectorizer.fit_transform(documents)
+    ids = playlists.playlist_ids
+    types = playlists.types()
+    titles = playlists.titles.tolist()
+
+    if hashed:
+        # Hashed term counts + stored document frequencies; only new/changed playlists are tokenized
+        tfidf_matrix, stats = hashed_tfidf(playlists, data_path)
+        print(f"Hashed TF-IDF on {len(playlists)} playlists "
+              f"({stats['vectorized']} vectorized, {stats['reused']} reused)...")
+    else:
+        # Prepare corpus for TF-IDF
+        # We combine all track names & artists in a playlist into a single string document
+        documents = list(playlists.documents())
+        print(f"Training TF-IDF model on {len(documents)} playlists...")
+
+        # Initialize TF-IDF Vectorizer (rows L2-normalized once, so dot product = cosine)
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
+        tfidf_matrix = normalize(vectorizer.fit_transform(documents)).tocsr()
     
-    # Identify Target (User) Playlists
+    # Identify Target (User) Playlists and candidates (EMS)
     user_indices = [i for i, t in enumerate(types) if t == 'PMS']
+    ems_indices = [i for i, t in enumerate(types) if t == 'EMS']
     
     if not user_indices:
         print("No User playlists (PMS) found to recommend for.")
         return
 
+    if not ems_indices:
+        print("No Platform playlists (EMS) found to recommend.")
+        return
+
     print(f"Found {len(user_indices)} User playlists. Generating recommendations...")
 
-    for user_idx in user_indices:
-        user_vector = tfidf_matrix[user_idx]
+    # Score every PMS playlist against the EMS submatrix in one sparse x sparse product
+    sim = tfidf_matrix[user_indices] @ tfidf_matrix[ems_indices].T
+    scores, cols = block_top_k(lambda q0, q1, t0, t1: sim[q0:q1, t0:t1].toarray(),
+                               len(user_indices), len(ems_indices), min(top_k, len(ems_indices)))
+
+    if out_path:
+        write_table(out_path, ids, user_indices, ems_indices, scores, cols)
+        print(f"Saved {scores.size} recommendations to {out_path}")
+        return
+
+    for row, user_idx in enumerate(user_indices):
         user_title = titles[user_idx]
         
-        # Calculate cosine similarity with all other playlists
-        cosine_sim = cosine_similarity(user_vector, tfidf_matrix).flatten()
-        
-        # Sort by similarity score (descending)
-        # We want to exclude the user playlist itself
-        related_indices = cosine_sim.argsort()[::-1]
-        
         print(f"\nRecommendations for User Playlist: '{user_title}'")
         print("-" * 50)
         
-        count = 0
-        for idx in related_indices:
-            if idx == user_idx:
-                continue
-            
-            # Recommendation must be EMS (Platform)
-            if types[idx] != 'EMS':
-                continue
-                
-            score = cosine_sim[idx]
-            print(f"Rank {count+1}: '{titles[idx]}' (Score: {score:.4f})")
+        for rank, (score, col) in enumerate(zip(scores[row], cols[row]), 1):
+            idx = ems_indices[col]
+            print(f"Rank {rank}: '{titles[idx]}' (Score: {score:.4f})")
             
             # Show top 3 tracks to verify 'vibe'
-            top_tracks = playlists[idx]['tracks'][:3]
+            top_tracks = playlists.track_records(idx, limit=3)
             track_strs = [f"{t['title']} - {t['artist']}" for t in top_tracks]
             print(f"   Top Tracks: {', '.join(track_strs)}...")
-            
-            count += 1
-            if count >= 5:
-                break
+
+def main():
+    parser = argparse.ArgumentParser(description='TF-IDF playlist recommendations (PMS -> EMS)')
+    parser.add_argument('--out', help='Write a CSV table (pms_playlist_id, rank, ems_playlist_id, score) instead of printing')
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--hashed', action='store_true',
+                        help='Incrementally updated hashed TF-IDF instead of refitting TfidfVectorizer')
+    args = parser.parse_args()
+    train_model(args.out, args.top_k, args.hashed)
 
 if __name__ == "__main__":
-    train_model()
+    main()
@@ -1,109 +1,102 @@
 
-import json
-import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler, normalize
+import argparse
 import sys
 import os
 
+from feature_pipeline import load_or_fit
+from playlist_corpus import load_corpus
+from text_features import hashed_tfidf
+from ml.ranking import block_top_k
+
+ALPHA = 0.5  # Text weight (features get 1 - ALPHA)
+TOP_K = 3
+
 def load_data(filepath):
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_corpus(filepath)
     except FileNotFoundError:
         print(f"Error: {filepath} not found.")
         sys.exit(1)
 
-def train_model():
+def hybrid_topk(text_matrix, feature_matrix, query_idx, target_idx, k, alpha=ALPHA):
+    """Hybrid similarity of query rows against target rows only, computed block by block.
+
+    Both matrices must be L2-normalized so a dot product is the cosine similarity.
+    Only a running top-k per query is kept (O(Q*k) memory instead of O(N^2)).
+    Returns (scores, targets), each (Q, k) sorted by descending score; targets are
+    positions into target_idx, padded with -1 when there are fewer than k targets.
+    """
+    q_text, t_text = text_matrix[query_idx], text_matrix[target_idx]
+    q_feat, t_feat = feature_matrix[query_idx], feature_matrix[target_idx]
+
+    def score_block(q0, q1, t0, t1):
+        # Sparse TF-IDF product; only this (chunk x block) slab is ever dense
+        block = alpha * (q_text[q0:q1] @ t_text[t0:t1].T).toarray()
+        return block + (1 - alpha) * (q_feat[q0:q1] @ t_feat[t0:t1].T)
+
+    return block_top_k(score_block, len(query_idx), len(target_idx), k)
+
+def train_model(hashed=False):
     print("Loading data...")
     data_path = os.path.join(os.path.dirname(__file__), 'training_data_v3.json')
     playlists = load_data(data_path)
 
-    if not playlists:
+    if not len(playlists):
         return
 
-    # 1. Prepare Text Data (TF-IDF)
-    documents = []
-    
-    # 2. Prepare Feature Data (Audio Features)
+    # 1. Prepare Feature Data (Audio Features)
     # We will average the features of all tracks in a playlist to get a "Playlist Vibe"
-    feature_vectors = []
-    
-    ids = []
-    types = []
-    titles = []
-
+    # (per-track features are stored as a float32 (tracks, 6) array; empty playlists -> zeros)
     print("Processing playlist features...")
+    feature_vectors = playlists.feature_means()
     
-    for p in playlists:
-        # Text
-        playlist_text = " ".join([t['name_text'] for t in p['tracks']])
-        documents.append(playlist_text)
-        
-        # Features (Average)
-        if p['tracks']:
-            feats = [
-                [
-                    t['features']['tempo'],
-                    t['features']['energy'],
-                    t['features']['valence'],
-                    t['features']['danceability'],
-                    t['features']['acousticness'],
-                    t['features']['instrumentalness']
-                ] 
-                for t in p['tracks']
-            ]
-            # Average columns
-            avg_feats = np.mean(feats, axis=0)
-            feature_vectors.append(avg_feats)
-        else:
-            feature_vectors.append([0, 0, 0, 0, 0, 0]) # Empty playlist
-
-        ids.append(p['playlist_id'])
-        types.append(p['type'])
-        titles.append(p['title'])
-
-    # 3. Vectorize Text
+    ids = playlists.playlist_ids
+    types = playlists.types()
+    titles = playlists.titles.tolist()
+
+    # 2. Vectorize Text (TF-IDF)
     print("Vectorizing text...")
-    tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = tfidf.fit_transform(documents)
+    if hashed:
+        # Hashed term counts + stored document frequencies; only new/changed playlists are tokenized
+        tfidf_matrix, stats = hashed_tfidf(playlists, data_path)
+        print(f"   ({stats['vectorized']} vectorized, {stats['reused']} reused)")
+    else:
+        # Fitted vectorizer + matrix are reused while the documents are unchanged
+        documents = list(playlists.documents())
+        tfidf, _ = load_or_fit('v3_text_tfidf', documents,
+                               lambda: TfidfVectorizer(stop_words='english', max_features=5000))
+        tfidf_matrix = tfidf.matrix
 
-    # 4. Normalize Features
+    # 3. Normalize Features (fitted scaler + scaled matrix are shared with v4)
     print("Normalizing audio features...")
-    scaler = MinMaxScaler()
-    feature_matrix = scaler.fit_transform(feature_vectors)
+    scaler, cached = load_or_fit('playlist_features_minmax', feature_vectors, MinMaxScaler)
+    feature_matrix = scaler.matrix
+    if cached:
+        print("   (loaded fitted scaler)")
 
-    # 5. Combine Matrices (Hybrid)
-    # Weight: Text(0.5) + Features(0.5) - Can be tuned
-    # Note: We compute similarity matrices separately and blend them
-    print("Calculating similarity matrices...")
-    
-    text_sim = cosine_similarity(tfidf_matrix)
-    feat_sim = cosine_similarity(feature_matrix)
-    
-    # Hybrid Similarity
-    alpha = 0.5
-    hybrid_sim = (alpha * text_sim) + ((1 - alpha) * feat_sim)
-    
-    # 6. Generate Recommendations
+    # 4. Hybrid Similarity (PMS x EMS block only)
+    # Weight: Text(ALPHA) + Features(1 - ALPHA) - Can be tuned
+    # TF-IDF rows are already L2-normalized (sparse); feature rows are normalized so dot = cosine
     user_indices = [i for i, t in enumerate(types) if t == 'PMS']
-    
+    ems_indices = [i for i, t in enumerate(types) if t == 'EMS']
+
     if not user_indices:
         print("No User playlists found.")
         return
 
+    print("Calculating PMS x EMS similarities...")
+    top_scores, top_targets = hybrid_topk(
+        tfidf_matrix.tocsr(), normalize(feature_matrix), user_indices, ems_indices, TOP_K
+    )
+
+    # 5. Generate Recommendations
     print(f"\nFound {len(user_indices)} User playlists. Generating Hybrid Recommendations...")
 
-    for user_idx in user_indices:
+    for row, user_idx in enumerate(user_indices):
         user_title = titles[user_idx]
-        
-        # Get scores for this user
-        scores = hybrid_sim[user_idx]
-        
-        # Sort
-        related_indices = scores.argsort()[::-1]
-        
+
         print(f"\nRecommendations for User Playlist: '{user_title}'")
         print("-" * 50)
         
@@ -111,14 +104,11 @@ def train_model():
         print(f"   [User Vibe] Tempo: {avg_user_feats[0]:.1f}, Energy: {avg_user_feats[1]:.2f}, Valence: {avg_user_feats[2]:.2f}")
         
         count = 0
-        for idx in related_indices:
-            if idx == user_idx:
-                continue
-            
-            if types[idx] != 'EMS':
-                continue
-                
-            score = scores[idx]
+        for score, target in zip(top_scores[row], top_targets[row]):
+            if target < 0:
+                break
+            idx = ems_indices[target]
+
             print(f"Rank {count+1}: '{titles[idx]}' (Score: {score:.4f})")
             
             # Show vibe comparison
@@ -126,8 +116,13 @@ def train_model():
             print(f"   [Vibe] Tempo: {f[0]:.1f}, Energy: {f[1]:.2f}, Valence: {f[2]:.2f}")
             
             count += 1
-            if count >= 3:
-                break
+
+def main():
+    parser = argparse.ArgumentParser(description='Hybrid (text + audio feature) playlist recommendations')
+    parser.add_argument('--hashed', action='store_true',
+                        help='Incrementally updated hashed TF-IDF instead of refitting TfidfVectorizer')
+    args = parser.parse_args()
+    train_model(args.hashed)
 
 if __name__ == "__main__":
-    train_model()
+    main()
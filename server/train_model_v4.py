@@ -1,15 +1,17 @@
 
-import json
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler, normalize
 import sys
 import os
 
+from feature_pipeline import load_or_fit
+from playlist_corpus import load_corpus
+from ml.ranking import block_top_k
+
+TOP_K = 3
+
 def load_data(filepath):
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_corpus(filepath)
     except FileNotFoundError:
         print(f"Error: {filepath} not found.")
         sys.exit(1)
@@ -19,71 +21,50 @@ def train_model():
     data_path = os.path.join(os.path.dirname(__file__), 'training_data_v3.json')
     playlists = load_data(data_path)
 
-    if not playlists:
+    if not len(playlists):
         return
 
     # Extract Features Only (Ignore Text)
-    feature_vectors = []
-    
-    ids = []
-    types = []
-    titles = []
-
+    # Average of per-track features for each playlist (empty playlists -> zeros)
     print("Processing playlist features...")
+    feature_vectors = playlists.feature_means()
     
-    for p in playlists:
-        # Features (Average)
-        if p['tracks']:
-            feats = [
-                [
-                    t['features']['tempo'],
-                    t['features']['energy'],
-                    t['features']['valence'],
-                    t['features']['danceability'],
-                    t['features']['acousticness'],
-                    t['features']['instrumentalness']
-                ] 
-                for t in p['tracks']
-            ]
-            # Average columns
-            avg_feats = np.mean(feats, axis=0)
-            feature_vectors.append(avg_feats)
-        else:
-            feature_vectors.append([0, 0, 0, 0, 0, 0]) # Empty playlist
-
-        ids.append(p['playlist_id'])
-        types.append(p['type'])
-        titles.append(p['title'])
+    ids = playlists.playlist_ids
+    types = playlists.types()
+    titles = playlists.titles.tolist()
 
     # Normalize Features
     # Since we rely 100% on features, normalization is critical
+    # (fitted scaler + scaled matrix are stored, keyed by the feature content; shared with v3)
     print("Normalizing audio features...")
-    scaler = MinMaxScaler()
-    feature_matrix = scaler.fit_transform(feature_vectors)
+    scaler, cached = load_or_fit('playlist_features_minmax', feature_vectors, MinMaxScaler)
+    feature_matrix = scaler.matrix
+    if cached:
+        print("   (loaded fitted scaler)")
 
     # Calculate Similarity (Cosine)
-    # Pure Feature Match
-    print("Calculating feature similarity...")
-    feat_sim = cosine_similarity(feature_matrix)
-    
-    # Generate Recommendations
+    # Pure Feature Match, PMS rows against EMS columns only (rows normalized so dot = cosine)
     user_indices = [i for i, t in enumerate(types) if t == 'PMS']
+    ems_indices = [i for i, t in enumerate(types) if t == 'EMS']
     
     if not user_indices:
         print("No User playlists found.")
         return
 
+    print("Calculating feature similarity...")
+    unit_features = normalize(feature_matrix)
+    user_feats, ems_feats = unit_features[user_indices], unit_features[ems_indices]
+    top_scores, top_targets = block_top_k(
+        lambda q0, q1, t0, t1: user_feats[q0:q1] @ ems_feats[t0:t1].T,
+        len(user_indices), len(ems_indices), TOP_K
+    )
+    
+    # Generate Recommendations
     print(f"\nFound {len(user_indices)} User playlists. Generating Feature-Based Recommendations...")
 
-    for user_idx in user_indices:
+    for row, user_idx in enumerate(user_indices):
         user_title = titles[user_idx]
         
-        # Get scores for this user
-        scores = feat_sim[user_idx]
-        
-        # Sort
-        related_indices = scores.argsort()[::-1]
-        
         print(f"\nRecommendations for User Playlist: '{user_title}'")
         print("-" * 50)
         
@@ -91,14 +72,10 @@ def train_model():
         print(f"   [User Vibe] Tempo: {avg_user_feats[0]:.1f}, Energy: {avg_user_feats[1]:.2f}, Valence: {avg_user_feats[2]:.2f}")
         
         count = 0
-        for idx in related_indices:
-            if idx == user_idx:
-                continue
-            
-            if types[idx] != 'EMS':
-                continue
-                
-            score = scores[idx]
+        for score, target in zip(top_scores[row], top_targets[row]):
+            if target < 0:
+                break
+            idx = ems_indices[target]
             
             # Show top results
             print(f"Rank {count+1}: '{titles[idx]}' (Score: {score:.4f})")
@@ -108,8 +85,6 @@ def train_model():
             print(f"   [Vibe] Tempo: {f[0]:.1f}, Energy: {f[1]:.2f}, Valence: {f[2]:.2f}")
             
             count += 1
-            if count >= 3:
-                break
 
 if __name__ == "__main__":
     train_model()